@@ -1,30 +1,191 @@
 """
 MongoDB-based Authentication Service
 Handles user signup, login, and password management
+bcrypt runs in a dedicated, bounded thread pool (the bcrypt extension releases
+the GIL while hashing), so a login burst never blocks the event loop. When more
+hashes are pending than the queue allows, callers get AuthOverloaded instead of
+waiting behind an ever-growing backlog.
+Authenticated requests resolve their user through a small TTL + LRU cache of
+token -> user id and user id -> user entries, so most calls skip both the JWT
+decode and the users read.
 """
 
+import os
+import time
 import uuid
+import asyncio
 import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 from passlib.context import CryptContext
-from typing import Optional
+from typing import Dict, Optional, Set
 
 logger = logging.getLogger(__name__)
 
 # Password hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+AUTH_HASH_WORKERS = int(os.environ.get('AUTH_HASH_WORKERS', str(min(4, os.cpu_count() or 1))))
+# Hashes allowed to wait for a worker; at ~100-250ms each, 16 per worker is already a 2-4s backlog
+AUTH_HASH_QUEUE_LIMIT = int(os.environ.get('AUTH_HASH_QUEUE_LIMIT', str(16 * AUTH_HASH_WORKERS)))
+
+
+# Upper bound on how stale a cached user can be when a write path did not invalidate it
+AUTH_CACHE_TTL = float(os.environ.get('AUTH_CACHE_TTL', '30'))
+AUTH_CACHE_MAX_ENTRIES = int(os.environ.get('AUTH_CACHE_MAX_ENTRIES', '10000'))
+
+
+class AuthOverloaded(Exception):
+    """Raised when the password hashing queue is full; the request should be retried later"""
+
+
+class AuthUserCache:
+    """Per-worker TTL + LRU cache of verified tokens and the users they resolve to"""
+
+    def __init__(self, ttl: float = AUTH_CACHE_TTL, max_entries: int = AUTH_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # token -> (user id, monotonic expiry); expiry never outlives the JWT's own exp
+        self._tokens: "OrderedDict[str, tuple]" = OrderedDict()
+        # user id -> (user, monotonic expiry)
+        self._users: "OrderedDict[str, tuple]" = OrderedDict()
+        self._tokens_by_user: Dict[str, Set[str]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get_token(self, token: str) -> Optional[str]:
+        entry = self._tokens.get(token)
+        if entry is None:
+            return None
+        if entry[1] < time.monotonic():
+            self._drop_token(token)
+            return None
+        self._tokens.move_to_end(token)
+        return entry[0]
+
+    def put_token(self, token: str, user_id: str, token_expires_at: Optional[float] = None):
+        """Remember a verified token; `token_expires_at` is the JWT exp (epoch seconds)"""
+        expires = time.monotonic() + self.ttl
+        if token_expires_at is not None:
+            expires = min(expires, time.monotonic() + token_expires_at - time.time())
+        self._drop_token(token)
+        self._tokens[token] = (user_id, expires)
+        self._tokens_by_user.setdefault(user_id, set()).add(token)
+        while len(self._tokens) > self.max_entries:
+            self._drop_token(next(iter(self._tokens)))
+            self.evictions += 1
+
+    def get_user(self, user_id: str) -> Optional[dict]:
+        entry = self._users.get(user_id)
+        if entry is None or entry[1] < time.monotonic():
+            self._users.pop(user_id, None)
+            self.misses += 1
+            return None
+        self._users.move_to_end(user_id)
+        self.hits += 1
+        # Shallow copy: callers commonly add or pop keys on the user they get
+        return dict(entry[0])
+
+    def put_user(self, user_id: str, user: dict):
+        self._users[user_id] = (dict(user), time.monotonic() + self.ttl)
+        self._users.move_to_end(user_id)
+        while len(self._users) > self.max_entries:
+            self._users.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate_user(self, user_id: str):
+        """Forget a user's cached document (after it was modified)"""
+        if self._users.pop(user_id, None) is not None:
+            self.invalidations += 1
+
+    def revoke_tokens(self, user_id: str):
+        """Forget a user's document and every token seen for them (logout, password change)"""
+        self.invalidate_user(user_id)
+        for token in list(self._tokens_by_user.get(user_id, ())):
+            self._drop_token(token)
+
+    def _drop_token(self, token: str):
+        entry = self._tokens.pop(token, None)
+        if entry is not None:
+            tokens = self._tokens_by_user.get(entry[0])
+            if tokens is not None:
+                tokens.discard(token)
+                if not tokens:
+                    del self._tokens_by_user[entry[0]]
+
+    def metrics(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "tokens": len(self._tokens),
+            "users": len(self._users),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
 class AuthService:
-    def __init__(self, db):
+    def __init__(self, db, workers: int = AUTH_HASH_WORKERS, queue_limit: int = AUTH_HASH_QUEUE_LIMIT):
         self.db = db
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self._pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self._wait_total = 0.0
+        self._max_wait = 0.0
+        self.user_cache = AuthUserCache()
     
-    def hash_password(self, password: str) -> str:
+    async def _run_bcrypt(self, fn, *args):
+        if self._pending >= self.workers + self.queue_limit:
+            self.rejected += 1
+            raise AuthOverloaded("Too many concurrent authentication requests")
+        self._pending += 1
+        submitted = time.perf_counter()
+        
+        def timed():
+            # Time spent queued for a worker, recorded back on the loop thread
+            return time.perf_counter() - submitted, fn(*args)
+        
+        try:
+            wait, result = await asyncio.get_running_loop().run_in_executor(self._executor, timed)
+        finally:
+            self._pending -= 1
+        self.completed += 1
+        self._wait_total += wait
+        self._max_wait = max(self._max_wait, wait)
+        return result
+    
+    async def hash_password(self, password: str) -> str:
         """Hash a password using bcrypt"""
-        return pwd_context.hash(password)
+        return await self._run_bcrypt(pwd_context.hash, password)
     
-    def verify_password(self, plain_password: str, hashed_password: str) -> bool:
+    async def verify_password(self, plain_password: str, hashed_password: str) -> bool:
         """Verify a password against its hash"""
-        return pwd_context.verify(plain_password, hashed_password)
+        if not hashed_password:
+            return False
+        return await self._run_bcrypt(pwd_context.verify, plain_password, hashed_password)
+    
+    def metrics(self) -> dict:
+        return {
+            "workers": self.workers,
+            "inFlight": min(self._pending, self.workers),
+            "queueDepth": max(0, self._pending - self.workers),
+            "queueLimit": self.queue_limit,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avgWaitMs": round(self._wait_total / self.completed * 1000, 1) if self.completed else 0.0,
+            "maxWaitMs": round(self._max_wait * 1000, 1),
+        }
+    
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
     
     async def create_user(self, email: str, password: str, name: str, handle: str = None) -> dict:
         """Create a new user account"""
@@ -51,7 +212,7 @@ class AuthService:
                 counter += 1
         
         # Hash password
-        hashed_password = self.hash_password(password)
+        hashed_password = await self.hash_password(password)
         
         # Create user document
         user = {
@@ -93,21 +254,21 @@ class AuthService:
             return None
         
         # Verify password
-        if not self.verify_password(password, user.get('password', '')):
+        if not await self.verify_password(password, user.get('password', '')):
             logger.warning(f"❌ Login failed: Invalid password - {email}")
             return None
         
-        # Update last login and online status
+        # Update last login (online status comes from socket presence)
         await self.db.users.update_one(
             {"id": user["id"]},
             {
                 "$set": {
-                    "online": True,
                     "lastLogin": datetime.now(timezone.utc).isoformat(),
                     "updatedAt": datetime.now(timezone.utc).isoformat()
                 }
             }
         )
+        self.user_cache.invalidate_user(user["id"])
         
         logger.info(f"✅ User authenticated: {email} (ID: {user['id']})")
         
@@ -121,6 +282,15 @@ class AuthService:
         user = await self.db.users.find_one({"id": user_id}, {"_id": 0, "password": 0})
         return user
     
+    async def get_cached_user(self, user_id: str) -> Optional[dict]:
+        """get_user_by_id through the user cache"""
+        user = self.user_cache.get_user(user_id)
+        if user is None:
+            user = await self.get_user_by_id(user_id)
+            if user is not None:
+                self.user_cache.put_user(user_id, user)
+        return user
+    
     async def get_user_by_email(self, email: str) -> Optional[dict]:
         """Get user by email"""
         user = await self.db.users.find_one({"email": email.lower()}, {"_id": 0, "password": 0})
@@ -133,16 +303,17 @@ class AuthService:
             return False
         
         # Verify old password
-        if not self.verify_password(old_password, user.get('password', '')):
+        if not await self.verify_password(old_password, user.get('password', '')):
             return False
         
         # Hash and update new password
-        hashed_password = self.hash_password(new_password)
+        hashed_password = await self.hash_password(new_password)
         await self.db.users.update_one(
             {"id": user_id},
             {"$set": {"password": hashed_password, "updatedAt": datetime.now(timezone.utc).isoformat()}}
         )
         
+        self.user_cache.revoke_tokens(user_id)
         logger.info(f"✅ Password updated for user: {user_id}")
         return True
     
@@ -153,18 +324,12 @@ class AuthService:
             return False
         
         # Hash and update password
-        hashed_password = self.hash_password(new_password)
+        hashed_password = await self.hash_password(new_password)
         await self.db.users.update_one(
             {"id": user["id"]},
             {"$set": {"password": hashed_password, "updatedAt": datetime.now(timezone.utc).isoformat()}}
         )
         
+        self.user_cache.revoke_tokens(user["id"])
         logger.info(f"✅ Password reset for user: {email}")
         return True
-    
-    async def set_user_offline(self, user_id: str):
-        """Set user as offline"""
-        await self.db.users.update_one(
-            {"id": user_id},
-            {"$set": {"online": False, "updatedAt": datetime.now(timezone.utc).isoformat()}}
-        )
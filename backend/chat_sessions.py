@@ -0,0 +1,80 @@
+"""
+Chat Sessions - LLM conversations that survive a request landing on another worker
+The transcript (last N turns) lives in shared state; each worker keeps its own
+LlmChat objects only as a cache. When a worker's copy has fallen behind (the
+previous turn was served elsewhere, or it never saw this session) it builds a
+fresh chat with the shared transcript folded into the system message.
+"""
+
+import os
+import logging
+from collections import OrderedDict
+from typing import Any, Callable, Tuple
+
+from realtime_backend import SharedNamespace
+
+logger = logging.getLogger(__name__)
+
+LLM_SESSION_TURNS = int(os.environ.get('LLM_SESSION_TURNS', '20'))
+LLM_SESSION_TTL = int(os.environ.get('LLM_SESSION_TTL', str(6 * 3600)))
+LLM_SESSION_LOCAL_MAX = int(os.environ.get('LLM_SESSION_LOCAL_MAX', '1000'))
+
+
+def with_history(system_message: str, history: list) -> str:
+    """System message carrying earlier turns of the conversation"""
+    if not history:
+        return system_message
+    lines = [f"User: {prompt}\nAssistant: {reply}" for prompt, reply in history]
+    return f"{system_message}\n\nConversation so far:\n" + "\n\n".join(lines)
+
+
+class SharedChatSessions:
+    def __init__(
+        self,
+        state: SharedNamespace,
+        max_turns: int = LLM_SESSION_TURNS,
+        ttl: int = LLM_SESSION_TTL,
+        max_local: int = LLM_SESSION_LOCAL_MAX,
+    ):
+        self.state = state
+        self.max_turns = max_turns
+        self.ttl = ttl
+        self.max_local = max_local
+        # session id -> (chat object, turn count it has seen), least recently used first
+        self._local: "OrderedDict[str, Tuple[Any, int]]" = OrderedDict()
+        self.local_hits = 0
+        self.rebuilds = 0
+
+    async def send(self, session_id: str, prompt: str, new_chat: Callable[[list], Any], make_message: Callable[[str], Any]) -> str:
+        """Send one turn; `new_chat(history)` builds an LlmChat (see with_history) when needed"""
+        session = await self.state.get(session_id) or {"turns": 0, "history": []}
+        local = self._local.get(session_id)
+        if local is not None and local[1] == session["turns"]:
+            chat = local[0]
+            self._local.move_to_end(session_id)
+            self.local_hits += 1
+        else:
+            chat = new_chat(session["history"])
+            if session["turns"]:
+                self.rebuilds += 1
+
+        response = await chat.send_message(make_message(prompt))
+
+        session["turns"] += 1
+        session["history"] = (session["history"] + [[prompt, response]])[-self.max_turns:]
+        await self.state.set(session_id, session, ttl=self.ttl)
+        self._local[session_id] = (chat, session["turns"])
+        self._local.move_to_end(session_id)
+        while len(self._local) > self.max_local:
+            self._local.popitem(last=False)
+        return response
+
+    async def exists(self, session_id: str) -> bool:
+        return session_id in self._local or await self.state.get(session_id) is not None
+
+    async def delete(self, session_id: str) -> bool:
+        local = self._local.pop(session_id, None)
+        return await self.state.delete(session_id) or local is not None
+
+    def metrics(self) -> dict:
+        return {"local": len(self._local), "localHits": self.local_hits, "rebuilds": self.rebuilds}
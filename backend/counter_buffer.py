@@ -0,0 +1,119 @@
+"""
+Write-behind Counter Buffer - coalesces high-frequency $inc updates
+Increments are accumulated in memory per (collection, document id) and written
+with one unordered bulk_write per collection, either on a timer or once enough
+distinct documents are pending. Used for reel views; any hot counter can share it.
+"""
+
+import os
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+from pymongo import UpdateOne
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+logger = logging.getLogger(__name__)
+
+COUNTER_FLUSH_INTERVAL = float(os.environ.get('COUNTER_FLUSH_INTERVAL', '2.0'))
+COUNTER_FLUSH_MAX_KEYS = int(os.environ.get('COUNTER_FLUSH_MAX_KEYS', '500'))
+
+
+class CounterBuffer:
+    def __init__(self, db: AsyncIOMotorDatabase, flush_interval: float = COUNTER_FLUSH_INTERVAL,
+                 max_pending_keys: int = COUNTER_FLUSH_MAX_KEYS):
+        self.db = db
+        self.flush_interval = flush_interval
+        self.max_pending_keys = max_pending_keys
+        # {(collection, doc_id): {field: delta}}
+        self._pending: Dict[Tuple[str, str], Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        # Early flush started by increment(); at most one at a time
+        self._flush_task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self.flushes = 0
+        self.flushed_deltas = 0
+        self.flush_errors = 0
+        self.last_flush_at: Optional[str] = None
+
+    def increment(self, collection: str, doc_id: str, field: str, amount: int = 1):
+        """Record an increment of `field` on the document with `id` == doc_id"""
+        self._pending[(collection, doc_id)][field] += amount
+        if len(self._pending) >= self.max_pending_keys and not self._flush_lock.locked() \
+                and (self._flush_task is None or self._flush_task.done()):
+            self._flush_task = asyncio.get_running_loop().create_task(self.flush())
+
+    def pending_delta(self) -> int:
+        """Sum of all increments not yet written to MongoDB"""
+        return sum(sum(fields.values()) for fields in self._pending.values())
+
+    async def flush(self):
+        """Write every pending increment. Failed batches are merged back for the next flush."""
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            pending, self._pending = self._pending, defaultdict(lambda: defaultdict(int))
+
+            by_collection: Dict[str, list] = defaultdict(list)
+            for (collection, doc_id), fields in pending.items():
+                increments = {field: delta for field, delta in fields.items() if delta}
+                if increments:
+                    by_collection[collection].append((doc_id, increments))
+
+            for collection, updates in by_collection.items():
+                try:
+                    await self.db[collection].bulk_write(
+                        [UpdateOne({"id": doc_id}, {"$inc": increments}) for doc_id, increments in updates],
+                        ordered=False
+                    )
+                    self.flushed_deltas += sum(sum(inc.values()) for _, inc in updates)
+                except Exception as e:
+                    self.flush_errors += 1
+                    logger.error(f"Counter flush to {collection} failed, retrying next interval: {e}")
+                    for doc_id, increments in updates:
+                        for field, delta in increments.items():
+                            self._pending[(collection, doc_id)][field] += delta
+
+            self.flushes += 1
+            self.last_flush_at = datetime.now(timezone.utc).isoformat()
+
+    async def _run(self):
+        while not self._stopping:
+            await asyncio.sleep(self.flush_interval)
+            # Shielded so stop() cannot cancel a batch that was already taken off the buffer
+            await asyncio.shield(self.flush())
+
+    def start(self):
+        """Start the periodic flush loop (call from an app startup hook)"""
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Stop the flush loop and write everything still buffered"""
+        self._stopping = True
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._flush_task is not None:
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+            self._flush_task = None
+        await self.flush()
+        if self._pending:
+            logger.warning(f"Counter buffer stopped with {self.pending_delta()} unflushed increments")
+
+    def metrics(self) -> dict:
+        return {
+            "pendingKeys": len(self._pending),
+            "pendingDelta": self.pending_delta(),
+            "flushes": self.flushes,
+            "flushedDelta": self.flushed_deltas,
+            "flushErrors": self.flush_errors,
+            "lastFlushAt": self.last_flush_at,
+        }
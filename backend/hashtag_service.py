@@ -0,0 +1,143 @@
+"""
+Hashtag Service - write-time hashtag extraction and trending counters
+Hashtags are parsed once when a post is written and stored normalized in the
+post's indexed `hashtags` array. Usage is counted in hourly bucket documents
+(hashtag_trends), so trending is the sum of the last 24 small documents.
+"""
+
+import re
+import logging
+from datetime import datetime, timezone, timedelta
+from typing import Iterable, List
+from pymongo import UpdateOne
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+logger = logging.getLogger(__name__)
+
+HASHTAG_PATTERN = re.compile(r"#(\w+)", re.UNICODE)
+TRENDING_WINDOW_HOURS = 24
+BUCKET_FORMAT = "%Y-%m-%dT%H"
+# Bump to re-run the post hashtag backfill once on the next startup
+HASHTAG_BACKFILL_VERSION = 1
+
+
+def normalize_hashtag(tag: str) -> str:
+    """Canonical stored form: no leading '#', lowercase"""
+    return tag.strip().lstrip("#").lower()
+
+
+def extract_hashtags(text: str, extra: Iterable[str] = ()) -> List[str]:
+    """Unique normalized hashtags from post text plus any explicitly supplied tags"""
+    tags = []
+    for tag in list(HASHTAG_PATTERN.findall(text or "")) + list(extra or []):
+        tag = normalize_hashtag(tag)
+        if tag and tag not in tags:
+            tags.append(tag)
+    return tags
+
+
+class HashtagService:
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self.db = db
+
+    async def ensure_indexes(self):
+        await self.db.posts.create_index([("hashtags", 1), ("createdAt", -1), ("id", -1)])
+        await self.db.hashtag_trends.create_index("bucket", unique=True)
+        await self.db.hashtag_trends.create_index("expiresAt", expireAfterSeconds=0)
+
+    async def record_usage(self, tags: List[str], at: datetime = None):
+        """Count one use of each tag in the current hourly bucket"""
+        if not tags:
+            return
+        at = at or datetime.now(timezone.utc)
+        bucket_start = at.replace(minute=0, second=0, microsecond=0)
+        try:
+            await self.db.hashtag_trends.update_one(
+                {"bucket": bucket_start.strftime(BUCKET_FORMAT)},
+                {
+                    "$inc": {f"counts.{tag}": 1 for tag in tags},
+                    "$setOnInsert": {"expiresAt": bucket_start + timedelta(hours=TRENDING_WINDOW_HOURS + 1)}
+                },
+                upsert=True
+            )
+        except Exception as e:
+            logger.error(f"Failed to record hashtag usage: {e}")
+
+    async def trending(self, limit: int = 10, hours: int = TRENDING_WINDOW_HOURS) -> List[tuple]:
+        """[(tag, count)] summed over the last `hours` hourly buckets, most used first"""
+        since = (datetime.now(timezone.utc) - timedelta(hours=hours - 1)).strftime(BUCKET_FORMAT)
+        buckets = await self.db.hashtag_trends.find(
+            {"bucket": {"$gte": since}}, {"_id": 0, "counts": 1}
+        ).to_list(hours)
+        totals = {}
+        for bucket in buckets:
+            for tag, count in bucket.get("counts", {}).items():
+                totals[tag] = totals.get(tag, 0) + count
+        return sorted(totals.items(), key=lambda item: item[1], reverse=True)[:limit]
+
+    async def backfill_trends(self):
+        """Rebuild the hourly buckets from the last day of posts when there are none yet.
+
+        Runs on upgrade (before any usage was counted) and after a quiet spell
+        long enough for every bucket to expire. Buckets are $set rather than
+        incremented, so workers starting together cannot double count.
+        """
+        if await self.db.hashtag_trends.find_one({}, {"_id": 1}) is not None:
+            return
+        now = datetime.now(timezone.utc)
+        since = (now - timedelta(hours=TRENDING_WINDOW_HOURS)).replace(minute=0, second=0, microsecond=0)
+        buckets = {}
+        async for post in self.db.posts.find(
+            {"createdAt": {"$gte": since.isoformat()}, "hashtags": {"$exists": True, "$ne": []}},
+            {"_id": 0, "hashtags": 1, "createdAt": 1}
+        ):
+            try:
+                created = datetime.fromisoformat(post["createdAt"])
+            except (TypeError, ValueError):
+                continue
+            if created.tzinfo is None:
+                created = created.replace(tzinfo=timezone.utc)
+            bucket_start = created.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+            counts = buckets.setdefault(bucket_start, {})
+            for tag in set(post.get("hashtags") or []):
+                counts[tag] = counts.get(tag, 0) + 1
+        for bucket_start, counts in buckets.items():
+            await self.db.hashtag_trends.update_one(
+                {"bucket": bucket_start.strftime(BUCKET_FORMAT)},
+                {
+                    "$set": {"counts": counts},
+                    "$setOnInsert": {"expiresAt": bucket_start + timedelta(hours=TRENDING_WINDOW_HOURS + 1)}
+                },
+                upsert=True
+            )
+        if buckets:
+            logger.info(f"Backfilled {len(buckets)} hourly hashtag buckets")
+
+    async def backfill_posts(self):
+        """Populate `hashtags` on posts written before extraction happened at write time.
+
+        A one-time migration: runs once per HASHTAG_BACKFILL_VERSION, not on every startup.
+        """
+        meta = await self.db.hashtag_meta.find_one({"_id": "backfill"})
+        if meta and meta.get("version") == HASHTAG_BACKFILL_VERSION:
+            return
+        updated = 0
+        batch = []
+        async for post in self.db.posts.find(
+            {"$or": [{"hashtags": None}, {"hashtags": {"$size": 0}}], "text": {"$regex": r"#\w"}},
+            {"_id": 0, "id": 1, "text": 1}
+        ):
+            tags = extract_hashtags(post.get("text", ""))
+            if tags:
+                batch.append(UpdateOne({"id": post["id"]}, {"$set": {"hashtags": tags}}))
+                updated += 1
+            if len(batch) >= 1000:
+                await self.db.posts.bulk_write(batch, ordered=False)
+                batch = []
+        if batch:
+            await self.db.posts.bulk_write(batch, ordered=False)
+        await self.db.hashtag_meta.update_one(
+            {"_id": "backfill"}, {"$set": {"version": HASHTAG_BACKFILL_VERSION}}, upsert=True
+        )
+        if updated:
+            logger.info(f"Backfilled hashtags on {updated} posts")
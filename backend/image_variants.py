@@ -0,0 +1,156 @@
+"""
+Image Variants - resized, re-encoded renditions of uploaded images
+A fixed set of widths (thumb/medium/large) is rendered as WebP or JPEG in a
+process pool, so PIL's CPU work never runs on the event loop. Variants are
+stored in the media GridFS bucket under ids derived from the source content
+hash, which makes them shared by every alias of that content and reusable
+across restarts. Missing variants are generated on first request.
+"""
+
+import io
+import os
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional, Set
+from PIL import Image, ImageOps
+
+from media_store import MediaStore
+
+logger = logging.getLogger(__name__)
+
+VARIANT_SIZES = {"thumb": 160, "medium": 480, "large": 1080}
+# format -> (PIL encoder, served content type)
+VARIANT_FORMATS = {"webp": ("WEBP", "image/webp"), "jpeg": ("JPEG", "image/jpeg")}
+# Animated GIFs would lose their animation, so they are always served as uploaded
+RESIZABLE_TYPES = {"image/jpeg", "image/jpg", "image/png", "image/webp"}
+IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS', str(min(2, os.cpu_count() or 1))))
+
+
+def render_variant(data: bytes, width: int, fmt: str) -> bytes:
+    """Resize to at most `width` pixels wide (never upscaling) and re-encode. Runs in a worker process."""
+    encoder, _ = VARIANT_FORMATS[fmt]
+    with Image.open(io.BytesIO(data)) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.width > width:
+            image = image.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+        if encoder == "JPEG":
+            if image.mode in ("RGBA", "LA", "P"):
+                rgba = image.convert("RGBA")
+                image = Image.new("RGB", rgba.size, (255, 255, 255))
+                image.paste(rgba, mask=rgba.split()[-1])
+            elif image.mode != "RGB":
+                image = image.convert("RGB")
+        elif image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA")
+        output = io.BytesIO()
+        if encoder == "JPEG":
+            image.save(output, encoder, quality=82, optimize=True, progressive=True)
+        else:
+            image.save(output, encoder, quality=80, method=4)
+        return output.getvalue()
+
+
+class ImageVariantService:
+    def __init__(self, media_store: MediaStore, workers: int = IMAGE_WORKERS):
+        self.media_store = media_store
+        self.workers = workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+        # variant id -> in-flight generation, so concurrent requests render once
+        self._inflight: Dict[str, asyncio.Future] = {}
+        # Post-upload generate_all runs, kept referenced until they finish
+        self._background: Set[asyncio.Task] = set()
+        self.generated = 0
+        self.failures = 0
+
+    @staticmethod
+    def supports(media_doc: dict) -> bool:
+        return media_doc.get("content_type") in RESIZABLE_TYPES and bool(media_doc.get("blobId"))
+
+    @staticmethod
+    def variant_id(sha256: str, size: str, fmt: str) -> str:
+        return f"{sha256}.{size}.{fmt}"
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: forking a process that runs the event loop and driver threads is unsafe
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    async def open(self, media_doc: dict, size: str, fmt: str):
+        """GridOut for a variant, rendering and storing it first if needed"""
+        variant_id = self.variant_id(media_doc["sha256"], size, fmt)
+        grid_out = await self.media_store.open({"id": variant_id})
+        if grid_out is not None:
+            return grid_out
+        await self._ensure(media_doc, size, fmt, variant_id)
+        return await self.media_store.open({"id": variant_id})
+
+    async def _ensure(self, media_doc: dict, size: str, fmt: str, variant_id: str):
+        pending = self._inflight.get(variant_id)
+        if pending is None:
+            pending = asyncio.ensure_future(self._generate(media_doc, size, fmt, variant_id))
+            self._inflight[variant_id] = pending
+            pending.add_done_callback(lambda done: self._generated(variant_id, done))
+        await asyncio.shield(pending)
+
+    def _generated(self, variant_id: str, done: asyncio.Future):
+        self._inflight.pop(variant_id, None)
+        if not done.cancelled() and done.exception() is not None:
+            # Retrieved here so it is logged even if every waiter was cancelled
+            logger.warning(f"Rendering variant {variant_id} failed: {done.exception()}")
+
+    async def _generate(self, media_doc: dict, size: str, fmt: str, variant_id: str):
+        source = await self.media_store.open(media_doc)
+        if source is None:
+            raise FileNotFoundError(media_doc["id"])
+        data = await source.read()
+        try:
+            rendered = await asyncio.get_running_loop().run_in_executor(
+                self._executor(), render_variant, data, VARIANT_SIZES[size], fmt
+            )
+        except Exception:
+            self.failures += 1
+            raise
+        await self.media_store.store_variant(media_doc["sha256"], variant_id, rendered, VARIANT_FORMATS[fmt][1])
+        self.generated += 1
+
+    def schedule(self, media_doc: dict):
+        """Run generate_all in the background, keeping a reference until it finishes"""
+        task = asyncio.get_running_loop().create_task(self.generate_all(media_doc))
+        self._background.add(task)
+        task.add_done_callback(self._background_done)
+
+    def _background_done(self, task: asyncio.Task):
+        self._background.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Background variant generation failed: {task.exception()}")
+
+    async def generate_all(self, media_doc: dict):
+        """Render every size in WebP ahead of the first request (run after upload)"""
+        if not self.supports(media_doc):
+            return
+        for size in VARIANT_SIZES:
+            variant_id = self.variant_id(media_doc["sha256"], size, "webp")
+            try:
+                if await self.media_store.open({"id": variant_id}) is None:
+                    await self._ensure(media_doc, size, "webp", variant_id)
+            except Exception as e:
+                logger.error(f"Variant {variant_id} failed: {e}")
+                return
+
+    def shutdown(self):
+        for task in list(self._background):
+            task.cancel()
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def metrics(self) -> dict:
+        return {
+            "generated": self.generated,
+            "failures": self.failures,
+            "inFlight": len(self._inflight),
+            "background": len(self._background),
+        }
@@ -0,0 +1,274 @@
+"""
+Media Cache - byte-bounded LRU copy of hot media on local disk
+Sits in front of the GridFS media store. Files are named by content key (the
+SHA-256 of the original, or a variant id), so one copy serves every alias of
+the same bytes and the directory can be shared by all workers on a host. A
+small in-memory index maps the requested media id/size/format to its cached
+file together with the response metadata, so a hit needs neither the
+media_files record nor the GridFS chunks; it is an LRU bounded by entry count.
+Misses are copied in the background after the response, written to a temp
+file and renamed into place. The byte budget is for the whole directory: each
+worker periodically rescans it, so files written by other workers count
+against its budget too.
+"""
+
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from pathlib import Path
+from typing import AsyncIterator, Awaitable, Callable, Dict, NamedTuple, Optional, Tuple
+
+import anyio
+
+logger = logging.getLogger(__name__)
+
+MEDIA_CACHE_MB = float(os.environ.get('MEDIA_CACHE_MB', '512'))
+# Larger files (long videos) are always streamed from GridFS
+MEDIA_CACHE_MAX_OBJECT_MB = float(os.environ.get('MEDIA_CACHE_MAX_OBJECT_MB', '32'))
+# How long a worker trusts its index entry before re-reading media_files,
+# which bounds how long a deletion made through another worker goes unnoticed
+MEDIA_CACHE_META_TTL = float(os.environ.get('MEDIA_CACHE_META_TTL', '300'))
+MEDIA_CACHE_META_ENTRIES = int(os.environ.get('MEDIA_CACHE_META_ENTRIES', '100000'))
+MEDIA_CACHE_RESCAN_INTERVAL = float(os.environ.get('MEDIA_CACHE_RESCAN_INTERVAL', '60'))
+TEMP_SUFFIX = ".tmp"
+
+
+class CachedMedia(NamedTuple):
+    path: Path
+    stat_result: os.stat_result
+    etag: Optional[str]
+    content_type: str
+    filename: str
+
+
+class MediaDiskCache:
+    def __init__(
+        self,
+        root: Path,
+        max_bytes: int = int(MEDIA_CACHE_MB * 1024 * 1024),
+        max_object_bytes: int = int(MEDIA_CACHE_MAX_OBJECT_MB * 1024 * 1024),
+        meta_ttl: float = MEDIA_CACHE_META_TTL,
+        max_meta_entries: int = MEDIA_CACHE_META_ENTRIES,
+    ):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_object_bytes = max_object_bytes
+        self.meta_ttl = meta_ttl
+        self.max_meta_entries = max_meta_entries
+        # content key -> size in bytes, least recently used first
+        self._files: "OrderedDict[str, int]" = OrderedDict()
+        self._bytes = 0
+        # (file id, size, format) -> (content key, etag, content type, filename, expiry), least recently used first
+        self._meta: "OrderedDict[Tuple[str, Optional[str], Optional[str]], tuple]" = OrderedDict()
+        self._filling: Dict[str, asyncio.Task] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.fills = 0
+
+    def _path(self, key: str) -> Path:
+        return self.root / key
+
+    def _scan(self) -> Dict[str, Tuple[float, int]]:
+        """{content key: (mtime, size)} of the cached files currently on disk"""
+        files = {}
+        for path in self.root.iterdir():
+            if path.name.endswith(TEMP_SUFFIX) or not path.is_file():
+                continue
+            try:
+                stat_result = path.stat()
+            except FileNotFoundError:
+                continue
+            files[path.name] = (stat_result.st_mtime, stat_result.st_size)
+        return files
+
+    def load(self):
+        """Index files left by earlier runs (oldest first), dropping stale temp files"""
+        self.root.mkdir(parents=True, exist_ok=True)
+        for path in self.root.glob(f"*{TEMP_SUFFIX}"):
+            path.unlink(missing_ok=True)
+        for key, (_, size) in sorted(self._scan().items(), key=lambda item: item[1][0]):
+            self._files[key] = size
+            self._bytes += size
+        self._evict()
+        if self._files:
+            logger.info(f"Media cache: {len(self._files)} files, {self._bytes // (1024 * 1024)}MB on disk")
+
+    def lookup(self, file_id: str, size: Optional[str], fmt: Optional[str]) -> Optional[CachedMedia]:
+        """Cached file for a request, from memory and one stat() - no database access"""
+        meta = self._meta.get((file_id, size, fmt))
+        if meta is None:
+            return None
+        key, etag, content_type, filename, expires = meta
+        if expires < time.monotonic():
+            del self._meta[(file_id, size, fmt)]
+            return None
+        cached = self._hit(key, etag, content_type, filename)
+        if cached is None:
+            del self._meta[(file_id, size, fmt)]
+        else:
+            self._meta.move_to_end((file_id, size, fmt))
+        return cached
+
+    def remember(
+        self, file_id: str, size: Optional[str], fmt: Optional[str],
+        key: str, etag: Optional[str], content_type: str, filename: str,
+    ) -> Optional[CachedMedia]:
+        """Record what a request resolved to; returns the cached file if the content is already on disk"""
+        self._meta[(file_id, size, fmt)] = (key, etag, content_type, filename, time.monotonic() + self.meta_ttl)
+        self._meta.move_to_end((file_id, size, fmt))
+        while len(self._meta) > self.max_meta_entries:
+            self._meta.popitem(last=False)
+        cached = self._hit(key, etag, content_type, filename)
+        if cached is None:
+            self.misses += 1
+        return cached
+
+    def _hit(self, key: str, etag: Optional[str], content_type: str, filename: str) -> Optional[CachedMedia]:
+        path = self._path(key)
+        try:
+            stat_result = path.stat()
+        except FileNotFoundError:
+            # Evicted, possibly by another worker sharing the directory
+            self._drop(key)
+            return None
+        if key in self._files:
+            self._files.move_to_end(key)
+        else:
+            # Written by another worker
+            self._admit(key, stat_result.st_size)
+        self.hits += 1
+        return CachedMedia(path, stat_result, etag, content_type, filename)
+
+    def fill(self, key: str, length: int, opener: Callable[[], Awaitable]):
+        """Copy content into the cache in the background, once per key.
+
+        `opener` returns a fresh GridOut for the content; the response being
+        served keeps its own.
+        """
+        if length > self.max_object_bytes or key in self._filling or key in self._files:
+            return
+        task = asyncio.get_running_loop().create_task(self._fill(key, opener))
+        self._filling[key] = task
+        task.add_done_callback(lambda _: self._filling.pop(key, None))
+
+    async def _fill(self, key: str, opener: Callable[[], Awaitable]):
+        path = self._path(key)
+        temp_path = path.with_name(f"{key}.{os.getpid()}{TEMP_SUFFIX}")
+        try:
+            grid_out = await opener()
+            if grid_out is None:
+                return
+            async with await anyio.open_file(temp_path, "wb") as temp_file:
+                while True:
+                    chunk = await grid_out.readchunk()
+                    if not chunk:
+                        break
+                    await temp_file.write(chunk)
+            # Atomic: readers see either no file or the complete one
+            await anyio.to_thread.run_sync(os.replace, temp_path, path)
+        except Exception as e:
+            logger.warning(f"Caching media {key} failed: {e}")
+            temp_path.unlink(missing_ok=True)
+            return
+        self.fills += 1
+        self._admit(key, path.stat().st_size)
+
+    def _admit(self, key: str, size: int):
+        self._drop(key)
+        self._files[key] = size
+        self._bytes += size
+        self._evict()
+
+    def _evict(self):
+        while self._bytes > self.max_bytes and self._files:
+            self._unlink(next(iter(self._files)))
+            self.evictions += 1
+
+    def _drop(self, key: str):
+        size = self._files.pop(key, None)
+        if size is not None:
+            self._bytes -= size
+
+    def _unlink(self, key: str):
+        self._drop(key)
+        self._path(key).unlink(missing_ok=True)
+
+    async def rescan(self):
+        """Resync with the directory: count files written by other workers, forget removed ones, evict"""
+        on_disk = await asyncio.to_thread(self._scan)
+        for key in [key for key in self._files if key not in on_disk]:
+            self._drop(key)
+        # Files this worker has not used yet go to the old end, newest of them last
+        for key, (_, size) in sorted(on_disk.items(), key=lambda item: item[1][0], reverse=True):
+            if key not in self._files:
+                self._files[key] = size
+                self._files.move_to_end(key, last=False)
+                self._bytes += size
+        self._evict()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(MEDIA_CACHE_RESCAN_INTERVAL)
+            try:
+                await self.rescan()
+            except Exception as e:
+                logger.error(f"Media cache rescan failed: {e}")
+
+    def start(self):
+        """Start the periodic directory rescan (call from an app startup hook)"""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def forget(self, file_id: str):
+        """Stop serving a deleted media id from the cache"""
+        for meta_key in [meta_key for meta_key in self._meta if meta_key[0] == file_id]:
+            del self._meta[meta_key]
+
+    def discard_content(self, sha256: str):
+        """Remove cached copies of freed content: the original and all of its variants"""
+        for key in [key for key in self._files if key == sha256 or key.startswith(f"{sha256}.")]:
+            self._unlink(key)
+        self._path(sha256).unlink(missing_ok=True)
+        for meta_key in [meta_key for meta_key, meta in self._meta.items() if meta[0].split(".")[0] == sha256]:
+            del self._meta[meta_key]
+
+    @staticmethod
+    async def iter_range(path: Path, start: int, end: int, chunk_size: int = 64 * 1024) -> AsyncIterator[bytes]:
+        """Yield bytes start..end (inclusive) of a cached file"""
+        async with await anyio.open_file(path, "rb") as cached_file:
+            await cached_file.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = await cached_file.read(min(chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+    def metrics(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "files": len(self._files),
+            "indexEntries": len(self._meta),
+            "bytes": self._bytes,
+            "maxBytes": self.max_bytes,
+            "evictions": self.evictions,
+            "fills": self.fills,
+            "filling": len(self._filling),
+        }
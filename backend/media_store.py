@@ -0,0 +1,385 @@
+"""
+Media Store - chunked, content-addressed media storage in GridFS
+Uploaded bytes live in the `media` GridFS bucket (media.files / media.chunks),
+written and read chunk by chunk so neither side holds a whole file in memory
+and files are not bound by the 16MB document limit. Each distinct content is
+stored once: `media_blobs` maps its SHA-256 to the GridFS file with a
+reference count, and `media_files` keeps one thin alias record per upload,
+keyed by the id used in /api/media URLs.
+"""
+
+import os
+import re
+import base64
+import hashlib
+import logging
+from datetime import datetime, timezone
+from typing import AsyncIterator, Optional, Tuple
+from gridfs.errors import NoFile
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, PyMongoError
+from motor.motor_asyncio import AsyncIOMotorDatabase, AsyncIOMotorGridFSBucket
+
+logger = logging.getLogger(__name__)
+
+MEDIA_BUCKET = "media"
+MEDIA_CHUNK_SIZE = 255 * 1024
+MEDIA_MAX_UPLOAD_MB = float(os.environ.get('MEDIA_MAX_UPLOAD_MB', '15'))
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class MediaTooLarge(Exception):
+    """Raised when an upload stream exceeds the configured size limit"""
+
+
+class UnsupportedMedia(Exception):
+    """Raised when the uploaded bytes are not one of the allowed media types"""
+
+
+class RangeNotSatisfiable(Exception):
+    """Raised for a syntactically valid byte range that lies outside the file"""
+
+
+# Bytes needed from the start of a file to recognise every type below
+SNIFF_BYTES = 12
+
+
+def sniff_mime(head: bytes) -> Optional[str]:
+    """Media type from a file's leading magic bytes, or None if unrecognised"""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head[:4] == b"RIFF" and head[8:12] == b"AVI ":
+        return "video/x-msvideo"
+    if head[4:8] == b"ftyp":
+        return "video/quicktime" if head[8:12] == b"qt  " else "video/mp4"
+    if head.startswith(b"\x1a\x45\xdf\xa3"):
+        return "video/webm"
+    return None
+
+
+def parse_byte_range(header: Optional[str], length: int) -> Optional[Tuple[int, int]]:
+    """Inclusive (start, end) for a single-range `Range` header, or None to serve the whole file.
+
+    Malformed and multi-range headers are ignored (whole file, as RFC 9110
+    allows); a range starting past the end raises RangeNotSatisfiable.
+    """
+    if not header:
+        return None
+    match = RANGE_PATTERN.match(header.strip())
+    if not match or match.group(1) == match.group(2) == "":
+        return None
+    first, last = match.groups()
+    if first == "":
+        # Suffix range: the last N bytes
+        suffix = int(last)
+        if suffix == 0:
+            raise RangeNotSatisfiable()
+        return max(0, length - suffix), length - 1
+    start = int(first)
+    end = min(int(last), length - 1) if last else length - 1
+    if start >= length or start > end:
+        raise RangeNotSatisfiable()
+    return start, end
+
+
+def etag_for(media_doc: dict) -> Optional[str]:
+    """Strong ETag derived from the content hash"""
+    digest = media_doc.get("sha256")
+    return f'"{digest}"' if digest else None
+
+
+def etag_matches(header: Optional[str], etag: Optional[str]) -> bool:
+    """If-None-Match comparison (weak comparison, so W/ prefixes are accepted)"""
+    if not header or not etag:
+        return False
+    if header.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in header.split(",")]
+    return etag in [tag[2:] if tag.startswith("W/") else tag for tag in candidates]
+
+
+class MediaUpload:
+    """One upload being written to GridFS as its bytes arrive.
+
+    Each write enforces the size cap, updates the SHA-256 and passes the bytes
+    straight to GridFS, so memory use stays at one GridFS chunk however large
+    the file. The media type is sniffed from the first bytes rather than taken
+    from the client. Callers must abort() on any error.
+    """
+
+    def __init__(self, store: "MediaStore", file_id: str, filename: str, allowed_types: Optional[set], uploader_id: Optional[str] = None):
+        self.store = store
+        self.file_id = file_id
+        self.filename = filename
+        self.allowed_types = allowed_types
+        self.uploader_id = uploader_id
+        self.size = 0
+        self.content_type: Optional[str] = None
+        self._digest = hashlib.sha256()
+        self._head = b""
+        self._grid_in = None
+
+    async def write(self, data: bytes):
+        self.size += len(data)
+        if self.size > self.store.max_bytes:
+            raise MediaTooLarge(f"File exceeds {self.store.max_bytes // (1024 * 1024)}MB")
+        self._digest.update(data)
+        if self._grid_in is None:
+            # Hold back the first few bytes until the type can be sniffed
+            self._head += data
+            if len(self._head) < SNIFF_BYTES:
+                return
+            self._open()
+            data, self._head = self._head, b""
+        await self._grid_in.write(data)
+
+    def _open(self):
+        self.content_type = sniff_mime(self._head)
+        if self.content_type is None or (self.allowed_types and self.content_type not in self.allowed_types):
+            raise UnsupportedMedia("File type not supported")
+        self._grid_in = self.store.bucket.open_upload_stream_with_id(
+            self.file_id, self.filename, metadata={"contentType": self.content_type}
+        )
+
+    async def finish(self) -> dict:
+        """Close the GridFS file and record the upload's alias.
+
+        If identical content is already stored, the bytes just written are
+        dropped and the alias points at the existing blob instead.
+        """
+        if self._grid_in is None:
+            # Files shorter than SNIFF_BYTES
+            self._open()
+            data, self._head = self._head, b""
+            await self._grid_in.write(data)
+        await self._grid_in.close()
+
+        sha256 = self._digest.hexdigest()
+        blob_id = await self.store.add_reference(sha256, self.file_id, self.size, self.content_type)
+        if blob_id != self.file_id:
+            await self.store.delete_grid_file(self.file_id)
+
+        media_doc = {
+            "id": self.file_id,
+            "filename": self.filename,
+            "content_type": self.content_type,
+            "file_extension": self.filename.split('.')[-1] if '.' in self.filename else '',
+            "file_size": self.size,
+            "sha256": sha256,
+            "blobId": blob_id,
+            "storage": "gridfs",
+            "uploaderId": self.uploader_id,
+            "uploaded_at": datetime.now(timezone.utc).isoformat(),
+        }
+        await self.store.db.media_files.insert_one(media_doc)
+        media_doc.pop("_id", None)
+        return media_doc
+
+    async def abort(self):
+        """Discard anything written so far"""
+        if self._grid_in is not None:
+            await self._grid_in.abort()
+
+
+class MediaStore:
+    def __init__(self, db: AsyncIOMotorDatabase, max_bytes: int = int(MEDIA_MAX_UPLOAD_MB * 1024 * 1024)):
+        self.db = db
+        self.bucket = AsyncIOMotorGridFSBucket(db, bucket_name=MEDIA_BUCKET, chunk_size_bytes=MEDIA_CHUNK_SIZE)
+        self.max_bytes = max_bytes
+
+    async def ensure_indexes(self):
+        await self.db.media_files.create_index("id", unique=True)
+
+    def begin_upload(self, file_id: str, filename: str, allowed_types: Optional[set] = None, uploader_id: Optional[str] = None) -> "MediaUpload":
+        """Start an incremental upload; feed it with write() and complete it with finish()"""
+        return MediaUpload(self, file_id, filename, allowed_types, uploader_id)
+
+    async def save(self, file_id: str, filename: str, source, allowed_types: Optional[set] = None, uploader_id: Optional[str] = None) -> dict:
+        """Stream `source` (anything with an async read(size)) into the store"""
+        upload = self.begin_upload(file_id, filename, allowed_types, uploader_id)
+        try:
+            while True:
+                chunk = await source.read(MEDIA_CHUNK_SIZE)
+                if not chunk:
+                    break
+                await upload.write(chunk)
+            return await upload.finish()
+        except BaseException:
+            await upload.abort()
+            raise
+
+    async def get(self, file_id: str) -> Optional[dict]:
+        """Metadata record for a media id, without any file bytes"""
+        return await self.db.media_files.find_one({"id": file_id}, {"_id": 0, "file_data": 0})
+
+    async def open(self, media_doc: dict):
+        """GridOut for a media record's bytes, or None if they are not in GridFS"""
+        try:
+            return await self.bucket.open_download_stream(media_doc.get("blobId") or media_doc["id"])
+        except NoFile:
+            return None
+
+    async def add_reference(self, sha256: str, grid_id: str, size: int, content_type: str) -> str:
+        """Count one more reference to the content `sha256`; returns the GridFS id holding it.
+
+        If the content is new, `grid_id` (already written) becomes its blob.
+        Otherwise the existing blob wins and the caller should drop `grid_id`.
+        """
+        while True:
+            blob = await self.db.media_blobs.find_one_and_update(
+                {"_id": sha256}, {"$inc": {"refCount": 1}}, projection={"gridId": 1}
+            )
+            if blob is not None:
+                return blob["gridId"]
+            try:
+                await self.db.media_blobs.insert_one({
+                    "_id": sha256, "gridId": grid_id, "size": size, "contentType": content_type,
+                    "refCount": 1, "createdAt": datetime.now(timezone.utc).isoformat(),
+                })
+                return grid_id
+            except DuplicateKeyError:
+                # A concurrent upload of the same content registered first
+                continue
+
+    async def release_reference(self, sha256: str):
+        """Drop one reference to `sha256`, freeing the stored bytes with the last one"""
+        blob = await self.db.media_blobs.find_one_and_update(
+            {"_id": sha256}, {"$inc": {"refCount": -1}}, return_document=ReturnDocument.AFTER
+        )
+        if blob is None or blob["refCount"] > 0:
+            return
+        removed = await self.db.media_blobs.delete_one({"_id": sha256, "refCount": {"$lte": 0}})
+        if removed.deleted_count:
+            await self.delete_grid_file(blob["gridId"])
+            for variant_id in blob.get("variants", []):
+                await self.delete_grid_file(variant_id)
+
+    async def is_referenced(self, sha256: str) -> bool:
+        return await self.db.media_blobs.find_one({"_id": sha256}, {"_id": 1}) is not None
+
+    async def store_variant(self, sha256: str, variant_id: str, data: bytes, content_type: str):
+        """Store a derived rendition of `sha256`, freed together with it"""
+        try:
+            await self.bucket.upload_from_stream_with_id(
+                variant_id, variant_id, data, metadata={"contentType": content_type, "source": sha256}
+            )
+        except PyMongoError as e:
+            # Most likely another worker stored the same variant first
+            logger.warning(f"Storing variant {variant_id} failed: {e}")
+        await self.db.media_blobs.update_one({"_id": sha256}, {"$addToSet": {"variants": variant_id}})
+
+    async def delete_grid_file(self, grid_id: str):
+        try:
+            await self.bucket.delete(grid_id)
+        except NoFile:
+            pass
+
+    @staticmethod
+    async def iter_chunks(grid_out) -> AsyncIterator[bytes]:
+        """Yield a stored file one GridFS chunk at a time"""
+        while True:
+            chunk = await grid_out.readchunk()
+            if not chunk:
+                break
+            yield chunk
+
+    @staticmethod
+    async def iter_range(grid_out, start: int, end: int) -> AsyncIterator[bytes]:
+        """Yield bytes start..end (inclusive), reading only the chunks that cover them"""
+        grid_out.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await grid_out.readchunk()
+            if not chunk:
+                break
+            chunk = chunk[:remaining]
+            remaining -= len(chunk)
+            yield chunk
+
+    async def delete(self, file_id: str, uploader_id: str) -> bool:
+        """Delete one of `uploader_id`'s upload aliases, releasing only its reference.
+
+        Other aliases of the same content keep their references, so the bytes
+        are freed only when the last one goes.
+        """
+        media_doc = await self.db.media_files.find_one_and_delete(
+            {"id": file_id, "uploaderId": uploader_id}, projection={"_id": 0}
+        )
+        if media_doc is None:
+            return False
+        if media_doc.get("blobId"):
+            await self.release_reference(media_doc["sha256"])
+        else:
+            await self.delete_grid_file(file_id)
+        return True
+
+    async def migrate_legacy_blobs(self):
+        """Move base64 `file_data` blobs from media_files documents into GridFS.
+
+        Idempotent and resumable: a document keeps its blob until the GridFS copy
+        has been fully written, and any partial copy from an interrupted run is
+        replaced.
+        """
+        migrated = 0
+        async for doc in self.db.media_files.find({"file_data": {"$exists": True}}, {"_id": 0, "id": 1}):
+            full = await self.db.media_files.find_one({"id": doc["id"]}, {"_id": 0})
+            try:
+                data = base64.b64decode(full["file_data"])
+            except Exception as e:
+                logger.error(f"Skipping undecodable media file {doc['id']}: {e}")
+                continue
+            try:
+                await self.bucket.delete(doc["id"])
+            except NoFile:
+                pass
+            await self.bucket.upload_from_stream_with_id(
+                doc["id"], full.get("filename") or doc["id"], data,
+                metadata={"contentType": full.get("content_type")}
+            )
+            await self.db.media_files.update_one(
+                {"id": doc["id"]},
+                {"$unset": {"file_data": ""}, "$set": {
+                    "storage": "gridfs", "file_size": len(data), "sha256": hashlib.sha256(data).hexdigest()
+                }}
+            )
+            migrated += 1
+        if migrated:
+            logger.info(f"Migrated {migrated} media files to GridFS")
+
+    async def backfill_hashes(self):
+        """Compute the content hash (used for ETags) of GridFS files stored without one"""
+        hashed = 0
+        async for doc in self.db.media_files.find(
+            {"storage": "gridfs", "sha256": {"$exists": False}}, {"_id": 0, "id": 1}
+        ):
+            grid_out = await self.open(doc)
+            if grid_out is None:
+                continue
+            digest = hashlib.sha256()
+            async for chunk in self.iter_chunks(grid_out):
+                digest.update(chunk)
+            await self.db.media_files.update_one({"id": doc["id"]}, {"$set": {"sha256": digest.hexdigest()}})
+            hashed += 1
+        if hashed:
+            logger.info(f"Hashed {hashed} media files")
+
+    async def deduplicate_existing(self):
+        """Register stored files that predate content addressing, dropping duplicate copies"""
+        freed = 0
+        async for doc in self.db.media_files.find(
+            {"storage": "gridfs", "sha256": {"$exists": True}, "blobId": {"$exists": False}},
+            {"_id": 0, "id": 1, "sha256": 1, "file_size": 1, "content_type": 1}
+        ):
+            blob_id = await self.add_reference(doc["sha256"], doc["id"], doc.get("file_size", 0), doc.get("content_type"))
+            await self.db.media_files.update_one({"id": doc["id"]}, {"$set": {"blobId": blob_id}})
+            if blob_id != doc["id"]:
+                await self.delete_grid_file(doc["id"])
+                freed += 1
+        if freed:
+            logger.info(f"Freed {freed} duplicate media files")
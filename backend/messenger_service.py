@@ -12,6 +12,9 @@ from fastapi import HTTPException
 from pydantic import BaseModel, Field
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from emergentintegrations.llm.chat import LlmChat, UserMessage
+from chat_sessions import SharedChatSessions, with_history
+from realtime_backend import LocalSharedState
+from presence_service import PresenceService
 
 logger = logging.getLogger(__name__)
 
@@ -39,11 +42,15 @@ class UpdateReadStatusRequest(BaseModel):
 # ===== MESSENGER SERVICE =====
 
 class MessengerService:
-    def __init__(self, db: AsyncIOMotorDatabase, emit_to_user_func):
+    def __init__(self, db: AsyncIOMotorDatabase, emit_to_user_func, ai_sessions: Optional[SharedChatSessions] = None,
+                 presence: Optional[PresenceService] = None):
         self.db = db
         self.emit_to_user = emit_to_user_func
+        # Online status from socket presence (falls back to the stored flag)
+        self.presence = presence
         self.llm_key = os.environ.get('EMERGENT_LLM_KEY')
-        self.ai_sessions = {}  # Store AI chat sessions
+        # AI chat history per user (shared by all workers when given a shared namespace)
+        self.ai_sessions = ai_sessions or SharedChatSessions(LocalSharedState().namespace("messenger-ai-sessions"))
         
     async def get_or_create_thread(self, user1_id: str, user2_id: str) -> dict:
         """Get existing thread or create new one between two users"""
@@ -167,7 +174,7 @@ class MessengerService:
                     "id": other_user["id"],
                     "name": other_user.get("name", "Unknown"),
                     "avatar": other_user.get("avatar", ""),
-                    "online": other_user.get("online", False)
+                    "online": await self.presence.is_online(other_user_id) if self.presence else other_user.get("online", False)
                 }
             
             # Get unread count for this user
@@ -290,23 +297,24 @@ class MessengerService:
     async def get_ai_response(self, request: AIMessageRequest, user_id: str) -> str:
         """Get AI-powered message suggestion or response"""
         try:
-            # Get or create AI chat session for this user
-            if user_id not in self.ai_sessions:
-                self.ai_sessions[user_id] = LlmChat(
-                    api_key=self.llm_key,
-                    session_id=f"messenger_ai_{user_id}",
-                    system_message="You are a helpful AI assistant integrated into a messaging app. Provide concise, friendly responses. Keep responses under 200 words."
-                ).with_model("openai", "gpt-4o-mini")
-            
-            chat = self.ai_sessions[user_id]
+            system_message = "You are a helpful AI assistant integrated into a messaging app. Provide concise, friendly responses. Keep responses under 200 words."
             
             # Add context if provided
             prompt = request.message
             if request.context:
                 prompt = f"Context: {request.context}\n\nUser: {request.message}"
             
-            user_message = UserMessage(text=prompt)
-            response = await chat.send_message(user_message)
+            # The user's AI chat session, rebuilt from the shared history if it moved workers
+            response = await self.ai_sessions.send(
+                user_id,
+                prompt,
+                new_chat=lambda history: LlmChat(
+                    api_key=self.llm_key,
+                    session_id=f"messenger_ai_{user_id}",
+                    system_message=with_history(system_message, history)
+                ).with_model("openai", "gpt-4o-mini"),
+                make_message=lambda text: UserMessage(text=text)
+            )
             
             logger.info(f"AI response generated for user {user_id}")
             return response
@@ -0,0 +1,151 @@
+"""
+Presence Service - who is online, from socket connections rather than logins
+Fed by socket connect, disconnect and client heartbeats. Online checks are
+answered from memory (sessions on this worker, then the shared per-user
+connection count that spans workers). Last-seen times and online flags are
+written back to `users` in one bulk_write per interval, so heartbeats from
+every connected client never hit MongoDB one by one.
+
+A worker's share of the counts is held under its broker connection's lease
+(see realtime_broker.py): if the worker dies or hangs without calling stop(),
+the broker rolls its increments back once the lease lapses, and a worker that
+reconnects re-applies what it still holds.
+"""
+
+import os
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Optional, Set
+
+from pymongo import UpdateOne
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from realtime_backend import SharedNamespace
+
+logger = logging.getLogger(__name__)
+
+PRESENCE_FLUSH_INTERVAL = float(os.environ.get('PRESENCE_FLUSH_INTERVAL', '10.0'))
+
+
+class PresenceService:
+    def __init__(self, db: AsyncIOMotorDatabase, connections: SharedNamespace, flush_interval: float = PRESENCE_FLUSH_INTERVAL):
+        self.db = db
+        # userId -> number of workers holding at least one of their sockets
+        self.connections = connections
+        self.flush_interval = flush_interval
+        # Users with a socket on this worker
+        self._local: Set[str] = set()
+        self._last_seen: Dict[str, str] = {}
+        # userId -> fields to $set on the next flush
+        self._dirty: Dict[str, dict] = {}
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self.heartbeats = 0
+        self.transitions = 0
+        self.flushes = 0
+        self.flush_errors = 0
+
+    def _seen(self, user_id: str, **fields) -> str:
+        now = datetime.now(timezone.utc).isoformat()
+        self._last_seen[user_id] = now
+        self._dirty.setdefault(user_id, {}).update(lastSeen=now, **fields)
+        return now
+
+    async def connected(self, user_id: str) -> bool:
+        """A user's first socket on this worker; True if they just came online everywhere"""
+        self._local.add(user_id)
+        came_online = await self.connections.incr(user_id) == 1
+        self._seen(user_id, **({"online": True} if came_online else {}))
+        if came_online:
+            self.transitions += 1
+        return came_online
+
+    async def disconnected(self, user_id: str) -> bool:
+        """A user's last socket on this worker closed; True if they are now offline everywhere"""
+        self._local.discard(user_id)
+        went_offline = await self.connections.incr(user_id, -1) == 0
+        self._seen(user_id, **({"online": False} if went_offline else {}))
+        if went_offline:
+            self.transitions += 1
+        return went_offline
+
+    def heartbeat(self, user_id: str):
+        """Client is still there: refresh last-seen (persisted with the next flush)"""
+        self.heartbeats += 1
+        self._seen(user_id)
+
+    async def is_online(self, user_id: str) -> bool:
+        if user_id in self._local:
+            return True
+        return bool(await self.connections.get(user_id))
+
+    async def online_map(self, user_ids: Iterable[str]) -> Dict[str, bool]:
+        user_ids = list(dict.fromkeys(user_ids))
+        remote = [user_id for user_id in user_ids if user_id not in self._local]
+        counts = await asyncio.gather(*(self.connections.get(user_id) for user_id in remote))
+        online = {user_id: bool(count) for user_id, count in zip(remote, counts)}
+        return {user_id: online.get(user_id, True) for user_id in user_ids}
+
+    def last_seen(self, user_id: str) -> Optional[str]:
+        """Last activity this worker saw from the user (None if it has not seen them)"""
+        return self._last_seen.get(user_id)
+
+    async def flush(self):
+        """Write pending online flags and last-seen times. A failed batch is retried next interval."""
+        async with self._flush_lock:
+            if not self._dirty:
+                return
+            pending, self._dirty = self._dirty, {}
+            try:
+                await self.db.users.bulk_write(
+                    [UpdateOne({"id": user_id}, {"$set": fields}) for user_id, fields in pending.items()],
+                    ordered=False
+                )
+            except Exception as e:
+                self.flush_errors += 1
+                logger.error(f"Presence flush failed, retrying next interval: {e}")
+                for user_id, fields in pending.items():
+                    # Anything recorded since is newer and wins
+                    self._dirty[user_id] = {**fields, **self._dirty.get(user_id, {})}
+                return
+            self.flushes += 1
+
+    async def _run(self):
+        while not self._stopping:
+            await asyncio.sleep(self.flush_interval)
+            await asyncio.shield(self.flush())
+
+    def start(self):
+        """Start the periodic flush loop (call from an app startup hook)"""
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Stop the flush loop, release this worker's users and write what is still pending"""
+        self._stopping = True
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for user_id in list(self._local):
+            try:
+                await self.disconnected(user_id)
+            except Exception as e:
+                logger.warning(f"Releasing presence of {user_id} failed: {e}")
+        await self.flush()
+
+    def metrics(self) -> dict:
+        return {
+            "localUsers": len(self._local),
+            "pendingWrites": len(self._dirty),
+            "heartbeats": self.heartbeats,
+            "transitions": self.transitions,
+            "flushes": self.flushes,
+            "flushErrors": self.flush_errors,
+        }
@@ -0,0 +1,110 @@
+"""
+Reactions Service - likes and reposts stored as edges
+One document per (content, user, reaction type) in the `reactions` collection,
+with the denormalized counters in each post/reel `stats` kept by atomic $inc.
+Replaces the unbounded likedBy/repostedBy arrays on post and reel documents.
+"""
+
+import logging
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Set, Tuple
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+logger = logging.getLogger(__name__)
+
+# (contentType, reaction type) -> (collection, stats counter, legacy array field)
+REACTION_TARGETS = {
+    ("post", "like"): ("posts", "stats.likes", "likedBy"),
+    ("post", "repost"): ("posts", "stats.reposts", "repostedBy"),
+    ("reel", "like"): ("reels", "stats.likes", "likedBy"),
+}
+
+
+class ReactionService:
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self.db = db
+
+    async def ensure_indexes(self):
+        await self.db.reactions.create_index(
+            [("contentId", 1), ("userId", 1), ("contentType", 1), ("type", 1)], unique=True
+        )
+        await self.db.reactions.create_index([("userId", 1), ("contentType", 1), ("type", 1)])
+
+    async def toggle(self, content_type: str, content_id: str, user_id: str, reaction: str) -> Tuple[bool, int, Optional[str]]:
+        """Toggle a reaction. Returns (active after toggle, updated counter value,
+        createdAt of the edge that was created or removed).
+
+        The edge is removed with one conditional delete, or inserted when there was
+        nothing to remove; the unique index makes concurrent toggles safe, and the
+        counter only moves when an edge was actually created or removed.
+        """
+        collection_name, counter, _ = REACTION_TARGETS[(content_type, reaction)]
+        collection = self.db[collection_name]
+        key = {"contentId": content_id, "userId": user_id, "contentType": content_type, "type": reaction}
+
+        removed = await self.db.reactions.find_one_and_delete(key, projection={"_id": 0, "createdAt": 1})
+        if removed is not None:
+            active, delta, reacted_at = False, -1, removed.get("createdAt")
+        else:
+            reacted_at = datetime.now(timezone.utc).isoformat()
+            try:
+                await self.db.reactions.insert_one({**key, "createdAt": reacted_at})
+                active, delta = True, 1
+            except DuplicateKeyError:
+                # A concurrent request created the same edge and counted it
+                active, delta = True, 0
+
+        query = {"id": content_id}
+        if delta < 0:
+            query[counter] = {"$gt": 0}
+        doc = await collection.find_one_and_update(
+            query,
+            {"$inc": {counter: delta}},
+            projection={"_id": 0, "stats": 1},
+            return_document=ReturnDocument.AFTER
+        )
+        if doc is None:
+            doc = await collection.find_one({"id": content_id}, {"_id": 0, "stats": 1}) or {}
+        count = doc.get("stats", {}).get(counter.split(".", 1)[1], 0)
+        return active, count, reacted_at
+
+    async def viewer_reactions(self, content_type: str, content_ids: List[str], user_id: str) -> Dict[str, Set[str]]:
+        """{contentId: {reaction types}} for one viewer over a page of content, in one query"""
+        if not content_ids or not user_id:
+            return {}
+        edges = await self.db.reactions.find(
+            {"contentId": {"$in": content_ids}, "userId": user_id, "contentType": content_type},
+            {"_id": 0, "contentId": 1, "type": 1}
+        ).to_list(None)
+        result: Dict[str, Set[str]] = {}
+        for edge in edges:
+            result.setdefault(edge["contentId"], set()).add(edge["type"])
+        return result
+
+    async def migrate_legacy_arrays(self):
+        """Move likedBy/repostedBy arrays into reaction edges and drop them from the documents.
+
+        Idempotent: edges are upserted and only documents still carrying a
+        non-empty array are touched. Counters are left as they are.
+        """
+        migrated = 0
+        for (content_type, reaction), (collection_name, _, field) in REACTION_TARGETS.items():
+            collection = self.db[collection_name]
+            async for doc in collection.find({field: {"$exists": True, "$ne": []}}, {"_id": 0, "id": 1, field: 1}):
+                now = datetime.now(timezone.utc).isoformat()
+                ops = [
+                    UpdateOne(
+                        {"contentId": doc["id"], "userId": user_id, "contentType": content_type, "type": reaction},
+                        {"$setOnInsert": {"createdAt": now}},
+                        upsert=True
+                    )
+                    for user_id in set(doc.get(field) or [])
+                ]
+                if ops:
+                    await self.db.reactions.bulk_write(ops, ordered=False)
+                await collection.update_one({"id": doc["id"]}, {"$unset": {field: ""}})
+                migrated += 1
+        if migrated:
+            logger.info(f"Migrated legacy reaction arrays on {migrated} documents")
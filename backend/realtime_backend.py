@@ -0,0 +1,194 @@
+"""
+Realtime Backend - pluggable socket.io client manager and shared state
+Everything realtime that must be seen by every API worker goes through here:
+socket.io emits (via the client manager) and small shared records such as
+active calls, socket presence counts and LLM chat transcripts.
+
+Selected with REALTIME_BROKER:
+- unset: single process, socket.io's in-memory manager and a local dict
+- unix:///path/to.sock: the in-repo broker (realtime_broker.py), for N workers on one box
+
+Another transport (e.g. Redis) only needs a client manager and a SharedState.
+"""
+
+import abc
+import time
+import logging
+from typing import Any, Dict, Optional, Tuple
+
+import socketio
+from socketio.async_pubsub_manager import AsyncPubSubManager
+
+from realtime_broker import BrokerClient
+
+logger = logging.getLogger(__name__)
+
+SOCKETIO_CHANNEL = 'socketio'
+
+
+class SharedState(abc.ABC):
+    """Namespaced key-value store with TTLs and counters, shared by all workers"""
+
+    @abc.abstractmethod
+    async def get(self, ns: str, key: str) -> Any:
+        ...
+
+    @abc.abstractmethod
+    async def set(self, ns: str, key: str, value: Any, ttl: Optional[float] = None):
+        ...
+
+    @abc.abstractmethod
+    async def delete(self, ns: str, key: str) -> bool:
+        ...
+
+    @abc.abstractmethod
+    async def incr(self, ns: str, key: str, delta: int = 1) -> int:
+        """Add to a counter and return the new value; counters never go below zero"""
+
+    def namespace(self, name: str) -> "SharedNamespace":
+        return StateNamespace(self, name)
+
+
+class SharedNamespace(abc.ABC):
+    """One namespace of a SharedState, as handed to the services that use it"""
+
+    @abc.abstractmethod
+    async def get(self, key: str) -> Any:
+        ...
+
+    @abc.abstractmethod
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        ...
+
+    @abc.abstractmethod
+    async def delete(self, key: str) -> bool:
+        ...
+
+    @abc.abstractmethod
+    async def incr(self, key: str, delta: int = 1) -> int:
+        ...
+
+
+class StateNamespace(SharedNamespace):
+    def __init__(self, state: SharedState, name: str):
+        self.state = state
+        self.name = name
+
+    async def get(self, key: str) -> Any:
+        return await self.state.get(self.name, key)
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        await self.state.set(self.name, key, value, ttl)
+
+    async def delete(self, key: str) -> bool:
+        return await self.state.delete(self.name, key)
+
+    async def incr(self, key: str, delta: int = 1) -> int:
+        return await self.state.incr(self.name, key, delta)
+
+
+class LocalSharedState(SharedState):
+    def __init__(self):
+        # (namespace, key) -> (value, expiry as monotonic seconds or None)
+        self._data: Dict[Tuple[str, str], Tuple[Any, Optional[float]]] = {}
+
+    async def get(self, ns: str, key: str) -> Any:
+        entry = self._data.get((ns, key))
+        if entry is None:
+            return None
+        value, expires = entry
+        if expires is not None and expires < time.monotonic():
+            del self._data[(ns, key)]
+            return None
+        return value
+
+    async def set(self, ns: str, key: str, value: Any, ttl: Optional[float] = None):
+        self._data[(ns, key)] = (value, time.monotonic() + ttl if ttl else None)
+
+    async def delete(self, ns: str, key: str) -> bool:
+        return self._data.pop((ns, key), None) is not None
+
+    async def incr(self, ns: str, key: str, delta: int = 1) -> int:
+        value = (await self.get(ns, key) or 0) + delta
+        if value > 0:
+            self._data[(ns, key)] = (value, None)
+        else:
+            self._data.pop((ns, key), None)
+        return max(0, value)
+
+
+class BrokerSharedState(SharedState):
+    def __init__(self, client: BrokerClient):
+        self.client = client
+
+    async def get(self, ns: str, key: str) -> Any:
+        return await self.client.request("get", ns=ns, key=key)
+
+    async def set(self, ns: str, key: str, value: Any, ttl: Optional[float] = None):
+        await self.client.request("set", ns=ns, key=key, value=value, ttl=ttl)
+
+    async def delete(self, ns: str, key: str) -> bool:
+        return await self.client.request("del", ns=ns, key=key)
+
+    async def incr(self, ns: str, key: str, delta: int = 1) -> int:
+        return await self.client.incr(ns, key, delta)
+
+
+class BrokerManager(AsyncPubSubManager):
+    """socket.io client manager that relays emits and room changes through the broker"""
+
+    name = 'realtime-broker'
+
+    def __init__(self, client: BrokerClient, channel: str = SOCKETIO_CHANNEL, write_only: bool = False):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.client = client
+        self.published = 0
+        self.received = 0
+
+    async def _publish(self, data):
+        await self.client.publish(self.channel, self.json.dumps(data))
+        self.published += 1
+
+    async def _listen(self):
+        queue = await self.client.subscribe(self.channel)
+        while True:
+            message = await queue.get()
+            self.received += 1
+            yield message
+
+
+class RealtimeBackend:
+    def __init__(self, client_manager: socketio.AsyncManager, state: SharedState, client: Optional[BrokerClient] = None):
+        self.client_manager = client_manager
+        self.state = state
+        self.client = client
+
+    @property
+    def distributed(self) -> bool:
+        return self.client is not None
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.close()
+
+    def metrics(self) -> dict:
+        if self.client is None:
+            return {"backend": "local"}
+        return {
+            "backend": "broker",
+            "path": self.client.path,
+            "connected": self.client.connected,
+            "reconnects": self.client.reconnects,
+            "published": self.client_manager.published,
+            "received": self.client_manager.received,
+        }
+
+
+def create_realtime_backend(url: Optional[str]) -> RealtimeBackend:
+    """Backend for a REALTIME_BROKER setting (None or empty means single process)"""
+    if not url:
+        return RealtimeBackend(socketio.AsyncManager(), LocalSharedState())
+    if url.startswith("unix://"):
+        client = BrokerClient(url[len("unix://"):])
+        return RealtimeBackend(BrokerManager(client), BrokerSharedState(client), client)
+    raise ValueError(f"Unsupported REALTIME_BROKER {url!r} (expected unix:///path/to.sock)")
@@ -0,0 +1,328 @@
+"""
+Realtime Broker - local pub/sub and shared key-value store over a Unix socket
+Lets several uvicorn workers on one box behave like one realtime server:
+socket.io fan-out travels over its pub/sub channels and small shared state
+(active calls, socket presence, chat transcripts) lives in its store.
+
+Protocol: one JSON object per line. Requests carrying an "id" get a reply
+{"id", "result"} or {"id", "error"}; published messages are pushed to
+subscribers as {"op": "msg", "channel", "data"}. Counters changed with "incr"
+are owned by the connection that changed them and rolled back when it goes
+away, so a crashed worker cannot leave users marked as connected. Each
+connection is also a lease: clients ping every third of CONNECTION_LEASE and a
+connection silent for longer (a hung worker whose socket is still open) is
+dropped and its counters rolled back the same way.
+
+Run standalone with `python realtime_broker.py /path/to/socket`; workers also
+start it on demand, and a lock file keeps it to one broker per socket path.
+"""
+
+import os
+import sys
+import json
+import time
+import fcntl
+import asyncio
+import logging
+import itertools
+import subprocess
+from typing import Any, Dict, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Socket.io packets can be large (message bodies, SDP offers)
+LINE_LIMIT = 16 * 1024 * 1024
+REQUEST_TIMEOUT = 5.0
+SWEEP_INTERVAL = 30.0
+# A subscriber that cannot take a message within this long is disconnected
+SUBSCRIBER_DRAIN_TIMEOUT = 5.0
+# A connection that sends nothing (not even a ping) for this long is dropped
+CONNECTION_LEASE = float(os.environ.get('REALTIME_LEASE_SECONDS', '15'))
+
+
+class RealtimeBroker:
+    def __init__(self):
+        self._subscribers: Dict[str, Set[asyncio.StreamWriter]] = {}
+        # namespace -> key -> (value, expiry as epoch seconds or None)
+        self._store: Dict[str, Dict[str, Tuple[Any, Optional[float]]]] = {}
+        # connection -> {(namespace, key): net delta it applied}
+        self._owned: Dict[asyncio.StreamWriter, Dict[Tuple[str, str], int]] = {}
+
+    async def serve(self, path: str):
+        server = await asyncio.start_unix_server(self._handle, path=path, limit=LINE_LIMIT)
+        os.chmod(path, 0o600)
+        asyncio.get_running_loop().create_task(self._sweep())
+        logger.info(f"Realtime broker listening on {path}")
+        async with server:
+            await server.serve_forever()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._owned[writer] = {}
+        try:
+            while True:
+                try:
+                    line = await asyncio.wait_for(reader.readline(), CONNECTION_LEASE)
+                except asyncio.TimeoutError:
+                    logger.warning("Dropping a connection whose lease expired")
+                    break
+                if not line:
+                    break
+                request = None
+                try:
+                    request = json.loads(line)
+                    result = await self._dispatch(writer, request)
+                    reply = {"id": request["id"], "result": result} if "id" in request else None
+                except Exception as e:
+                    reply = {"id": request.get("id"), "error": str(e)} if isinstance(request, dict) else None
+                if reply is not None and reply["id"] is not None:
+                    writer.write(json.dumps(reply).encode() + b"\n")
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            self._release(writer)
+            writer.close()
+
+    async def _dispatch(self, writer: asyncio.StreamWriter, request: dict):
+        op = request["op"]
+        if op == "ping":
+            return True
+        if op == "pub":
+            await self._publish(request["channel"], request["data"])
+            return None
+        if op == "sub":
+            self._subscribers.setdefault(request["channel"], set()).add(writer)
+            return True
+        namespace = self._store.setdefault(request["ns"], {})
+        key = request["key"]
+        if op == "get":
+            return self._get(namespace, key)
+        if op == "set":
+            ttl = request.get("ttl")
+            namespace[key] = (request["value"], time.time() + ttl if ttl else None)
+            return True
+        if op == "del":
+            return namespace.pop(key, None) is not None
+        if op == "incr":
+            delta = int(request.get("delta", 1))
+            value = (self._get(namespace, key) or 0) + delta
+            if value > 0:
+                namespace[key] = (value, None)
+            else:
+                namespace.pop(key, None)
+            owned = self._owned[writer]
+            owned[(request["ns"], key)] = owned.get((request["ns"], key), 0) + delta
+            return max(0, value)
+        raise ValueError(f"Unknown op {op}")
+
+    @staticmethod
+    def _get(namespace: dict, key: str):
+        entry = namespace.get(key)
+        if entry is None:
+            return None
+        value, expires = entry
+        if expires is not None and expires < time.time():
+            del namespace[key]
+            return None
+        return value
+
+    async def _publish(self, channel: str, data):
+        message = json.dumps({"op": "msg", "channel": channel, "data": data}).encode() + b"\n"
+        written = []
+        for subscriber in list(self._subscribers.get(channel, ())):
+            try:
+                subscriber.write(message)
+                written.append(subscriber)
+            except (ConnectionError, RuntimeError):
+                self._release(subscriber)
+        # One slow worker must not hold up delivery to the others
+        await asyncio.gather(*(self._drain(subscriber) for subscriber in written))
+
+    async def _drain(self, subscriber: asyncio.StreamWriter):
+        try:
+            await asyncio.wait_for(subscriber.drain(), SUBSCRIBER_DRAIN_TIMEOUT)
+        except asyncio.TimeoutError:
+            # Its client reconnects, re-subscribes and re-applies its counters
+            logger.warning("Disconnecting a subscriber that stopped reading")
+            self._release(subscriber)
+            subscriber.close()
+        except (ConnectionError, RuntimeError):
+            self._release(subscriber)
+
+    def _release(self, writer: asyncio.StreamWriter):
+        for subscribers in self._subscribers.values():
+            subscribers.discard(writer)
+        for (ns, key), delta in self._owned.pop(writer, {}).items():
+            namespace = self._store.get(ns, {})
+            value = (self._get(namespace, key) or 0) - delta
+            if value > 0:
+                namespace[key] = (value, None)
+            else:
+                namespace.pop(key, None)
+
+    async def _sweep(self):
+        while True:
+            await asyncio.sleep(SWEEP_INTERVAL)
+            for namespace in self._store.values():
+                for key in list(namespace):
+                    self._get(namespace, key)
+
+
+class BrokerClient:
+    """Connection from one worker to the broker, reconnecting (and starting it) as needed"""
+
+    def __init__(self, path: str, autostart: bool = True):
+        self.path = path
+        self.autostart = autostart
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._connecting: Optional[asyncio.Lock] = None
+        self._ids = itertools.count(1)
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._queues: Dict[str, asyncio.Queue] = {}
+        # Counters this worker holds, re-applied after a reconnect (the broker rolled them back)
+        self._owned: Dict[Tuple[str, str], int] = {}
+        self.reconnects = 0
+
+    @property
+    def connected(self) -> bool:
+        return self._writer is not None and not self._writer.is_closing()
+
+    async def connect(self):
+        if self._connecting is None:
+            self._connecting = asyncio.Lock()
+        async with self._connecting:
+            if self.connected:
+                return
+            delay = 0.05
+            for attempt in range(8):
+                try:
+                    self._reader, self._writer = await asyncio.open_unix_connection(self.path, limit=LINE_LIMIT)
+                    break
+                except (FileNotFoundError, ConnectionRefusedError):
+                    if self.autostart and attempt == 0:
+                        start_broker(self.path)
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, 1.0)
+            else:
+                raise ConnectionError(f"Realtime broker at {self.path} is not reachable")
+            asyncio.get_running_loop().create_task(self._read_loop(self._reader))
+            asyncio.get_running_loop().create_task(self._keepalive(self._writer))
+            for channel in self._queues:
+                self._send({"op": "sub", "channel": channel})
+            for (ns, key), delta in self._owned.items():
+                if delta:
+                    self._send({"op": "incr", "ns": ns, "key": key, "delta": delta})
+
+    def _send(self, message: dict):
+        self._writer.write(json.dumps(message).encode() + b"\n")
+
+    async def _keepalive(self, writer: asyncio.StreamWriter):
+        """Renew this connection's lease for as long as it is the current one"""
+        while True:
+            await asyncio.sleep(CONNECTION_LEASE / 3)
+            if writer is not self._writer or writer.is_closing():
+                return
+            self._send({"op": "ping"})
+
+    async def _read_loop(self, reader: asyncio.StreamReader):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                message = json.loads(line)
+                if message.get("op") == "msg":
+                    queue = self._queues.get(message["channel"])
+                    if queue is not None:
+                        queue.put_nowait(message["data"])
+                    continue
+                future = self._pending.pop(message.get("id"), None)
+                if future is not None and not future.done():
+                    if "error" in message:
+                        future.set_exception(RuntimeError(message["error"]))
+                    else:
+                        future.set_result(message.get("result"))
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError) as e:
+            logger.warning(f"Realtime broker connection lost: {e}")
+        if self._writer is not None:
+            self._writer.close()
+        self._writer = None
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(ConnectionError("Realtime broker connection lost"))
+        self._pending.clear()
+        if self._queues:
+            # Subscribers must keep receiving: reconnect in the background
+            self.reconnects += 1
+            asyncio.get_running_loop().create_task(self._reconnect())
+
+    async def _reconnect(self):
+        while not self.connected:
+            try:
+                await self.connect()
+            except ConnectionError:
+                await asyncio.sleep(1.0)
+
+    async def request(self, op: str, **fields):
+        if not self.connected:
+            await self.connect()
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        self._send({"op": op, "id": request_id, **fields})
+        try:
+            return await asyncio.wait_for(future, REQUEST_TIMEOUT)
+        finally:
+            self._pending.pop(request_id, None)
+
+    async def publish(self, channel: str, data):
+        if not self.connected:
+            await self.connect()
+        self._send({"op": "pub", "channel": channel, "data": data})
+
+    async def subscribe(self, channel: str) -> asyncio.Queue:
+        queue = self._queues.setdefault(channel, asyncio.Queue())
+        if not self.connected:
+            await self.connect()
+        else:
+            self._send({"op": "sub", "channel": channel})
+        return queue
+
+    async def incr(self, ns: str, key: str, delta: int = 1) -> int:
+        if not self.connected:
+            await self.connect()  # before recording it, or connect() would re-apply it too
+        self._owned[(ns, key)] = self._owned.get((ns, key), 0) + delta
+        if not self._owned[(ns, key)]:
+            del self._owned[(ns, key)]
+        return await self.request("incr", ns=ns, key=key, delta=delta)
+
+    async def close(self):
+        self._queues.clear()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+def start_broker(path: str):
+    """Start a detached broker process for `path` (it exits at once if one already holds the lock)"""
+    subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), path],
+        stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+
+
+def main(path: str):
+    lock_file = open(f"{path}.lock", "w")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return  # another broker owns this socket
+    if os.path.exists(path):
+        os.unlink(path)  # left over from a broker that died
+    asyncio.run(RealtimeBroker().serve(path))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main(sys.argv[1] if len(sys.argv) > 1 else "/tmp/loopync-realtime.sock")
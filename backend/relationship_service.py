@@ -0,0 +1,131 @@
+"""
+Relationship Service - bulk viewer-to-user relationship resolution
+Resolves friend, pending-request, blocked and muted status between one viewer
+and any number of target users with a fixed number of queries (one per source
+collection, run concurrently), instead of per-row are_friends/is_blocked calls.
+"""
+
+import asyncio
+from typing import Dict, Iterable, Set
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+
+def relationship_status(relationship: dict):
+    """Single profile-page status: friends, pending_sent, pending_received or None"""
+    if relationship.get("isFriend"):
+        return "friends"
+    if relationship.get("requestSent"):
+        return "pending_sent"
+    if relationship.get("requestReceived"):
+        return "pending_received"
+    return None
+
+
+class RelationshipService:
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self.db = db
+
+    async def ensure_indexes(self):
+        await self.db.friendships.create_index([("userId1", 1), ("userId2", 1)])
+        await self.db.friendships.create_index("userId2")
+        await self.db.friend_requests.create_index([("fromUserId", 1), ("toUserId", 1), ("status", 1)])
+        await self.db.friend_requests.create_index([("toUserId", 1), ("status", 1)])
+        await self.db.user_blocks.create_index([("blockerId", 1), ("blockedId", 1)])
+        await self.db.user_blocks.create_index("blockedId")
+        await self.db.user_mutes.create_index([("muterId", 1), ("mutedId", 1)])
+
+    async def resolve(self, viewer_id: str, target_ids: Iterable[str]) -> Dict[str, dict]:
+        """{targetId: {isFriend, requestSent, requestReceived, isBlocked, blockedBy, isMuted}}
+
+        Friendship and pending requests are read from both the user document
+        arrays and the friendships/friend_requests collections, since both
+        friend flows are live. Always five queries, whatever the number of targets.
+        """
+        ids = list(dict.fromkeys(target_id for target_id in target_ids if target_id and target_id != viewer_id))
+        if not viewer_id or not ids:
+            return {}
+
+        viewer, friendships, requests, blocks, mutes = await asyncio.gather(
+            self.db.users.find_one(
+                {"id": viewer_id}, {"_id": 0, "friends": 1, "friendRequestsSent": 1, "friendRequestsReceived": 1}
+            ),
+            self.db.friendships.find({"$or": [
+                {"userId1": viewer_id, "userId2": {"$in": ids}},
+                {"userId2": viewer_id, "userId1": {"$in": ids}},
+            ]}, {"_id": 0, "userId1": 1, "userId2": 1}).to_list(None),
+            self.db.friend_requests.find({"status": "pending", "$or": [
+                {"fromUserId": viewer_id, "toUserId": {"$in": ids}},
+                {"toUserId": viewer_id, "fromUserId": {"$in": ids}},
+            ]}, {"_id": 0, "fromUserId": 1, "toUserId": 1}).to_list(None),
+            self.db.user_blocks.find({"$or": [
+                {"blockerId": viewer_id, "blockedId": {"$in": ids}},
+                {"blockedId": viewer_id, "blockerId": {"$in": ids}},
+            ]}, {"_id": 0, "blockerId": 1, "blockedId": 1}).to_list(None),
+            self.db.user_mutes.find(
+                {"muterId": viewer_id, "mutedId": {"$in": ids}}, {"_id": 0, "mutedId": 1}
+            ).to_list(None),
+        )
+
+        viewer = viewer or {}
+        friends = set(viewer.get("friends") or [])
+        friends.update(f["userId2"] if f["userId1"] == viewer_id else f["userId1"] for f in friendships)
+        sent = set(viewer.get("friendRequestsSent") or [])
+        sent.update(r["toUserId"] for r in requests if r["fromUserId"] == viewer_id)
+        received = set(viewer.get("friendRequestsReceived") or [])
+        received.update(r["fromUserId"] for r in requests if r["toUserId"] == viewer_id)
+        blocked = {b["blockedId"] for b in blocks if b["blockerId"] == viewer_id}
+        blocked_by = {b["blockerId"] for b in blocks if b["blockedId"] == viewer_id}
+        muted = {m["mutedId"] for m in mutes}
+
+        return {
+            target_id: {
+                "isFriend": target_id in friends,
+                "requestSent": target_id in sent,
+                "requestReceived": target_id in received,
+                "isBlocked": target_id in blocked,
+                "blockedBy": target_id in blocked_by,
+                "isMuted": target_id in muted,
+            }
+            for target_id in ids
+        }
+
+    async def related_ids(self, viewer_id: str) -> Set[str]:
+        """Everyone the viewer is friends with, has a pending request with, blocked,
+        was blocked by or muted (five queries), e.g. to exclude them from suggestions"""
+        viewer, friendships, requests, blocks, mutes = await asyncio.gather(
+            self.db.users.find_one(
+                {"id": viewer_id}, {"_id": 0, "friends": 1, "friendRequestsSent": 1, "friendRequestsReceived": 1}
+            ),
+            self.db.friendships.find(
+                {"$or": [{"userId1": viewer_id}, {"userId2": viewer_id}]}, {"_id": 0, "userId1": 1, "userId2": 1}
+            ).to_list(None),
+            self.db.friend_requests.find(
+                {"status": "pending", "$or": [{"fromUserId": viewer_id}, {"toUserId": viewer_id}]},
+                {"_id": 0, "fromUserId": 1, "toUserId": 1}
+            ).to_list(None),
+            self.db.user_blocks.find(
+                {"$or": [{"blockerId": viewer_id}, {"blockedId": viewer_id}]}, {"_id": 0, "blockerId": 1, "blockedId": 1}
+            ).to_list(None),
+            self.db.user_mutes.find({"muterId": viewer_id}, {"_id": 0, "mutedId": 1}).to_list(None),
+        )
+        viewer = viewer or {}
+        related = set(viewer.get("friends") or [])
+        related.update(viewer.get("friendRequestsSent") or [])
+        related.update(viewer.get("friendRequestsReceived") or [])
+        for pair in friendships:
+            related.update((pair["userId1"], pair["userId2"]))
+        for request in requests:
+            related.update((request["fromUserId"], request["toUserId"]))
+        for block in blocks:
+            related.update((block["blockerId"], block["blockedId"]))
+        related.update(mute["mutedId"] for mute in mutes)
+        related.discard(viewer_id)
+        return related
+
+    async def annotate(self, viewer_id: str, users: list, id_field: str = "id") -> list:
+        """Merge each user's relationship flags into the user dicts in place"""
+        if viewer_id and users:
+            relationships = await self.resolve(viewer_id, (user[id_field] for user in users))
+            for user in users:
+                user.update(relationships.get(user[id_field], {}))
+        return users
@@ -0,0 +1,181 @@
+"""
+Search Service - write-time tokenization and an inverted index for global search
+Searchable text of users, posts, tribes, venues and events is normalized and
+tokenized when a document is written. The resulting terms (every token plus its
+prefixes, for search-as-you-type) are kept in the `search_index` collection,
+whose multikey index on `terms` is the inverted index; the whole tokens are
+indexed again as `words`. Queries take documents matching every token exactly
+first and fill the remaining candidate budget with prefix matches, rank those
+by field-weighted exact/prefix hits and then load only the winning documents.
+"""
+
+import re
+import asyncio
+import logging
+import unicodedata
+from typing import Dict, List, Optional
+from pymongo import UpdateOne
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+logger = logging.getLogger(__name__)
+
+# Searchable fields and their relevance weight per collection
+SEARCH_FIELDS: Dict[str, Dict[str, float]] = {
+    "users": {"name": 3.0, "handle": 3.0},
+    "posts": {"text": 1.0},
+    "tribes": {"name": 3.0, "description": 1.0},
+    "venues": {"name": 3.0, "location": 2.0, "description": 1.0},
+    "events": {"name": 3.0, "venue": 2.0, "location": 2.0, "description": 1.0},
+}
+# Bump to force a rebuild of the index on next startup
+SEARCH_INDEX_VERSION = 2
+
+MIN_TOKEN_LENGTH = 2
+MAX_PREFIX_LENGTH = 20
+# Index entries ranked per query and collection
+MAX_CANDIDATES = 500
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase, accent-folded word tokens of at least MIN_TOKEN_LENGTH characters"""
+    if not text:
+        return []
+    folded = unicodedata.normalize("NFKD", str(text).lower())
+    folded = "".join(ch for ch in folded if not unicodedata.combining(ch))
+    return [token for token in TOKEN_PATTERN.findall(folded) if len(token) >= MIN_TOKEN_LENGTH]
+
+
+def index_terms(tokens: List[str]) -> List[str]:
+    """All indexed terms for a set of tokens: each token's prefixes from MIN_TOKEN_LENGTH up"""
+    terms = set()
+    for token in tokens:
+        for end in range(MIN_TOKEN_LENGTH, min(len(token), MAX_PREFIX_LENGTH) + 1):
+            terms.add(token[:end])
+    return sorted(terms)
+
+
+class SearchService:
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self.db = db
+
+    async def ensure_indexes(self):
+        await self.db.search_index.create_index([("collection", 1), ("terms", 1), ("createdAt", -1)])
+        await self.db.search_index.create_index([("collection", 1), ("words", 1), ("createdAt", -1)])
+        await self.db.search_index.create_index([("collection", 1), ("docId", 1)], unique=True)
+
+    def _entry(self, collection: str, doc: dict) -> dict:
+        tokens = {field: tokenize(doc.get(field)) for field in SEARCH_FIELDS[collection]}
+        all_tokens = [token for field_tokens in tokens.values() for token in field_tokens]
+        return {
+            "collection": collection,
+            "docId": doc["id"],
+            "tokens": tokens,
+            "terms": index_terms(all_tokens),
+            "words": sorted({token[:MAX_PREFIX_LENGTH] for token in all_tokens}),
+            "createdAt": doc.get("createdAt", ""),
+        }
+
+    async def index_document(self, collection: str, doc: dict):
+        """(Re)index one document whose searchable fields are all present in `doc`"""
+        try:
+            entry = self._entry(collection, doc)
+            await self.db.search_index.update_one(
+                {"collection": collection, "docId": doc["id"]}, {"$set": entry}, upsert=True
+            )
+        except Exception as e:
+            logger.error(f"Search indexing failed for {collection}/{doc.get('id')}: {e}")
+
+    async def reindex(self, collection: str, doc_id: str):
+        """Reindex after a partial update, reading the current searchable fields"""
+        projection = {"_id": 0, "id": 1, "createdAt": 1, **{field: 1 for field in SEARCH_FIELDS[collection]}}
+        doc = await self.db[collection].find_one({"id": doc_id}, projection)
+        if doc:
+            await self.index_document(collection, doc)
+
+    async def remove(self, collection: str, doc_id: str):
+        await self.db.search_index.delete_one({"collection": collection, "docId": doc_id})
+
+    async def rebuild(self, collections: Optional[List[str]] = None):
+        """Rebuild the index for whole collections (startup backfill, after seeding)"""
+        for collection in collections or list(SEARCH_FIELDS):
+            await self.db.search_index.delete_many({"collection": collection})
+            projection = {"_id": 0, "id": 1, "createdAt": 1, **{field: 1 for field in SEARCH_FIELDS[collection]}}
+            batch = []
+            async for doc in self.db[collection].find({"id": {"$exists": True}}, projection):
+                entry = self._entry(collection, doc)
+                batch.append(UpdateOne({"collection": collection, "docId": doc["id"]}, {"$set": entry}, upsert=True))
+                if len(batch) >= 1000:
+                    await self.db.search_index.bulk_write(batch, ordered=False)
+                    batch = []
+            if batch:
+                await self.db.search_index.bulk_write(batch, ordered=False)
+        await self.db.search_index_meta.update_one(
+            {"_id": "version"}, {"$set": {"version": SEARCH_INDEX_VERSION}}, upsert=True
+        )
+
+    async def ensure_built(self):
+        """Build the index once per SEARCH_INDEX_VERSION"""
+        meta = await self.db.search_index_meta.find_one({"_id": "version"})
+        if not meta or meta.get("version") != SEARCH_INDEX_VERSION:
+            await self.rebuild()
+            logger.info("Search index built")
+
+    @staticmethod
+    def _score(query_tokens: List[str], entry: dict, weights: Dict[str, float]) -> float:
+        """Field-weighted relevance: exact token hits count double, prefix hits once"""
+        score = 0.0
+        for query_token in query_tokens:
+            best = 0.0
+            for field, tokens in entry.get("tokens", {}).items():
+                weight = weights.get(field, 1.0)
+                for token in tokens:
+                    if token == query_token:
+                        best = max(best, 2 * weight)
+                    elif token.startswith(query_token):
+                        best = max(best, weight)
+            score += best
+        return score
+
+    async def search(self, collection: str, q: str, limit: int, projection: Optional[dict] = None) -> List[dict]:
+        """Top `limit` documents of `collection` matching every token of `q`, most relevant first"""
+        query_tokens = [token[:MAX_PREFIX_LENGTH] for token in tokenize(q)]
+        if not query_tokens:
+            return []
+
+        # Exact matches on every token first, then prefix-only matches, newest first within each
+        fields = {"_id": 0, "docId": 1, "tokens": 1, "createdAt": 1}
+        candidates = await self.db.search_index.find(
+            {"collection": collection, "words": {"$all": query_tokens}}, fields
+        ).sort("createdAt", -1).limit(MAX_CANDIDATES).to_list(MAX_CANDIDATES)
+        if len(candidates) < MAX_CANDIDATES:
+            remaining = MAX_CANDIDATES - len(candidates)
+            candidates += await self.db.search_index.find(
+                {"collection": collection, "terms": {"$all": query_tokens}, "words": {"$not": {"$all": query_tokens}}},
+                fields
+            ).sort("createdAt", -1).limit(remaining).to_list(remaining)
+
+        weights = SEARCH_FIELDS[collection]
+        ranked = sorted(
+            candidates,
+            key=lambda entry: (self._score(query_tokens, entry, weights), entry.get("createdAt", "")),
+            reverse=True
+        )[:limit]
+        doc_ids = [entry["docId"] for entry in ranked]
+        if not doc_ids:
+            return []
+
+        docs = await self.db[collection].find(
+            {"id": {"$in": doc_ids}}, projection or {"_id": 0}
+        ).to_list(len(doc_ids))
+        docs_by_id = {doc["id"]: doc for doc in docs}
+        return [docs_by_id[doc_id] for doc_id in doc_ids if doc_id in docs_by_id]
+
+    async def search_many(self, collections: List[str], q: str, limit: int, projections: Optional[dict] = None) -> Dict[str, List[dict]]:
+        """Run the per-collection searches concurrently"""
+        projections = projections or {}
+        results = await asyncio.gather(*[
+            self.search(collection, q, limit, projections.get(collection)) for collection in collections
+        ])
+        return dict(zip(collections, results))
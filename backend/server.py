@@ -1,10 +1,11 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Body, UploadFile, File, Depends
-from fastapi.responses import Response
+from fastapi import FastAPI, APIRouter, HTTPException, Body, UploadFile, File, Depends, Header, Request, Query
+from fastapi.responses import Response, StreamingResponse, FileResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument, UpdateOne
 import socketio
 import os
 import logging
@@ -17,14 +18,35 @@ import shutil
 import random
 import razorpay
 import jwt
-import qrcode
 import io
 import base64
+import json
+import re
+import asyncio
 from PIL import Image
 
 # Import the Google Sheets database module
 from messenger_service import MessengerService, SendMessageRequest, AIMessageRequest, UpdateReadStatusRequest
-from auth_service import AuthService
+from auth_service import AuthService, AuthOverloaded
+from timeline_service import TimelineService
+from reactions_service import ReactionService
+from counter_buffer import CounterBuffer
+from hashtag_service import HashtagService, extract_hashtags, normalize_hashtag
+from trending_service import TrendingRanker
+from search_service import SearchService
+from relationship_service import RelationshipService, relationship_status
+from social_graph_service import SocialGraphService, user_counts
+from media_store import MediaStore, MediaTooLarge, UnsupportedMedia, RangeNotSatisfiable, parse_byte_range, etag_for, etag_matches
+from upload_stream import multipart_file_stream, FilePartHeader, UploadStreamError
+from image_variants import ImageVariantService, VARIANT_SIZES, VARIANT_FORMATS
+from media_cache import MediaDiskCache
+from ticket_qr_service import TicketQRService, ticket_qr_url
+from session_registry import SessionRegistry
+from realtime_backend import create_realtime_backend
+from chat_sessions import SharedChatSessions, with_history
+from thread_participants import ThreadParticipantCache
+from typing_throttle import TypingThrottle
+from presence_service import PresenceService
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -48,9 +70,14 @@ security = HTTPBearer()
 app = FastAPI()
 api_router = APIRouter(prefix="/api")
 
+# Socket.io fan-out and shared realtime state: in-process, or a local broker
+# shared by every worker when REALTIME_BROKER=unix:///path/to.sock
+realtime = create_realtime_backend(os.environ.get('REALTIME_BROKER'))
+
 # Create Socket.IO server
 sio = socketio.AsyncServer(
     async_mode='asgi',
+    client_manager=realtime.client_manager,
     cors_allowed_origins='*',  # In production, restrict this
     logger=True,
     engineio_logger=True
@@ -60,8 +87,11 @@ sio = socketio.AsyncServer(
 sio_asgi_app = socketio.ASGIApp(sio)
 app.mount('/socket.io', sio_asgi_app)
 
-# Store connected clients: {userId: sid}
-connected_clients = {}
+# Connected socket sessions: userId -> sids (every device) and sid -> userId
+sessions = SessionRegistry()
+
+# Online status from socket connections (per-user worker counts are shared by all workers)
+presence = PresenceService(db, realtime.state.namespace("socket-presence"))
 
 # Create uploads directory
 UPLOAD_DIR = Path("/app/backend/uploads")
@@ -146,8 +176,6 @@ class Post(BaseModel):
     audience: str = "public"
     hashtags: List[str] = Field(default_factory=list)
     stats: dict = Field(default_factory=lambda: {"likes": 0, "quotes": 0, "reposts": 0, "replies": 0})
-    likedBy: List[str] = Field(default_factory=list)
-    repostedBy: List[str] = Field(default_factory=list)
     createdAt: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
     # Twitter-style features
     quotedPostId: Optional[str] = None
@@ -168,7 +196,6 @@ class Reel(BaseModel):
     thumb: str
     caption: str = ""
     stats: dict = Field(default_factory=lambda: {"views": 0, "likes": 0, "comments": 0})
-    likedBy: List[str] = Field(default_factory=list)
     createdAt: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
 
 class ReelCreate(BaseModel):
@@ -417,6 +444,14 @@ class EventTicket(BaseModel):
     purchasedAt: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
     usedAt: Optional[str] = None
 
+class TicketScan(BaseModel):
+    payload: str  # QR code text as read by the scanner
+    scannedAt: Optional[str] = None
+    gateId: Optional[str] = None
+
+class TicketScanBatch(BaseModel):
+    scans: List[TicketScan]
+
 class UserInterest(BaseModel):
     model_config = ConfigDict(extra="ignore")
     userId: str
@@ -597,26 +632,41 @@ def create_access_token(user_id: str) -> str:
     token = jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
     return token
 
-def verify_token(token: str) -> Optional[str]:
-    """Verify a JWT token and return the user_id if valid"""
+def decode_token(token: str) -> Optional[dict]:
+    """Verify a JWT token and return its claims if valid"""
     try:
-        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        return payload.get('sub')
+        return jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
     except jwt.ExpiredSignatureError:
         return None
     except jwt.InvalidTokenError:
         return None
 
+def verify_token(token: str) -> Optional[str]:
+    """Verify a JWT token and return the user_id if valid"""
+    payload = decode_token(token)
+    return payload.get('sub') if payload else None
+
+def authenticated_user_id(token: str) -> Optional[str]:
+    """verify_token through the auth cache (a cached token is never trusted past its exp)"""
+    user_id = auth_service.user_cache.get_token(token)
+    if user_id:
+        return user_id
+    payload = decode_token(token)
+    if not payload or not payload.get('sub'):
+        return None
+    auth_service.user_cache.put_token(token, payload['sub'], payload.get('exp'))
+    return payload['sub']
+
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
     """Dependency to get the current authenticated user"""
     token = credentials.credentials
-    user_id = verify_token(token)
+    user_id = authenticated_user_id(token)
     
     if not user_id:
         raise HTTPException(status_code=401, detail="Invalid or expired token")
     
-    # Get user from MongoDB via auth_service
-    user = await auth_service.get_user_by_id(user_id)
+    # Get user from the auth cache, falling back to MongoDB
+    user = await auth_service.get_cached_user(user_id)
     if not user:
         raise HTTPException(status_code=401, detail="User not found")
     
@@ -625,29 +675,102 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
 # ===== WEBSOCKET HELPERS =====
 
 async def emit_to_user(user_id: str, event: str, data: dict):
-    """Emit event to a specific user if they're connected"""
-    if user_id in connected_clients:
-        sid = connected_clients[user_id]
-        await sio.emit(event, data, room=sid)
-        logging.info(f"✅ Emitted '{event}' to user {user_id} (sid: {sid})")
-    else:
-        logging.warning(f"⚠️ User {user_id} not found in connected_clients. Cannot emit '{event}'. Connected users: {list(connected_clients.keys())}")
-    return user_id in connected_clients
+    """Emit event to every connected device of a user"""
+    if user_id in sessions or await presence.is_online(user_id):
+        # Each session joins the user's personal room on connect; the client
+        # manager delivers to sessions held by other workers
+        await sio.emit(event, data, room=f"user:{user_id}")
+        logging.info(f"✅ Emitted '{event}' to user {user_id} ({len(sessions.sids_for(user_id))} local sessions)")
+        return True
+    logging.warning(f"⚠️ User {user_id} is not connected. Cannot emit '{event}'")
+    return False
+
+# Participants of DM threads and messenger threads, cached for socket fan-out
+dm_thread_participants = ThreadParticipantCache(db.dm_threads)
+messenger_thread_participants = ThreadParticipantCache(db.threads)
 
 # Initialize Messenger Service
-messenger_service = MessengerService(db, emit_to_user)
+messenger_service = MessengerService(
+    db, emit_to_user, SharedChatSessions(realtime.state.namespace("messenger-ai-sessions")), presence
+)
 
 # Initialize Auth Service
 auth_service = AuthService(db)
 
+# Initialize Home Timeline Service
+timeline_service = TimelineService(db)
+
+# Initialize Reactions Service (likes/reposts edges)
+reaction_service = ReactionService(db)
+
+# Write-behind buffer for high-frequency counters (reel views)
+counter_buffer = CounterBuffer(db)
+
+# Initialize Hashtag Service (write-time extraction + trending buckets)
+hashtag_service = HashtagService(db)
+
+# Time-decayed trending posts ranking, fed by engagement events
+trending_ranker = TrendingRanker(db)
+
+# Write-time inverted index for global search
+search_service = SearchService(db)
+
+# Bulk viewer-to-user relationship flags (friend/pending/blocked/muted)
+relationship_service = RelationshipService(db)
+
+# Friend/follow edges with denormalized profile counters
+social_graph = SocialGraphService(db)
+
+# Chunked GridFS storage for uploaded media
+media_store = MediaStore(db)
+
+# Resized image renditions, rendered in a process pool
+image_variants = ImageVariantService(media_store)
+
+# Local-disk LRU copy of hot media, in front of GridFS (kept outside the public /uploads mount)
+MEDIA_CACHE_DIR = Path(os.environ.get('MEDIA_CACHE_DIR', str(UPLOAD_DIR.parent / "media-cache")))
+media_cache = MediaDiskCache(MEDIA_CACHE_DIR)
+
+# Event ticket QR images (HMAC-signed payloads), rendered in a process pool and stored as PNG
+ticket_qr = TicketQRService(db, os.environ.get('TICKET_SIGNING_SECRET') or JWT_SECRET)
+
+async def emit_presence(user_id: str, online: bool):
+    """Push a presence change to the sockets subscribed to this user (their friends)"""
+    await sio.emit('presence', {
+        'userId': user_id,
+        'online': online,
+        'lastSeen': presence.last_seen(user_id)
+    }, room=f"presence:{user_id}")
+
 async def emit_to_thread(thread_id: str, event: str, data: dict, exclude_user: str = None):
     """Emit event to all users in a thread"""
-    # Get thread participants
-    thread = await db.dm_threads.find_one({"id": thread_id}, {"_id": 0})
-    if thread:
-        for user_id in [thread['user1Id'], thread['user2Id']]:
-            if user_id != exclude_user:
-                await emit_to_user(user_id, event, data)
+    # Get thread participants (cached; membership never changes)
+    participants = await dm_thread_participants.get(thread_id)
+    for user_id in participants or ():
+        if user_id != exclude_user:
+            await emit_to_user(user_id, event, data)
+
+async def emit_typing(participants, thread_id: str, user_id: str, is_typing: bool):
+    """Emit a typing state change to the other participants of a messenger thread"""
+    for recipient_id in participants:
+        if recipient_id != user_id:
+            await emit_to_user(recipient_id, 'user_typing', {
+                'threadId': thread_id,
+                'userId': user_id,
+                'typing': is_typing
+            })
+
+async def expire_typing(thread_id: str, user_id: str):
+    """Typing went silent without a stop event: tell the others it stopped"""
+    participants = await messenger_thread_participants.get(thread_id)
+    if participants:
+        await emit_typing(participants, thread_id, user_id, False)
+
+# Upper bound on the users one presence_subscribe call can follow
+MAX_PRESENCE_SUBSCRIPTIONS = 1000
+
+# Per (thread, user) typing state: emits transitions and throttled refreshes only
+typing_throttle = TypingThrottle(on_expire=expire_typing)
 
 def get_canonical_friend_order(user_a: str, user_b: str) -> tuple:
     """Return users in canonical order (lexicographic)"""
@@ -666,6 +789,113 @@ async def is_blocked(blocker: str, blocked: str) -> bool:
     block = await db.user_blocks.find_one({"blockerId": blocker, "blockedId": blocked}, {"_id": 0})
     return block is not None
 
+# ===== BATCH HYDRATION HELPERS =====
+
+async def get_users_by_ids(user_ids, cache: dict = None) -> dict:
+    """Resolve user IDs to user docs with a single $in query.
+
+    `cache` is a per-request {userId: user} dedupe map: IDs already in it are not
+    fetched again and new results are added to it, so several hydration passes
+    within one request share lookups. Unknown IDs map to None.
+    """
+    cache = {} if cache is None else cache
+    missing = {user_id for user_id in user_ids if user_id and user_id not in cache}
+    if missing:
+        users = await db.users.find(
+            {"id": {"$in": list(missing)}},
+            {"_id": 0, "password": 0}
+        ).to_list(len(missing))
+        for user in users:
+            cache[user["id"]] = user
+        for user_id in missing:
+            cache.setdefault(user_id, None)
+    return cache
+
+async def attach_authors(items: list, id_field: str = "authorId", target_field: str = "author", cache: dict = None, shape=None) -> list:
+    """Attach the user referenced by `id_field` to every item as `target_field`.
+
+    A page of results costs one users query no matter how many items it has.
+    `shape` optionally maps a user doc to the public representation embedded.
+    """
+    users = await get_users_by_ids((item.get(id_field) for item in items), cache)
+    for item in items:
+        user = users.get(item.get(id_field))
+        item[target_field] = shape(user) if user and shape else user
+    return items
+
+# ===== KEYSET PAGINATION HELPERS =====
+
+def encode_cursor(doc: dict) -> str:
+    """Opaque cursor pointing just past `doc` in (createdAt, id) descending order"""
+    raw = json.dumps([doc["createdAt"], doc["id"]], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> tuple:
+    """Decode a cursor produced by encode_cursor into (createdAt, id)"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, item_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return str(created_at), str(item_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+async def fetch_page(collection, query: dict, cursor: Optional[str], limit: int, projection: Optional[dict] = None) -> tuple:
+    """Fetch one newest-first page of `collection` after `cursor`.
+
+    Uses a range on the (createdAt, id) index instead of skip/offset, so deep
+    pages cost the same as the first one. Returns (items, next_cursor).
+    """
+    if limit < 1:
+        raise HTTPException(status_code=400, detail="limit must be at least 1")
+    if cursor:
+        created_at, item_id = decode_cursor(cursor)
+        after = {"$or": [
+            {"createdAt": {"$lt": created_at}},
+            {"createdAt": created_at, "id": {"$lt": item_id}}
+        ]}
+        query = {"$and": [query, after]} if query else after
+    
+    items = await collection.find(query, projection).sort(
+        [("createdAt", -1), ("id", -1)]
+    ).limit(limit + 1).to_list(limit + 1)
+    
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = encode_cursor(items[-1])
+    return items, next_cursor
+
+def paginated_response(items: list, next_cursor: Optional[str], cursor: Optional[str]):
+    """Plain list for legacy callers, {items, nextCursor} once a client opts into cursors"""
+    if cursor is None:
+        return items
+    return {"items": items, "nextCursor": next_cursor}
+
+async def attach_viewer_reactions(items: list, content_type: str, viewer_id: Optional[str]) -> list:
+    """Fill likedBy/repostedBy with the viewer's own reactions for a page of posts or reels.
+
+    Reactions live in their own collection, so these arrays are viewer-scoped:
+    they contain `viewer_id` when that user reacted and are empty otherwise.
+    """
+    if not viewer_id:
+        return items
+    reacted = await reaction_service.viewer_reactions(content_type, [item["id"] for item in items], viewer_id)
+    for item in items:
+        kinds = reacted.get(item["id"], set())
+        item["likedBy"] = [viewer_id] if "like" in kinds else []
+        if content_type == "post":
+            item["repostedBy"] = [viewer_id] if "repost" in kinds else []
+    return items
+
+def author_summary(user: dict) -> dict:
+    """Compact author representation embedded in reels and capsules"""
+    return {
+        "id": user["id"],
+        "handle": user["handle"],
+        "name": user["name"],
+        "avatar": user.get("avatar", "")
+    }
+
 # ===== WEBSOCKET EVENT HANDLERS =====
 
 @sio.event
@@ -684,10 +914,10 @@ async def connect(sid, environ, auth):
             logging.warning(f"Connection rejected: invalid token")
             return False
         
-        # Store connection
-        connected_clients[user_id] = sid
-        logging.info(f"✅ User {user_id} connected with sid {sid}. Total connected: {len(connected_clients)}")
-        logging.info(f"📊 Connected users: {list(connected_clients.keys())}")
+        # Store connection (a user may have several devices connected)
+        if sessions.add(user_id, sid) and await presence.connected(user_id):
+            await emit_presence(user_id, True)
+        logging.info(f"✅ User {user_id} connected with sid {sid}. Total connected: {len(sessions)}")
         
         # Join personal room
         await sio.enter_room(sid, f"user:{user_id}")
@@ -703,40 +933,56 @@ async def disconnect(sid):
     """Handle client disconnection"""
     try:
         # Find and remove user
-        user_id = None
-        for uid, client_sid in list(connected_clients.items()):
-            if client_sid == sid:
-                user_id = uid
-                del connected_clients[uid]
-                break
+        user_id = sessions.remove(sid)
         
         if user_id:
-            logging.info(f"User {user_id} disconnected")
+            remaining = len(sessions.sids_for(user_id))
+            if not remaining and await presence.disconnected(user_id):
+                await emit_presence(user_id, False)
+            logging.info(f"User {user_id} disconnected sid {sid} ({remaining} sessions left)")
     except Exception as e:
         logging.error(f"Disconnect error: {e}")
 
 @sio.event
-async def typing(sid, data):
-    """Handle typing indicator"""
+async def heartbeat(sid, data=None):
+    """Client keep-alive: refreshes the user's last-seen time"""
+    user_id = sessions.user_for(sid)
+    if user_id:
+        presence.heartbeat(user_id)
+
+@sio.event
+async def presence_subscribe(sid, data):
+    """Follow the presence of some friends; returns their current state as the ack"""
     try:
-        thread_id = data.get('threadId')
-        user_id = None
+        user_id = sessions.user_for(sid)
+        if not user_id:
+            return {}
         
-        # Find user_id from sid
-        for uid, client_sid in connected_clients.items():
-            if client_sid == sid:
-                user_id = uid
-                break
+        # Only friends' presence can be followed
+        user = await auth_service.get_cached_user(user_id)
+        friends = set(user.get("friends", [])) if user else set()
+        targets = [target for target in (data or {}).get('userIds', [])[:MAX_PRESENCE_SUBSCRIPTIONS] if target in friends]
         
-        if user_id and thread_id:
-            await emit_to_thread(thread_id, 'typing', {
-                'threadId': thread_id,
-                'userId': user_id,
-                'isTyping': data.get('isTyping', True),
-                'timestamp': datetime.now(timezone.utc).isoformat()
-            }, exclude_user=user_id)
+        for target in targets:
+            await sio.enter_room(sid, f"presence:{target}")
+        
+        online = await presence.online_map(targets)
+        return {
+            target: {"online": online[target], "lastSeen": presence.last_seen(target)}
+            for target in targets
+        }
     except Exception as e:
-        logging.error(f"Typing event error: {e}")
+        logging.error(f"Presence subscribe error: {e}")
+        return {}
+
+@sio.event
+async def presence_unsubscribe(sid, data):
+    """Stop following the presence of some users"""
+    try:
+        for target in (data or {}).get('userIds', []):
+            await sio.leave_room(sid, f"presence:{target}")
+    except Exception as e:
+        logging.error(f"Presence unsubscribe error: {e}")
 
 @sio.event
 async def message_read(sid, data):
@@ -744,13 +990,9 @@ async def message_read(sid, data):
     try:
         message_id = data.get('messageId')
         thread_id = data.get('threadId')
-        user_id = None
         
         # Find user_id from sid
-        for uid, client_sid in connected_clients.items():
-            if client_sid == sid:
-                user_id = uid
-                break
+        user_id = sessions.user_for(sid)
         
         if user_id and message_id:
             # Update message read status
@@ -794,8 +1036,10 @@ async def leave_thread(sid, data):
 
 # ===== WEBRTC SIGNALING =====
 
-# Store active calls: {callId: {callerId, calleeId, threadId, status}}
-active_calls = {}
+# Active calls, shared by all workers: {callId: {callerId, calleeId, threadId, status}}
+active_calls = realtime.state.namespace("active-calls")
+# Refreshed on every state change; bounds calls that never got a call_end
+ACTIVE_CALL_TTL = int(os.environ.get('ACTIVE_CALL_TTL', str(4 * 3600)))
 
 @sio.event
 async def call_initiate(sid, data):
@@ -803,34 +1047,30 @@ async def call_initiate(sid, data):
     try:
         thread_id = data.get('threadId')
         is_video = data.get('isVideo', False)
-        caller_id = None
         
         # Find caller
-        for uid, client_sid in connected_clients.items():
-            if client_sid == sid:
-                caller_id = uid
-                break
+        caller_id = sessions.user_for(sid)
         
         if not caller_id or not thread_id:
             return
         
-        # Get thread to find callee
-        thread = await db.dm_threads.find_one({"id": thread_id}, {"_id": 0})
-        if not thread:
+        # Get thread participants to find callee
+        participants = await dm_thread_participants.get(thread_id)
+        if not participants or caller_id not in participants:
             return
         
-        callee_id = thread["user2Id"] if thread["user1Id"] == caller_id else thread["user1Id"]
+        callee_id = participants[1] if participants[0] == caller_id else participants[0]
         
         # Create call record
         call_id = str(uuid.uuid4())
-        active_calls[call_id] = {
+        await active_calls.set(call_id, {
             'callerId': caller_id,
             'calleeId': callee_id,
             'threadId': thread_id,
             'isVideo': is_video,
             'status': 'ringing',
             'startedAt': datetime.now(timezone.utc).isoformat()
-        }
+        }, ttl=ACTIVE_CALL_TTL)
         
         # Save to database
         await db.calls.insert_one({
@@ -865,11 +1105,11 @@ async def call_answer(sid, data):
     """Answer a call"""
     try:
         call_id = data.get('callId')
-        if call_id not in active_calls:
+        call = await active_calls.get(call_id)
+        if not call:
             return
-        
-        call = active_calls[call_id]
         call['status'] = 'connected'
+        await active_calls.set(call_id, call, ttl=ACTIVE_CALL_TTL)
         
         # Update database
         await db.calls.update_one(
@@ -889,11 +1129,10 @@ async def call_reject(sid, data):
     """Reject a call"""
     try:
         call_id = data.get('callId')
-        if call_id not in active_calls:
+        call = await active_calls.get(call_id)
+        if not call:
             return
         
-        call = active_calls[call_id]
-        
         # Update database
         await db.calls.update_one(
             {"id": call_id},
@@ -904,7 +1143,7 @@ async def call_reject(sid, data):
         await emit_to_user(call['callerId'], 'call_rejected', {'callId': call_id})
         
         # Remove from active calls
-        del active_calls[call_id]
+        await active_calls.delete(call_id)
         
     except Exception as e:
         logging.error(f"Call reject error: {e}")
@@ -914,11 +1153,10 @@ async def call_end(sid, data):
     """End a call"""
     try:
         call_id = data.get('callId')
-        if call_id not in active_calls:
+        call = await active_calls.get(call_id)
+        if not call:
             return
         
-        call = active_calls[call_id]
-        
         # Update database
         await db.calls.update_one(
             {"id": call_id},
@@ -930,7 +1168,7 @@ async def call_end(sid, data):
         await emit_to_user(call['calleeId'], 'call_ended', {'callId': call_id})
         
         # Remove from active calls
-        del active_calls[call_id]
+        await active_calls.delete(call_id)
         
     except Exception as e:
         logging.error(f"Call end error: {e}")
@@ -942,17 +1180,12 @@ async def webrtc_offer(sid, data):
         call_id = data.get('callId')
         sdp = data.get('sdp')
         
-        if call_id not in active_calls:
+        call = await active_calls.get(call_id)
+        if not call:
             return
         
-        call = active_calls[call_id]
-        user_id = None
-        
         # Find sender
-        for uid, client_sid in connected_clients.items():
-            if client_sid == sid:
-                user_id = uid
-                break
+        user_id = sessions.user_for(sid)
         
         if not user_id:
             return
@@ -974,17 +1207,12 @@ async def webrtc_answer(sid, data):
         call_id = data.get('callId')
         sdp = data.get('sdp')
         
-        if call_id not in active_calls:
+        call = await active_calls.get(call_id)
+        if not call:
             return
         
-        call = active_calls[call_id]
-        user_id = None
-        
         # Find sender
-        for uid, client_sid in connected_clients.items():
-            if client_sid == sid:
-                user_id = uid
-                break
+        user_id = sessions.user_for(sid)
         
         if not user_id:
             return
@@ -1006,17 +1234,12 @@ async def webrtc_ice_candidate(sid, data):
         call_id = data.get('callId')
         candidate = data.get('candidate')
         
-        if call_id not in active_calls:
+        call = await active_calls.get(call_id)
+        if not call:
             return
         
-        call = active_calls[call_id]
-        user_id = None
-        
         # Find sender
-        for uid, client_sid in connected_clients.items():
-            if client_sid == sid:
-                user_id = uid
-                break
+        user_id = sessions.user_for(sid)
         
         if not user_id:
             return
@@ -1036,31 +1259,22 @@ async def typing(sid, data):
     """Handle typing indicator"""
     try:
         thread_id = data.get('threadId')
-        user_id = None
         
         # Find sender
-        for uid, client_sid in connected_clients.items():
-            if client_sid == sid:
-                user_id = uid
-                break
+        user_id = sessions.user_for(sid)
         
         if not user_id or not thread_id:
             return
         
-        # Get thread to find recipient
-        thread = await db.threads.find_one({"id": thread_id})
-        if not thread:
+        # Get thread participants to find recipient (cached: no database access per keystroke)
+        participants = await messenger_thread_participants.get(thread_id)
+        if not participants or user_id not in participants:
             return
         
-        # Get other participant
-        recipient_id = [p for p in thread["participants"] if p != user_id][0]
-        
-        # Emit typing event to recipient
-        await emit_to_user(recipient_id, 'user_typing', {
-            'threadId': thread_id,
-            'userId': user_id,
-            'typing': data.get('typing', True)
-        })
+        # Only started/stopped transitions and periodic refreshes are broadcast
+        is_typing = bool(data.get('typing', data.get('isTyping', True)))
+        if typing_throttle.update(thread_id, user_id, is_typing):
+            await emit_typing(participants, thread_id, user_id, is_typing)
         
     except Exception as e:
         logging.error(f"Typing indicator error: {e}")
@@ -1082,6 +1296,13 @@ class SignupRequest(BaseModel):
     name: str
     handle: Optional[str] = None
 
+def auth_overloaded_error() -> HTTPException:
+    """503 for a full password hashing queue; clients should back off and retry"""
+    return HTTPException(
+        status_code=503, detail="Too many sign-in attempts right now, please retry shortly",
+        headers={"Retry-After": "1"}
+    )
+
 @api_router.post("/auth/signup", response_model=dict)
 async def signup(req: SignupRequest):
     """
@@ -1096,6 +1317,7 @@ async def signup(req: SignupRequest):
             name=req.name,
             handle=req.handle
         )
+        await search_service.index_document("users", user)
         
         # Generate JWT token
         token = create_access_token(user['id'])
@@ -1110,6 +1332,8 @@ async def signup(req: SignupRequest):
     
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    except AuthOverloaded:
+        raise auth_overloaded_error()
     except Exception as e:
         logger.error(f"Signup error: {str(e)}")
         raise HTTPException(status_code=500, detail="Signup failed")
@@ -1151,11 +1375,11 @@ async def login(req: LoginRequest):
                             "handle": test_user_data["handle"],
                             "name": test_user_data["name"],
                             "email": test_user_data["email"],
-                            "password": auth_service.hash_password(test_user_data["password"]),
+                            "password": await auth_service.hash_password(test_user_data["password"]),
                             "avatar": f"https://api.dicebear.com/7.x/avataaars/svg?seed={test_user_data['handle']}",
                             "isVerified": True,
                             "online": False,
-                            "friends": [user['id']],
+                            "friends": [],
                             "friendRequestsSent": [],
                             "friendRequestsReceived": [],
                             "bio": "Test user for demo purposes",
@@ -1164,21 +1388,13 @@ async def login(req: LoginRequest):
                             "createdAt": datetime.now(timezone.utc).isoformat()
                         }
                         await db.users.insert_one(test_user)
+                        await search_service.index_document("users", test_user)
                         logger.info(f"✅ Created test user: {test_user_data['name']}")
-                    else:
-                        if user['id'] not in existing.get('friends', []):
-                            await db.users.update_one(
-                                {"id": test_user_data["id"]},
-                                {"$addToSet": {"friends": user['id']}}
-                            )
                     
+                    await social_graph.add_friend(user['id'], test_user_data["id"])
                     updated_friends.append(test_user_data["id"])
                 
                 if updated_friends:
-                    await db.users.update_one(
-                        {"id": user['id']},
-                        {"$set": {"friends": updated_friends}}
-                    )
                     user['friends'] = updated_friends
                     logger.info(f"✅ Demo user now has {len(updated_friends)} friends")
             
@@ -1201,6 +1417,8 @@ async def login(req: LoginRequest):
     
     except HTTPException:
         raise
+    except AuthOverloaded:
+        raise auth_overloaded_error()
     except Exception as e:
         logger.error(f"Login error: {str(e)}")
         raise HTTPException(status_code=500, detail="Login failed")
@@ -1214,11 +1432,20 @@ async def get_me(current_user: dict = Depends(get_current_user)):
     # The current_user is already the complete user data from auth_service
     return current_user
 
+@api_router.post("/auth/logout")
+async def logout(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    """Log out: drop the user's cached sessions on this worker (presence follows their sockets)"""
+    user_id = authenticated_user_id(credentials.credentials)
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+    auth_service.user_cache.revoke_tokens(user_id)
+    return {"success": True, "message": "Logged out"}
+
 # ===== USER ROUTES =====
 
 
 @api_router.get("/users/search")
-async def search_users(q: str, limit: int = 20):
+async def search_users(q: str, limit: int = 20, currentUserId: Optional[str] = None):
     """Search users by name or handle"""
     if not q or len(q.strip()) < 2:
         return []
@@ -1232,6 +1459,7 @@ async def search_users(q: str, limit: int = 20):
     }
     
     users = await db.users.find(query, {"_id": 0, "password": 0}).limit(limit).to_list(limit)
+    await relationship_service.annotate(currentUserId, users)
     return users
 
 @api_router.get("/users")
@@ -1249,70 +1477,50 @@ async def get_user(userId: str):
 
 
 @api_router.get("/users/{userId}/profile")
-async def get_user_profile(userId: str, currentUserId: str = None):
-    """Get user profile with posts, followers, and following counts"""
-    user = await db.users.find_one({"id": userId}, {"_id": 0})
+async def get_user_profile(userId: str, currentUserId: str = None, limit: int = Query(20, ge=1, le=100)):
+    """Get user profile with the first page of posts and follower, following, friend and post counts.
+
+    Counts come from the counters on the user document; the user, posts page
+    and viewer relationship are read concurrently. Further posts are paged via
+    /users/{userId}/posts with the returned `nextCursor`.
+    """
+    viewer_id = currentUserId if currentUserId and currentUserId != userId else None
+    user, (posts, next_cursor), relationships = await asyncio.gather(
+        db.users.find_one({"id": userId}, {"_id": 0, "password": 0}),
+        fetch_page(db.posts, {"authorId": userId}, None, limit, {"_id": 0}),
+        relationship_service.resolve(viewer_id, [userId])
+    )
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    # Get user's posts
-    posts = await db.posts.find({"authorId": userId}, {"_id": 0}).sort("createdAt", -1).to_list(100)
     for post in posts:
         post["author"] = user
+    await attach_viewer_reactions(posts, "post", currentUserId)
     
-    # Count followers (users who are friends with this user)
-    followers_count = 0
-    following_count = 0
-    
-    # Count friendships where this user is user1
-    count1 = await db.friendships.count_documents({"userId1": userId})
-    # Count friendships where this user is user2
-    count2 = await db.friendships.count_documents({"userId2": userId})
-    
-    # Total friends count (each friendship is bidirectional)
-    friends_count = count1 + count2
-    
-    # For now, followers = following = friends count (simplified friend model)
-    followers_count = friends_count
-    following_count = friends_count
-    
-    # Check relationship status if currentUserId provided
-    relationship_status = None
-    if currentUserId and currentUserId != userId:
-        # Check if friends
-        is_friend = await are_friends(currentUserId, userId)
-        if is_friend:
-            relationship_status = "friends"
-        else:
-            # Check friend requests
-            sent_request = await db.friend_requests.find_one({
-                "fromUserId": currentUserId,
-                "toUserId": userId,
-                "status": "pending"
-            }, {"_id": 0})
-            
-            received_request = await db.friend_requests.find_one({
-                "fromUserId": userId,
-                "toUserId": currentUserId,
-                "status": "pending"
-            }, {"_id": 0})
-            
-            if sent_request:
-                relationship_status = "pending_sent"
-            elif received_request:
-                relationship_status = "pending_received"
-            else:
-                relationship_status = None
+    counts = user_counts(user)
+    relationship = relationships.get(userId, {})
     
     return {
         "user": user,
         "posts": posts,
-        "followersCount": followers_count,
-        "followingCount": following_count,
-        "postsCount": len(posts),
-        "relationshipStatus": relationship_status
+        "nextCursor": next_cursor,
+        # Simplified friend model: followers = following = friends
+        "followersCount": counts["friends"],
+        "followingCount": counts["friends"],
+        "friendsCount": counts["friends"],
+        "postsCount": counts["posts"],
+        "relationshipStatus": relationship_status(relationship),
+        "relationship": relationship or None
     }
 
+@api_router.get("/users/{userId}/posts")
+async def get_user_posts(userId: str, cursor: str = "", limit: int = Query(20, ge=1, le=100), currentUserId: Optional[str] = None):
+    """A user's posts, newest first, continuing from a profile's `nextCursor`"""
+    posts, next_cursor = await fetch_page(db.posts, {"authorId": userId}, cursor, limit, {"_id": 0})
+    await attach_authors(posts)
+    await attach_viewer_reactions(posts, "post", currentUserId)
+    return {"items": posts, "nextCursor": next_cursor}
+
 @api_router.put("/users/{userId}")
 async def update_user(userId: str, data: dict):
     """Update user profile"""
@@ -1330,6 +1538,10 @@ async def update_user(userId: str, data: dict):
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="User not found")
     
+    auth_service.user_cache.invalidate_user(userId)
+    if "name" in update_data or "handle" in update_data:
+        await search_service.reindex("users", userId)
+    
     return {"success": True, "message": "Profile updated"}
 
 @api_router.get("/users/{userId}/settings")
@@ -1357,7 +1569,19 @@ async def get_user_settings(userId: str):
 
 @api_router.put("/users/{userId}/settings")
 async def update_user_settings(userId: str, settings: dict):
-    """Update user settings"""
+    """Update user settings; profile fields in the body are written to the user"""
+    # Profile edits are sent here too (Edit Profile modal)
+    profile_fields = ["name", "bio", "avatar", "location", "website", "interests"]
+    profile_data = {k: settings.pop(k) for k in profile_fields if k in settings}
+    
+    if profile_data:
+        result = await db.users.update_one({"id": userId}, {"$set": profile_data})
+        if result.matched_count == 0:
+            raise HTTPException(status_code=404, detail="User not found")
+        auth_service.user_cache.invalidate_user(userId)
+        if "name" in profile_data:
+            await search_service.reindex("users", userId)
+    
     settings["userId"] = userId
     
     await db.user_settings.update_one(
@@ -1401,18 +1625,18 @@ async def change_password(data: dict):
     current_password = data.get("currentPassword")
     new_password = data.get("newPassword")
     
-    # Verify current password with Google Sheets DB
-    user = sheets_db.find_user_by_id(userId)
+    user = await db.users.find_one({"id": userId}, {"_id": 0, "id": 1})
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    # Verify current password
-    if not sheets_db.verify_password(user.get("email"), current_password):
+    # Verify and rehash on the bounded bcrypt pool (also revokes existing tokens)
+    try:
+        changed = await auth_service.update_password(userId, current_password, new_password)
+    except AuthOverloaded:
+        raise auth_overloaded_error()
+    if not changed:
         raise HTTPException(status_code=401, detail="Current password is incorrect")
     
-    # Update password in Google Sheets
-    sheets_db.update_user_password(user.get("email"), new_password)
-    
     return {"success": True, "message": "Password changed successfully"}
 
 @api_router.post("/auth/verify-email")
@@ -1563,10 +1787,11 @@ async def reset_password(data: dict):
         if datetime.now(timezone.utc) > expires:
             raise HTTPException(status_code=400, detail="Reset code has expired")
     
-    # Update password in Google Sheets
-    sheets_user = sheets_db.find_user_by_email(email)
-    if sheets_user:
-        sheets_db.update_user_password(email, new_password)
+    # Hash on the bounded bcrypt pool (also revokes existing tokens)
+    try:
+        await auth_service.reset_password(email, new_password)
+    except AuthOverloaded:
+        raise auth_overloaded_error()
     
     # Clear reset token
     await db.users.update_one(
@@ -1587,64 +1812,17 @@ async def search_all(q: str, currentUserId: str = None, limit: int = 20):
     if not q or len(q) < 2:
         return {"users": [], "posts": [], "tribes": [], "venues": [], "events": []}
     
-    query_pattern = {"$regex": q, "$options": "i"}
-    
-    # Search users
-    users = await db.users.find({
-        "$or": [
-            {"name": query_pattern},
-            {"handle": query_pattern}
-        ]
-    }, {"_id": 0}).limit(limit).to_list(limit)
-    
-    # Enrich users with friend status if currentUserId provided
-    if currentUserId:
-        for user in users:
-            user["isFriend"] = await are_friends(currentUserId, user["id"])
-            user["isBlocked"] = await is_blocked(currentUserId, user["id"])
+    results = await search_service.search_many(
+        ["users", "posts", "tribes", "venues", "events"], q, limit,
+        projections={"users": {"_id": 0, "password": 0}}
+    )
     
-    # Search posts
-    posts = await db.posts.find({
-        "text": query_pattern
-    }, {"_id": 0}).sort("createdAt", -1).limit(limit).to_list(limit)
+    # Enrich users with relationship flags if currentUserId provided
+    await relationship_service.annotate(currentUserId, results["users"])
     
-    for post in posts:
-        author = await db.users.find_one({"id": post["authorId"]}, {"_id": 0})
-        post["author"] = author
+    await attach_authors(results["posts"])
     
-    # Search tribes
-    tribes = await db.tribes.find({
-        "$or": [
-            {"name": query_pattern},
-            {"description": query_pattern}
-        ]
-    }, {"_id": 0}).limit(limit).to_list(limit)
-    
-    # Search venues
-    venues = await db.venues.find({
-        "$or": [
-            {"name": query_pattern},
-            {"description": query_pattern},
-            {"location": query_pattern}
-        ]
-    }, {"_id": 0}).limit(limit).to_list(limit)
-    
-    # Search events
-    events = await db.events.find({
-        "$or": [
-            {"name": query_pattern},
-            {"description": query_pattern},
-            {"venue": query_pattern}
-        ]
-    }, {"_id": 0}).limit(limit).to_list(limit)
-    
-    return {
-        "users": users,
-        "posts": posts,
-        "tribes": tribes,
-        "venues": venues,
-        "events": events
-    }
+    return results
 
 # ===== FRIEND MANAGEMENT ROUTES =====
 
@@ -1671,20 +1849,9 @@ async def send_friend_request(fromUserId: str, toUserId: str):
     # Check if there's a pending request from the other user
     if toUserId in from_user.get("friendRequestsReceived", []):
         # Auto-accept and become friends
-        await db.users.update_one(
-            {"id": fromUserId},
-            {
-                "$addToSet": {"friends": toUserId},
-                "$pull": {"friendRequestsReceived": toUserId}
-            }
-        )
-        await db.users.update_one(
-            {"id": toUserId},
-            {
-                "$addToSet": {"friends": fromUserId},
-                "$pull": {"friendRequestsSent": fromUserId}
-            }
-        )
+        await social_graph.add_friend(fromUserId, toUserId)
+        await db.users.update_one({"id": fromUserId}, {"$pull": {"friendRequestsReceived": toUserId}})
+        await db.users.update_one({"id": toUserId}, {"$pull": {"friendRequestsSent": fromUserId}})
         
         # Create notification
         notification = Notification(
@@ -1738,20 +1905,9 @@ async def accept_friend_request(userId: str, friendId: str):
         raise HTTPException(status_code=400, detail="No pending friend request from this user")
     
     # Add to friends lists and remove from pending
-    await db.users.update_one(
-        {"id": userId},
-        {
-            "$addToSet": {"friends": friendId},
-            "$pull": {"friendRequestsReceived": friendId}
-        }
-    )
-    await db.users.update_one(
-        {"id": friendId},
-        {
-            "$addToSet": {"friends": userId},
-            "$pull": {"friendRequestsSent": userId}
-        }
-    )
+    await social_graph.add_friend(userId, friendId)
+    await db.users.update_one({"id": userId}, {"$pull": {"friendRequestsReceived": friendId}})
+    await db.users.update_one({"id": friendId}, {"$pull": {"friendRequestsSent": userId}})
     
     # Create notification
     notification = Notification(
@@ -1786,14 +1942,7 @@ async def reject_friend_request(userId: str, friendId: str):
 async def unfriend(userId: str, friendId: str):
     """Remove a friend (unfriend)"""
     # Remove from both friends lists
-    await db.users.update_one(
-        {"id": userId},
-        {"$pull": {"friends": friendId}}
-    )
-    await db.users.update_one(
-        {"id": friendId},
-        {"$pull": {"friends": userId}}
-    )
+    await social_graph.remove_friend(userId, friendId)
     
     return {"success": True, "message": "Friend removed"}
 
@@ -1854,24 +2003,59 @@ async def get_friend_status(userId: str, targetUserId: str):
     else:
         return {"status": "none"}
 
+@api_router.get("/users/{userId}/suggestions")
+async def get_friend_suggestions(userId: str, limit: int = 10):
+    """People to add: users who are not already friends, pending, blocked or muted"""
+    user = await db.users.find_one({"id": userId}, {"_id": 0, "id": 1})
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    # Exclude everyone already related in the query itself, so a full page comes back in one read
+    excluded = [userId, *await relationship_service.related_ids(userId)]
+    return await db.users.find(
+        {"id": {"$nin": excluded}}, {"_id": 0, "password": 0}
+    ).limit(limit).to_list(limit)
+
 # ===== POST ROUTES (TIMELINE) =====
 
 @api_router.get("/posts")
-async def get_posts(limit: int = 50):
-    posts = await db.posts.find({}, {"_id": 0}).sort("createdAt", -1).to_list(limit)
-    # Enrich with author data
-    for post in posts:
-        author = await db.users.find_one({"id": post["authorId"]}, {"_id": 0})
-        post["author"] = author if author else None
-    return posts
+async def get_posts(limit: int = Query(50, ge=1, le=100), cursor: Optional[str] = None, userId: Optional[str] = None):
+    """Global timeline, newest first. Pass `cursor` (empty for the first page) to page through history."""
+    posts, next_cursor = await fetch_page(db.posts, {}, cursor, limit, {"_id": 0})
+    # Enrich with author data and the viewer's likes/reposts
+    await attach_authors(posts)
+    await attach_viewer_reactions(posts, "post", userId)
+    return paginated_response(posts, next_cursor, cursor)
+
+@api_router.get("/feed/home")
+async def get_home_feed(userId: str, limit: int = Query(50, ge=1, le=100), cursor: str = ""):
+    """Personalized home feed (own posts, friends and followed users), newest first"""
+    after = decode_cursor(cursor) if cursor else None
+    entries = await timeline_service.get_timeline_entries(userId, limit, after)
+    
+    post_ids = [entry["id"] for entry in entries]
+    found = await db.posts.find({"id": {"$in": post_ids}}, {"_id": 0}).to_list(len(post_ids))
+    posts_by_id = {post["id"]: post for post in found}
+    posts = [posts_by_id[post_id] for post_id in post_ids if post_id in posts_by_id]
+    await attach_authors(posts)
+    await attach_viewer_reactions(posts, "post", userId)
+    
+    next_cursor = encode_cursor(entries[-1]) if len(entries) == limit else None
+    return {"items": posts, "nextCursor": next_cursor}
 
 @api_router.post("/posts")
 async def create_post(post: PostCreate, authorId: str):
     post_obj = Post(authorId=authorId, **post.model_dump())
+    post_obj.hashtags = extract_hashtags(post_obj.text, post_obj.hashtags)
     doc = post_obj.model_dump()
     result = await db.posts.insert_one(doc)
     # Remove _id from doc before returning
     doc.pop('_id', None)
+    await hashtag_service.record_usage(doc["hashtags"])
+    await search_service.index_document("posts", doc)
+    await social_graph.adjust_post_count(authorId, 1)
+    # Push onto followers' home timelines
+    await timeline_service.fan_out_post(doc)
     # Enrich with author
     author = await db.users.find_one({"id": authorId}, {"_id": 0})
     doc["author"] = author
@@ -1879,22 +2063,15 @@ async def create_post(post: PostCreate, authorId: str):
 
 @api_router.post("/posts/{postId}/like")
 async def toggle_like_post(postId: str, userId: str):
-    post = await db.posts.find_one({"id": postId}, {"_id": 0})
+    post = await db.posts.find_one({"id": postId}, {"_id": 0, "authorId": 1})
     if not post:
         raise HTTPException(status_code=404, detail="Post not found")
     
-    liked_by = post.get("likedBy", [])
-    stats = post.get("stats", {"likes": 0, "quotes": 0, "reposts": 0, "replies": 0})
+    liked, likes, liked_at = await reaction_service.toggle("post", postId, userId, "like")
+    action = "liked" if liked else "unliked"
+    await trending_ranker.record(postId, "like", 1 if liked else -1, liked_at)
     
-    if userId in liked_by:
-        liked_by.remove(userId)
-        stats["likes"] = max(0, stats["likes"] - 1)
-        action = "unliked"
-    else:
-        liked_by.append(userId)
-        stats["likes"] = stats["likes"] + 1
-        action = "liked"
-        
+    if liked:
         # Create notification for post author
         if post["authorId"] != userId:
             liker = await db.users.find_one({"id": userId}, {"_id": 0})
@@ -1906,44 +2083,33 @@ async def toggle_like_post(postId: str, userId: str):
             )
             await db.notifications.insert_one(notification.model_dump())
     
-    await db.posts.update_one({"id": postId}, {"$set": {"likedBy": liked_by, "stats": stats}})
-    return {"action": action, "likes": stats["likes"]}
+    return {"action": action, "likes": likes}
 
 @api_router.post("/posts/{postId}/repost")
 async def toggle_repost(postId: str, userId: str):
-    post = await db.posts.find_one({"id": postId}, {"_id": 0})
+    post = await db.posts.find_one({"id": postId}, {"_id": 0, "id": 1})
     if not post:
         raise HTTPException(status_code=404, detail="Post not found")
     
-    reposted_by = post.get("repostedBy", [])
-    stats = post.get("stats", {"likes": 0, "quotes": 0, "reposts": 0, "replies": 0})
-    
-    if userId in reposted_by:
-        reposted_by.remove(userId)
-        stats["reposts"] = max(0, stats["reposts"] - 1)
-        action = "unreposted"
-    else:
-        reposted_by.append(userId)
-        stats["reposts"] = stats["reposts"] + 1
-        action = "reposted"
-    
-    await db.posts.update_one({"id": postId}, {"$set": {"repostedBy": reposted_by, "stats": stats}})
-    return {"action": action, "reposts": stats["reposts"]}
+    reposted, reposts, reposted_at = await reaction_service.toggle("post", postId, userId, "repost")
+    action = "reposted" if reposted else "unreposted"
+    await trending_ranker.record(postId, "repost", 1 if reposted else -1, reposted_at)
+    return {"action": action, "reposts": reposts}
 
 @api_router.get("/posts/{postId}/comments")
 async def get_post_comments(postId: str):
     comments = await db.comments.find({"postId": postId}, {"_id": 0}).sort("createdAt", -1).to_list(100)
-    for comment in comments:
-        author = await db.users.find_one({"id": comment["authorId"]}, {"_id": 0})
-        comment["author"] = author
+    await attach_authors(comments)
     return comments
 
 @api_router.delete("/posts/{postId}")
 async def delete_post(postId: str):
     """Delete a post"""
-    result = await db.posts.delete_one({"id": postId})
-    if result.deleted_count == 0:
+    post = await db.posts.find_one_and_delete({"id": postId}, projection={"_id": 0, "authorId": 1})
+    if post is None:
         raise HTTPException(status_code=404, detail="Post not found")
+    await search_service.remove("posts", postId)
+    await social_graph.adjust_post_count(post["authorId"], -1)
     return {"success": True, "message": "Post deleted"}
 
 @api_router.post("/posts/{postId}/comments")
@@ -1955,6 +2121,7 @@ async def create_post_comment(postId: str, comment: CommentCreate, authorId: str
     
     # Update post reply count
     await db.posts.update_one({"id": postId}, {"$inc": {"stats.replies": 1}})
+    await trending_ranker.record(postId, "reply")
     
     author = await db.users.find_one({"id": authorId}, {"_id": 0})
     doc["author"] = author
@@ -1973,8 +2140,8 @@ async def create_post_comment_alias(postId: str, comment: CommentCreate, authorI
 # Initialize Emergent LLM Key
 EMERGENT_LLM_KEY = os.environ.get('EMERGENT_LLM_KEY')
 
-# Store LlmChat instances by session_id to maintain conversation history
-voice_bot_sessions = {}
+# Conversation history by session_id, shared by all workers
+voice_bot_sessions = SharedChatSessions(realtime.state.namespace("voice-bot-sessions"))
 
 class VoiceQueryRequest(BaseModel):
     query: str
@@ -1998,22 +2165,22 @@ async def voice_chat(request: VoiceQueryRequest):
         # Generate or use existing session_id
         session_id = request.session_id or f"session_{uuid.uuid4()}"
         
-        # Get or create LlmChat instance for this session
-        if session_id not in voice_bot_sessions:
-            voice_bot_sessions[session_id] = LlmChat(
-                api_key=EMERGENT_LLM_KEY,
-                session_id=session_id,
-                system_message=system_message
-            )
-            logger.info(f"Created new voice bot session: {session_id}")
-        else:
+        if await voice_bot_sessions.exists(session_id):
             logger.info(f"Using existing voice bot session: {session_id}")
+        else:
+            logger.info(f"Created new voice bot session: {session_id}")
         
-        llm_chat = voice_bot_sessions[session_id]
-        user_message = UserMessage(text=request.query.strip())
-        
-        # Send message and get response
-        response = await llm_chat.send_message(user_message)
+        # Send message and get response (the LlmChat is rebuilt from the shared history if needed)
+        response = await voice_bot_sessions.send(
+            session_id,
+            request.query.strip(),
+            new_chat=lambda history: LlmChat(
+                api_key=EMERGENT_LLM_KEY,
+                session_id=session_id,
+                system_message=with_history(system_message, history)
+            ),
+            make_message=lambda text: UserMessage(text=text)
+        )
         
         return {
             "success": True,
@@ -2034,8 +2201,7 @@ async def voice_chat(request: VoiceQueryRequest):
 @api_router.delete("/voice/chat/session/{session_id}")
 async def delete_voice_session(session_id: str):
     """Delete a voice bot session to free up memory"""
-    if session_id in voice_bot_sessions:
-        del voice_bot_sessions[session_id]
+    if await voice_bot_sessions.delete(session_id):
         return {"success": True, "message": "Session deleted"}
     return {"success": False, "message": "Session not found"}
 
@@ -2070,16 +2236,12 @@ async def get_saved_posts(userId: str, limit: int = 50):
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    saved_post_ids = user.get("savedPosts", [])
-    posts = []
-    
-    for post_id in saved_post_ids[:limit]:
-        post = await db.posts.find_one({"id": post_id}, {"_id": 0})
-        if post:
-            author = await db.users.find_one({"id": post["authorId"]}, {"_id": 0})
-            post["author"] = author
-            posts.append(post)
-    
+    saved_post_ids = user.get("savedPosts", [])[:limit]
+    found = await db.posts.find({"id": {"$in": saved_post_ids}}, {"_id": 0}).to_list(len(saved_post_ids))
+    posts_by_id = {post["id"]: post for post in found}
+    posts = [posts_by_id[post_id] for post_id in saved_post_ids if post_id in posts_by_id]
+    await attach_authors(posts)
+    await attach_viewer_reactions(posts, "post", userId)
     return posts
 
 @api_router.post("/users/{userId}/follow")
@@ -2094,18 +2256,13 @@ async def follow_user(userId: str, targetUserId: str):
     if not user or not target:
         raise HTTPException(status_code=404, detail="User not found")
     
-    following = user.get("following", [])
-    followers = target.get("followers", [])
-    
-    if targetUserId in following:
+    if targetUserId in user.get("following", []):
         # Unfollow
-        following.remove(targetUserId)
-        followers.remove(userId)
+        await social_graph.unfollow(userId, targetUserId)
         action = "unfollowed"
     else:
         # Follow
-        following.append(targetUserId)
-        followers.append(userId)
+        await social_graph.follow(userId, targetUserId)
         action = "followed"
         
         # Create notification
@@ -2117,10 +2274,14 @@ async def follow_user(userId: str, targetUserId: str):
         )
         await db.notifications.insert_one(notification.model_dump())
     
-    await db.users.update_one({"id": userId}, {"$set": {"following": following}})
-    await db.users.update_one({"id": targetUserId}, {"$set": {"followers": followers}})
+    user = await db.users.find_one({"id": userId}, {"_id": 0, "counts": 1})
+    target = await db.users.find_one({"id": targetUserId}, {"_id": 0, "counts": 1})
     
-    return {"action": action, "followingCount": len(following), "followersCount": len(followers)}
+    return {
+        "action": action,
+        "followingCount": user_counts(user)["following"],
+        "followersCount": user_counts(target)["followers"]
+    }
 
 @api_router.get("/users/{userId}/followers")
 async def get_followers(userId: str, limit: int = 100):
@@ -2169,6 +2330,7 @@ async def create_quote_post(postId: str, authorId: str, text: str):
     quote_post = Post(
         authorId=authorId,
         text=text,
+        hashtags=extract_hashtags(text),
         quotedPostId=postId,
         quotedPost=original_post
     )
@@ -2176,15 +2338,17 @@ async def create_quote_post(postId: str, authorId: str, text: str):
     doc = quote_post.model_dump()
     await db.posts.insert_one(doc)
     doc.pop('_id', None)
+    await hashtag_service.record_usage(doc["hashtags"])
+    await search_service.index_document("posts", doc)
+    await social_graph.adjust_post_count(authorId, 1)
+    await timeline_service.fan_out_post(doc)
     
     # Enrich with author
     author = await db.users.find_one({"id": authorId}, {"_id": 0})
     doc["author"] = author
     
     # Update quote count on original post
-    stats = original_post.get("stats", {"likes": 0, "quotes": 0, "reposts": 0, "replies": 0})
-    stats["quotes"] = stats["quotes"] + 1
-    await db.posts.update_one({"id": postId}, {"$set": {"stats": stats}})
+    await db.posts.update_one({"id": postId}, {"$inc": {"stats.quotes": 1}})
     
     # Notify original author
     if original_post["authorId"] != authorId:
@@ -2199,63 +2363,38 @@ async def create_quote_post(postId: str, authorId: str, text: str):
     return doc
 
 @api_router.get("/hashtags/{hashtag}/posts")
-async def get_hashtag_posts(hashtag: str, limit: int = 50):
+async def get_hashtag_posts(hashtag: str, limit: int = Query(50, ge=1, le=100), cursor: Optional[str] = None, userId: Optional[str] = None):
     """Get posts containing a specific hashtag"""
-    # Search for posts containing the hashtag in text
-    posts = await db.posts.find(
-        {"text": {"$regex": f"#{hashtag}", "$options": "i"}},
-        {"_id": 0}
-    ).sort("createdAt", -1).to_list(limit)
+    # Hashtags are extracted at write time into the indexed `hashtags` array
+    posts, next_cursor = await fetch_page(
+        db.posts, {"hashtags": normalize_hashtag(hashtag)}, cursor, limit, {"_id": 0}
+    )
     
     # Enrich with author data
-    for post in posts:
-        author = await db.users.find_one({"id": post["authorId"]}, {"_id": 0})
-        post["author"] = author
+    await attach_authors(posts)
+    await attach_viewer_reactions(posts, "post", userId)
     
-    return posts
+    return paginated_response(posts, next_cursor, cursor)
 
 @api_router.get("/trending/hashtags")
 async def get_trending_hashtags(limit: int = 10):
     """Get trending hashtags (Twitter/TikTok-style)"""
-    # Get recent posts (last 24 hours)
-    recent_posts = await db.posts.find({
-        "createdAt": {"$gte": (datetime.now(timezone.utc) - timedelta(days=1)).isoformat()}
-    }, {"_id": 0, "text": 1}).to_list(1000)
-    
-    # Extract hashtags and count
-    hashtag_counts = {}
-    for post in recent_posts:
-        text = post.get("text", "")
-        hashtags = [word[1:] for word in text.split() if word.startswith("#")]
-        for tag in hashtags:
-            hashtag_counts[tag] = hashtag_counts.get(tag, 0) + 1
-    
-    # Sort by count and return top hashtags
-    trending = sorted(hashtag_counts.items(), key=lambda x: x[1], reverse=True)[:limit]
+    # Summed from the hourly usage buckets of the last 24 hours
+    trending = await hashtag_service.trending(limit)
     return [{"hashtag": tag, "count": count} for tag, count in trending]
 
 @api_router.get("/trending/posts")
-async def get_trending_posts(limit: int = 20):
+async def get_trending_posts(limit: int = 20, userId: Optional[str] = None):
     """Get trending/viral posts (TikTok For You Page style)"""
-    # Get posts from last 7 days
-    recent_posts = await db.posts.find({
-        "createdAt": {"$gte": (datetime.now(timezone.utc) - timedelta(days=7)).isoformat()}
-    }, {"_id": 0}).to_list(500)
-    
-    # Calculate engagement score (likes + comments * 2 + reposts * 3)
-    for post in recent_posts:
-        stats = post.get("stats", {"likes": 0, "quotes": 0, "reposts": 0, "replies": 0})
-        engagement = stats["likes"] + (stats["replies"] * 2) + (stats["reposts"] * 3)
-        post["_engagement_score"] = engagement
-    
-    # Sort by engagement and return top posts
-    trending = sorted(recent_posts, key=lambda x: x.get("_engagement_score", 0), reverse=True)[:limit]
-    
-    # Enrich with author data and remove engagement score
-    for post in trending:
-        author = await db.users.find_one({"id": post["authorId"]}, {"_id": 0})
-        post["author"] = author
-        post.pop("_engagement_score", None)
+    # Ranking (likes + replies*2 + reposts*3, time-decayed) is maintained by trending_ranker
+    post_ids = trending_ranker.top(limit)
+    found = await db.posts.find({"id": {"$in": post_ids}}, {"_id": 0}).to_list(len(post_ids))
+    posts_by_id = {post["id"]: post for post in found}
+    trending = [posts_by_id[post_id] for post_id in post_ids if post_id in posts_by_id]
+    
+    # Enrich with author data
+    await attach_authors(trending)
+    await attach_viewer_reactions(trending, "post", userId)
     
     return trending
 
@@ -2271,21 +2410,24 @@ async def create_reply(postId: str, authorId: str, text: str, mediaUrl: str = No
         authorId=authorId,
         text=text,
         media=mediaUrl,  # Fixed: Use 'media' to match Post model field
+        hashtags=extract_hashtags(text),
         replyToPostId=postId
     )
     
     doc = reply.model_dump()
     await db.posts.insert_one(doc)
     doc.pop('_id', None)
+    await hashtag_service.record_usage(doc["hashtags"])
+    await search_service.index_document("posts", doc)
+    await social_graph.adjust_post_count(authorId, 1)
     
     # Enrich with author
     author = await db.users.find_one({"id": authorId}, {"_id": 0})
     doc["author"] = author
     
     # Update reply count on original post
-    stats = original_post.get("stats", {"likes": 0, "quotes": 0, "reposts": 0, "replies": 0})
-    stats["replies"] = stats["replies"] + 1
-    await db.posts.update_one({"id": postId}, {"$set": {"stats": stats}})
+    await db.posts.update_one({"id": postId}, {"$inc": {"stats.replies": 1}})
+    await trending_ranker.record(postId, "reply")
     
     # Notify original author
     if original_post["authorId"] != authorId:
@@ -2300,17 +2442,16 @@ async def create_reply(postId: str, authorId: str, text: str, mediaUrl: str = No
     return doc
 
 @api_router.get("/posts/{postId}/replies")
-async def get_post_replies(postId: str, limit: int = 100):
+async def get_post_replies(postId: str, limit: int = 100, userId: Optional[str] = None):
     """Get all replies to a post"""
     replies = await db.posts.find(
         {"replyToPostId": postId},
         {"_id": 0}
     ).sort("createdAt", 1).to_list(limit)
     
-    # Enrich with author data
-    for reply in replies:
-        author = await db.users.find_one({"id": reply["authorId"]}, {"_id": 0})
-        reply["author"] = author
+    # Enrich with author data and the viewer's likes/reposts
+    await attach_authors(replies)
+    await attach_viewer_reactions(replies, "post", userId)
     
     return replies
 
@@ -2347,41 +2488,23 @@ async def bookmark_post(postId: str, userId: str):
 
 @api_router.get("/bookmarks/{userId}")
 async def get_bookmarks(userId: str):
-    """Get user's bookmarked posts"""
-    bookmarks = await db.bookmarks.find({"userId": userId}, {"_id": 0}).sort("createdAt", -1).to_list(100)
-    posts = []
-    for bookmark in bookmarks:
-        post = await db.posts.find_one({"id": bookmark["postId"]}, {"_id": 0})
-        if post:
-            author = await db.users.find_one({"id": post["authorId"]}, {"_id": 0})
-            post["author"] = author
-            posts.append(post)
+    """Get user's bookmarked posts, most recently bookmarked first"""
+    bookmarks = await db.bookmarks.find({"userId": userId}, {"_id": 0, "postId": 1}).sort("createdAt", -1).to_list(100)
+    post_ids = [bookmark["postId"] for bookmark in bookmarks]
+    found = await db.posts.find({"id": {"$in": post_ids}}, {"_id": 0}).to_list(len(post_ids))
+    posts_by_id = {post["id"]: post for post in found}
+    posts = [posts_by_id[post_id] for post_id in post_ids if post_id in posts_by_id]
+    await attach_authors(posts)
+    await attach_viewer_reactions(posts, "post", userId)
     return posts
 
 # ===== HASHTAGS =====
 
 @api_router.get("/hashtags/trending")
 async def get_trending_hashtags(limit: int = 20):
-    """Get trending hashtags"""
-    # Aggregate hashtags from posts
-    pipeline = [
-        {"$match": {"hashtags": {"$exists": True, "$ne": []}}},
-        {"$unwind": "$hashtags"},
-        {"$group": {"_id": "$hashtags", "count": {"$sum": 1}}},
-        {"$sort": {"count": -1}},
-        {"$limit": limit}
-    ]
-    results = await db.posts.aggregate(pipeline).to_list(limit)
-    return [{"tag": r["_id"], "count": r["count"]} for r in results]
-
-@api_router.get("/hashtags/{tag}/posts")
-async def get_posts_by_hashtag(tag: str, limit: int = 50):
-    """Get posts by hashtag"""
-    posts = await db.posts.find({"hashtags": tag}, {"_id": 0}).sort("createdAt", -1).limit(limit).to_list(limit)
-    for post in posts:
-        author = await db.users.find_one({"id": post["authorId"]}, {"_id": 0})
-        post["author"] = author
-    return posts
+    """Get trending hashtags by uses in the last 24 hours (no longer all-time counts)"""
+    trending = await hashtag_service.trending(limit)
+    return [{"tag": tag, "count": count} for tag, count in trending]
 
 # ===== ADVANCED SEARCH =====
 
@@ -2390,50 +2513,23 @@ async def search_all(q: str, type: str = "all", limit: int = 20):
     """Advanced search across all content"""
     results = {"users": [], "posts": [], "hashtags": [], "events": [], "venues": []}
     
-    if type in ["all", "users"]:
-        users = await db.users.find({
-            "$or": [
-                {"name": {"$regex": q, "$options": "i"}},
-                {"handle": {"$regex": q, "$options": "i"}}
-            ]
-        }, {"_id": 0}).limit(limit).to_list(limit)
-        results["users"] = users
-    
-    if type in ["all", "posts"]:
-        posts = await db.posts.find({
-            "text": {"$regex": q, "$options": "i"}
-        }, {"_id": 0}).limit(limit).to_list(limit)
-        for post in posts:
-            author = await db.users.find_one({"id": post["authorId"]}, {"_id": 0})
-            post["author"] = author
-        results["posts"] = posts
+    collections = [c for c in ["users", "posts", "events", "venues"] if type in ["all", c]]
+    results.update(await search_service.search_many(
+        collections, q, limit, projections={"users": {"_id": 0, "password": 0}}
+    ))
+    await attach_authors(results["posts"])
     
     if type in ["all", "hashtags"]:
-        hashtags = await db.posts.find({
-            "hashtags": {"$regex": q, "$options": "i"}
-        }, {"_id": 0, "hashtags": 1}).limit(limit).to_list(limit)
-        unique_tags = set()
-        for post in hashtags:
-            unique_tags.update([tag for tag in post.get("hashtags", []) if q.lower() in tag.lower()])
-        results["hashtags"] = list(unique_tags)[:limit]
-    
-    if type in ["all", "events"]:
-        events = await db.events.find({
-            "$or": [
-                {"name": {"$regex": q, "$options": "i"}},
-                {"description": {"$regex": q, "$options": "i"}}
-            ]
-        }, {"_id": 0}).limit(limit).to_list(limit)
-        results["events"] = events
-    
-    if type in ["all", "venues"]:
-        venues = await db.venues.find({
-            "$or": [
-                {"name": {"$regex": q, "$options": "i"}},
-                {"location": {"$regex": q, "$options": "i"}}
-            ]
-        }, {"_id": 0}).limit(limit).to_list(limit)
-        results["venues"] = venues
+        # Stored hashtags are normalized, so an anchored prefix match can use the hashtags index
+        prefix = normalize_hashtag(q)
+        if prefix:
+            hashtags = await db.posts.find({
+                "hashtags": {"$regex": f"^{re.escape(prefix)}"}
+            }, {"_id": 0, "hashtags": 1}).limit(limit).to_list(limit)
+            unique_tags = set()
+            for post in hashtags:
+                unique_tags.update([tag for tag in post.get("hashtags", []) if tag.startswith(prefix)])
+            results["hashtags"] = list(unique_tags)[:limit]
     
     return results
 
@@ -2465,11 +2561,12 @@ async def get_active_stories(userId: Optional[str] = None):
     }, {"_id": 0}).sort("createdAt", -1).to_list(100)
     
     # Group by author
+    authors = await get_users_by_ids(story["authorId"] for story in stories)
     grouped = {}
     for story in stories:
         author_id = story["authorId"]
         if author_id not in grouped:
-            author = await db.users.find_one({"id": author_id}, {"_id": 0})
+            author = authors.get(author_id)
             if author:
                 grouped[author_id] = {
                     "author": author,
@@ -2536,9 +2633,7 @@ async def send_group_message(groupId: str, userId: str, text: str, media: str =
 async def get_group_messages(groupId: str, limit: int = 100):
     """Get group messages"""
     messages = await db.group_messages.find({"groupId": groupId}, {"_id": 0}).sort("createdAt", -1).limit(limit).to_list(limit)
-    for msg in messages:
-        sender = await db.users.find_one({"id": msg["userId"]}, {"_id": 0})
-        msg["sender"] = sender
+    await attach_authors(messages, id_field="userId", target_field="sender")
     return list(reversed(messages))
 
 # ===== CONTENT MODERATION =====
@@ -2577,26 +2672,7 @@ async def handle_report(reportId: str, action: str, adminId: str):
     )
     return {"success": True}
 
-# ===== TRENDING & ACTIVITY FEED =====
-
-@api_router.get("/trending/posts")
-async def get_trending_posts(limit: int = 20):
-    """Get trending posts based on engagement"""
-    # Get recent posts with high engagement
-    day_ago = (datetime.now(timezone.utc) - timedelta(days=1)).isoformat()
-    posts = await db.posts.find(
-        {"createdAt": {"$gte": day_ago}},
-        {"_id": 0}
-    ).sort([
-        ("stats.likes", -1),
-        ("stats.reposts", -1),
-        ("stats.replies", -1)
-    ]).limit(limit).to_list(limit)
-    
-    for post in posts:
-        author = await db.users.find_one({"id": post["authorId"]}, {"_id": 0})
-        post["author"] = author
-    return posts
+# ===== ACTIVITY FEED =====
 
 @api_router.get("/activity/{userId}")
 async def get_activity_feed(userId: str, limit: int = 50):
@@ -2615,23 +2691,15 @@ async def get_activity_feed(userId: str, limit: int = 50):
 # ===== REEL ROUTES (VIBEZONE) =====
 
 @api_router.get("/reels")
-async def get_reels(limit: int = 50):
+async def get_reels(limit: int = Query(50, ge=1, le=100), cursor: Optional[str] = None, userId: Optional[str] = None):
     """Get all reels for VibeZone."""
-    cursor = db.reels.find().sort("createdAt", -1).limit(limit)
-    reels = await cursor.to_list(length=limit)
+    reels, next_cursor = await fetch_page(db.reels, {}, cursor, limit)
     for reel in reels:
         reel["_id"] = str(reel["_id"])
-        # Add author info
-        if "authorId" in reel:
-            author = await db.users.find_one({"id": reel["authorId"]})
-            if author:
-                reel["author"] = {
-                    "id": author["id"],
-                    "handle": author["handle"],
-                    "name": author["name"],
-                    "avatar": author.get("avatar", "")
-                }
-    return reels
+    # Add author info
+    await attach_authors(reels, shape=author_summary)
+    await attach_viewer_reactions(reels, "reel", userId)
+    return paginated_response(reels, next_cursor, cursor)
 
 @api_router.get("/music/search")
 async def search_music(q: str, limit: int = 10):
@@ -2682,16 +2750,12 @@ async def get_active_capsules(userId: Optional[str] = None):
     capsules = await db.vibe_capsules.find(query, {"_id": 0}).sort("createdAt", -1).to_list(100)
     
     # Add author info and group by author
+    authors = await get_users_by_ids(capsule["authorId"] for capsule in capsules)
     capsules_by_author = {}
     for capsule in capsules:
-        author = await db.users.find_one({"id": capsule["authorId"]}, {"_id": 0})
+        author = authors.get(capsule["authorId"])
         if author:
-            capsule["author"] = {
-                "id": author["id"],
-                "handle": author["handle"],
-                "name": author["name"],
-                "avatar": author.get("avatar", "")
-            }
+            capsule["author"] = author_summary(author)
             
             author_id = capsule["authorId"]
             if author_id not in capsules_by_author:
@@ -2797,36 +2861,24 @@ async def get_capsule_insights(authorId: str):
 
 @api_router.post("/reels/{reelId}/like")
 async def toggle_like_reel(reelId: str, userId: str):
-    reel = await db.reels.find_one({"id": reelId}, {"_id": 0})
+    reel = await db.reels.find_one({"id": reelId}, {"_id": 0, "id": 1})
     if not reel:
         raise HTTPException(status_code=404, detail="Reel not found")
     
-    liked_by = reel.get("likedBy", [])
-    stats = reel.get("stats", {"views": 0, "likes": 0, "comments": 0})
-    
-    if userId in liked_by:
-        liked_by.remove(userId)
-        stats["likes"] = max(0, stats["likes"] - 1)
-        action = "unliked"
-    else:
-        liked_by.append(userId)
-        stats["likes"] = stats["likes"] + 1
-        action = "liked"
-    
-    await db.reels.update_one({"id": reelId}, {"$set": {"likedBy": liked_by, "stats": stats}})
-    return {"action": action, "likes": stats["likes"]}
+    liked, likes, _ = await reaction_service.toggle("reel", reelId, userId, "like")
+    action = "liked" if liked else "unliked"
+    return {"action": action, "likes": likes}
 
 @api_router.post("/reels/{reelId}/view")
 async def increment_reel_view(reelId: str):
-    await db.reels.update_one({"id": reelId}, {"$inc": {"stats.views": 1}})
+    # Buffered: views are coalesced per reel and flushed in bulk
+    counter_buffer.increment("reels", reelId, "stats.views")
     return {"success": True}
 
 @api_router.get("/reels/{reelId}/comments")
 async def get_reel_comments(reelId: str):
     comments = await db.comments.find({"reelId": reelId}, {"_id": 0}).sort("createdAt", -1).to_list(100)
-    for comment in comments:
-        author = await db.users.find_one({"id": comment["authorId"]}, {"_id": 0})
-        comment["author"] = author
+    await attach_authors(comments)
     return comments
 
 @api_router.post("/reels/{reelId}/comments")
@@ -2862,6 +2914,7 @@ async def create_tribe(tribe: TribeCreate, ownerId: str):
     doc = tribe_obj.model_dump()
     result = await db.tribes.insert_one(doc)
     doc.pop('_id', None)
+    await search_service.index_document("tribes", doc)
     return doc
 
 @api_router.post("/tribes/{tribeId}/join")
@@ -2893,17 +2946,18 @@ async def leave_tribe(tribeId: str, userId: str):
     return {"message": "Left", "memberCount": len(members)}
 
 @api_router.get("/tribes/{tribeId}/posts")
-async def get_tribe_posts(tribeId: str, limit: int = 50):
+async def get_tribe_posts(tribeId: str, limit: int = Query(50, ge=1, le=100), cursor: Optional[str] = None, userId: Optional[str] = None):
     # Mock: return posts with tribe tag or from tribe members
     tribe = await db.tribes.find_one({"id": tribeId}, {"_id": 0})
     if not tribe:
         raise HTTPException(status_code=404, detail="Tribe not found")
     
-    posts = await db.posts.find({"authorId": {"$in": tribe.get("members", [])}}, {"_id": 0}).sort("createdAt", -1).to_list(limit)
-    for post in posts:
-        author = await db.users.find_one({"id": post["authorId"]}, {"_id": 0})
-        post["author"] = author
-    return posts
+    posts, next_cursor = await fetch_page(
+        db.posts, {"authorId": {"$in": tribe.get("members", [])}}, cursor, limit, {"_id": 0}
+    )
+    await attach_authors(posts)
+    await attach_viewer_reactions(posts, "post", userId)
+    return paginated_response(posts, next_cursor, cursor)
 
 # ===== AGORA.IO INTEGRATION (CLUBHOUSE-STYLE AUDIO) =====
 
@@ -3020,6 +3074,7 @@ async def create_room(room: RoomCreate, userId: str):
             )
             user_doc = new_user.model_dump()
             await db.users.insert_one(user_doc)
+            await search_service.index_document("users", user_doc)
             user = user_doc
             logger.info(f"Created missing user: {userId}")
         except Exception as e:
@@ -3712,6 +3767,30 @@ async def get_room_share_link(roomId: str):
         "roomId": roomId
     }
 
+# ===== METRICS =====
+
+@api_router.get("/metrics")
+async def get_metrics():
+    """In-process runtime metrics for this worker"""
+    return {
+        "counterBuffer": counter_buffer.metrics(),
+        "trendingRanker": trending_ranker.metrics(),
+        "imageVariants": image_variants.metrics(),
+        "mediaCache": media_cache.metrics(),
+        "ticketQr": ticket_qr.metrics(),
+        "authHashing": auth_service.metrics(),
+        "authCache": auth_service.user_cache.metrics(),
+        "sockets": sessions.metrics(),
+        "realtime": realtime.metrics(),
+        "voiceBotSessions": voice_bot_sessions.metrics(),
+        "typing": typing_throttle.metrics(),
+        "presence": presence.metrics(),
+        "threadParticipants": {
+            "dm": dm_thread_participants.metrics(),
+            "messenger": messenger_thread_participants.metrics()
+        }
+    }
+
 # ===== SEED DATA ROUTE =====
 
 @api_router.post("/seed")
@@ -3720,6 +3799,7 @@ async def seed_data():
     await db.users.delete_many({})
     await db.posts.delete_many({})
     await db.reels.delete_many({})
+    await db.reactions.delete_many({})
     await db.tribes.delete_many({})
     await db.comments.delete_many({})
     await db.wallet_transactions.delete_many({})
@@ -3757,6 +3837,7 @@ async def seed_data():
         {"id": "r3", "authorId": "u5", "videoUrl": "https://commondatastorage.googleapis.com/gtv-videos-bucket/sample/ForBiggerBlazes.mp4", "thumb": "https://images.unsplash.com/photo-1565299624946-b28f40a0ae38?w=400", "caption": "Street food tour part 3! 🔥", "stats": {"views": 8934, "likes": 1234, "comments": 89}, "likedBy": ["u1", "u2", "u3", "u4"], "createdAt": datetime.now(timezone.utc).isoformat()},
     ]
     await db.reels.insert_many(reels)
+    await reaction_service.migrate_legacy_arrays()
     
     # Seed tribes
     tribes = [
@@ -3848,88 +3929,223 @@ async def seed_data():
     ]
     await db.notifications.insert_many(notifications)
     
+    await search_service.rebuild()
+    await social_graph.backfill_counts()
+    
     return {"message": "Data seeded successfully", "users": len(users), "posts": len(posts), "reels": len(reels), "tribes": len(tribes), "wallet_transactions": len(wallet_transactions), "venues": len(venues), "events": len(events), "creators": len(creators), "messages": len(messages), "notifications": len(notifications)}
 
 # ===== FILE UPLOAD ROUTES =====
 
 @api_router.post("/upload")
-async def upload_file(file: UploadFile = File(...)):
-    """Upload image or video file - stores in MongoDB for persistence across deployments"""
+async def upload_file(request: Request, current_user: dict = Depends(get_current_user)):
+    """Upload image or video file (multipart field `file`).
+
+    The body is parsed as it arrives and written straight to GridFS: the size
+    cap is enforced, the SHA-256 computed and the type sniffed while streaming,
+    so an oversized or disguised upload is rejected after at most one buffer.
+    """
     # Validate file type
     allowed_types = {
         'image/jpeg', 'image/jpg', 'image/png', 'image/gif', 'image/webp',
         'video/mp4', 'video/quicktime', 'video/x-msvideo', 'video/webm'
     }
+    max_mb = media_store.max_bytes // (1024 * 1024)
     
-    if file.content_type not in allowed_types:
-        raise HTTPException(status_code=400, detail="File type not supported")
-    
-    # Read file content
-    file_content = await file.read()
-    
-    # Check file size (MongoDB has 16MB document limit)
-    file_size_mb = len(file_content) / (1024 * 1024)
-    if file_size_mb > 15:
-        raise HTTPException(status_code=400, detail=f"File too large ({file_size_mb:.2f}MB). Maximum size is 15MB")
+    # Reject declared-oversized bodies before reading anything (allowing for multipart framing)
+    declared_length = request.headers.get("content-length")
+    if declared_length and declared_length.isdigit() and int(declared_length) > media_store.max_bytes + 64 * 1024:
+        raise HTTPException(status_code=413, detail=f"File too large. Maximum size is {max_mb}MB")
     
     # Generate unique ID for the file
     file_id = str(uuid.uuid4())
-    file_ext = file.filename.split('.')[-1] if '.' in file.filename else ''
-    
-    # Convert file to base64 for MongoDB storage
-    file_base64 = base64.b64encode(file_content).decode('utf-8')
-    
-    # Store in MongoDB
-    media_doc = {
-        "id": file_id,
-        "filename": file.filename,
-        "content_type": file.content_type,
-        "file_extension": file_ext,
-        "file_data": file_base64,
-        "file_size": len(file_content),
-        "uploaded_at": datetime.now(timezone.utc).isoformat(),
-    }
+    upload = None
+    
+    try:
+        async for part in multipart_file_stream(request.stream(), request.headers.get("content-type"), "file"):
+            if isinstance(part, FilePartHeader):
+                if part.content_type not in allowed_types:
+                    raise UnsupportedMedia("File type not supported")
+                upload = media_store.begin_upload(file_id, part.filename, allowed_types, current_user["id"])
+            else:
+                await upload.write(part)
+        media_doc = await upload.finish()
+    except BaseException as e:
+        if upload is not None:
+            await upload.abort()
+        if isinstance(e, MediaTooLarge):
+            raise HTTPException(status_code=413, detail=f"File too large. Maximum size is {max_mb}MB")
+        if isinstance(e, UnsupportedMedia):
+            raise HTTPException(status_code=400, detail="File type not supported")
+        if isinstance(e, UploadStreamError):
+            raise HTTPException(status_code=400, detail=str(e))
+        raise
     
-    await db.media_files.insert_one(media_doc)
+    # Render the feed/avatar sizes in the background
+    image_variants.schedule(media_doc)
     
     # Return RELATIVE URL so it works on any deployment domain
     file_url = f"/api/media/{file_id}"
     
     return {
         "url": file_url,
-        "filename": f"{file_id}.{file_ext}",
-        "content_type": file.content_type,
-        "size": len(file_content)
+        "filename": f"{file_id}.{media_doc['file_extension']}",
+        "content_type": media_doc["content_type"],
+        "size": media_doc["file_size"]
     }
 
 
 @api_router.get("/media/{file_id}")
-async def serve_media_file(file_id: str):
-    """Serve media file from MongoDB storage"""
-    from fastapi.responses import Response
+async def serve_media_file(
+    file_id: str,
+    range_header: Optional[str] = Header(None, alias="Range"),
+    if_range: Optional[str] = Header(None, alias="If-Range"),
+    if_none_match: Optional[str] = Header(None, alias="If-None-Match"),
+    size: Optional[str] = None,
+    variant_format: str = Query("webp", alias="format"),
+):
+    """Stream a media file, honouring Range (206) and If-None-Match (304).
+
+    `size` (thumb/medium/large) selects a resized rendition of an image, encoded
+    as `format` (webp/jpeg); other media ignore it and are served as uploaded.
+    Hot files come from the local disk cache without touching the database.
+    """
+    if size is not None and size not in VARIANT_SIZES:
+        raise HTTPException(status_code=400, detail=f"size must be one of {', '.join(VARIANT_SIZES)}")
+    if variant_format not in VARIANT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(VARIANT_FORMATS)}")
     
-    # Retrieve file from MongoDB
-    media_doc = await db.media_files.find_one({"id": file_id}, {"_id": 0})
+    cached = media_cache.lookup(file_id, size, variant_format)
+    if cached is not None:
+        return cached_media_response(cached, range_header, if_range, if_none_match)
     
+    media_doc = await media_store.get(file_id)
     if not media_doc:
         raise HTTPException(status_code=404, detail="Media file not found")
     
-    # Decode base64 file data
+    variant = size is not None and image_variants.supports(media_doc)
+    if variant:
+        cache_key = image_variants.variant_id(media_doc["sha256"], size, variant_format)
+        etag = f'"{cache_key}"'
+        content_type = VARIANT_FORMATS[variant_format][1]
+    else:
+        cache_key = media_doc.get("sha256")
+        etag = etag_for(media_doc)
+        content_type = media_doc["content_type"]
+    if cache_key:
+        cached = media_cache.remember(
+            file_id, size, variant_format, cache_key, etag, content_type, media_doc["filename"]
+        )
+        if cached is not None:
+            return cached_media_response(cached, range_header, if_range, if_none_match)
+    headers = {
+        "Cache-Control": "public, max-age=31536000",  # Cache for 1 year
+        "Accept-Ranges": "bytes",
+    }
+    if etag:
+        headers["ETag"] = etag
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    headers["Content-Disposition"] = f'inline; filename="{media_doc["filename"]}"'
+    
+    if variant:
+        try:
+            grid_out = await image_variants.open(media_doc, size, variant_format)
+        except Exception as e:
+            logger.error(f"Variant {size}/{variant_format} of {file_id} failed, serving original: {e}")
+            variant, cache_key, etag, content_type = False, None, etag_for(media_doc), media_doc["content_type"]
+            media_cache.forget(file_id)
+            headers["ETag"] = etag
+            grid_out = await media_store.open(media_doc)
+        opener = lambda: media_store.open({"id": cache_key})
+    else:
+        grid_out = await media_store.open(media_doc)
+        opener = lambda: media_store.open(media_doc)
+    legacy_data = None
+    if grid_out is None:
+        # Not migrated to GridFS yet: fall back to the legacy base64 blob
+        legacy = await db.media_files.find_one({"id": file_id}, {"_id": 0, "file_data": 1})
+        if not legacy or "file_data" not in legacy:
+            raise HTTPException(status_code=404, detail="Media file not found")
+        try:
+            legacy_data = base64.b64decode(legacy["file_data"])
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Error decoding file: {str(e)}")
+    length = grid_out.length if grid_out is not None else len(legacy_data)
+    if grid_out is not None and cache_key:
+        media_cache.fill(cache_key, length, opener)
+    
+    # A Range is only honoured if the client's copy (If-Range) is still current
+    if if_range and if_range != etag:
+        range_header = None
     try:
-        file_data = base64.b64decode(media_doc["file_data"])
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error decoding file: {str(e)}")
-    
-    # Return file with proper content type
-    return Response(
-        content=file_data,
-        media_type=media_doc["content_type"],
-        headers={
-            "Content-Disposition": f'inline; filename="{media_doc["filename"]}"',
-            "Cache-Control": "public, max-age=31536000",  # Cache for 1 year
-        }
+        byte_range = parse_byte_range(range_header, length)
+    except RangeNotSatisfiable:
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{length}"})
+    
+    status_code = 200
+    start, end = 0, length - 1
+    if byte_range:
+        status_code = 206
+        start, end = byte_range
+        headers["Content-Range"] = f"bytes {start}-{end}/{length}"
+    headers["Content-Length"] = str(end - start + 1 if length else 0)
+    
+    if legacy_data is not None:
+        return Response(
+            content=legacy_data[start:end + 1], status_code=status_code,
+            media_type=content_type, headers=headers
+        )
+    body = media_store.iter_range(grid_out, start, end) if byte_range else media_store.iter_chunks(grid_out)
+    return StreamingResponse(body, status_code=status_code, media_type=content_type, headers=headers)
+
+def cached_media_response(cached, range_header: Optional[str], if_range: Optional[str], if_none_match: Optional[str]):
+    """Response for a media file served from the local disk cache"""
+    headers = {
+        "Cache-Control": "public, max-age=31536000",
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": f'inline; filename="{cached.filename}"',
+    }
+    if cached.etag:
+        headers["ETag"] = cached.etag
+    if etag_matches(if_none_match, cached.etag):
+        headers.pop("Content-Disposition")
+        return Response(status_code=304, headers=headers)
+    
+    length = cached.stat_result.st_size
+    if if_range and if_range != cached.etag:
+        range_header = None
+    try:
+        byte_range = parse_byte_range(range_header, length)
+    except RangeNotSatisfiable:
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{length}"})
+    if byte_range is None:
+        # Whole file: sent with the server's zero-copy path send where it supports one
+        return FileResponse(
+            cached.path, media_type=cached.content_type, headers=headers, stat_result=cached.stat_result
+        )
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{length}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        media_cache.iter_range(cached.path, start, end), status_code=206,
+        media_type=cached.content_type, headers=headers
     )
 
+@api_router.delete("/media/{file_id}")
+async def delete_media_file(file_id: str, current_user: dict = Depends(get_current_user)):
+    """Delete one of your uploads (its bytes are freed once nothing else references them)"""
+    media_doc = await media_store.get(file_id)
+    if not media_doc:
+        raise HTTPException(status_code=404, detail="Media file not found")
+    if media_doc.get("uploaderId") != current_user["id"]:
+        raise HTTPException(status_code=403, detail="Only the uploader can delete this file")
+    if not await media_store.delete(file_id, current_user["id"]):
+        raise HTTPException(status_code=404, detail="Media file not found")
+    media_cache.forget(file_id)
+    if media_doc.get("sha256") and not await media_store.is_referenced(media_doc["sha256"]):
+        media_cache.discard_content(media_doc["sha256"])
+    return {"success": True, "message": "Media file deleted"}
+
 # ===== USER PROFILE UPDATE ROUTES =====
 
 class UserProfileUpdate(BaseModel):
@@ -3973,9 +4189,12 @@ async def update_user_profile(userId: str, updates: UserProfileUpdate):
             {"id": userId},
             {"$set": update_data}
         )
+        auth_service.user_cache.invalidate_user(userId)
         
         # Get updated user
         updated_user = await db.users.find_one({"id": userId}, {"_id": 0, "password": 0})
+        if "name" in update_data or "handle" in update_data:
+            await search_service.index_document("users", updated_user)
         
         return {
             "message": "Profile updated successfully",
@@ -4208,6 +4427,7 @@ async def create_event(
     
     await db.events.insert_one(event)
     event.pop("_id", None)
+    await search_service.index_document("events", event)
     
     return event
 
@@ -4245,10 +4465,6 @@ async def book_event_ticket(eventId: str, userId: str, tier: str = "General", qu
     if current_balance < total_amount:
         raise HTTPException(status_code=400, detail="Insufficient wallet balance")
     
-    # Deduct from wallet
-    new_balance = current_balance - total_amount
-    await db.users.update_one({"id": userId}, {"$set": {"walletBalance": new_balance}})
-    
     # Create tickets
     tickets = []
     for i in range(quantity):
@@ -4265,15 +4481,35 @@ async def book_event_ticket(eventId: str, userId: str, tier: str = "General", qu
         ticket_dict["eventLocation"] = event.get("location", "")
         ticket_dict["eventImage"] = event.get("image", "")
         ticket_dict["price"] = price_per_ticket
-        
-        # Generate QR code
-        qr_data = f"TICKET:{ticket_dict['id']}:QR:{ticket_dict['qrCode']}:EVENT:{eventId}"
-        ticket_dict['qrCodeImage'] = generate_qr_code_base64(qr_data)
-        
-        await db.event_tickets.insert_one(ticket_dict)
+        tickets.append(ticket_dict)
+    
+    # Render all QR codes concurrently, off the event loop, before any money moves
+    await ticket_qr.create(tickets)
+    
+    # Deduct from wallet (conditional, so concurrent bookings cannot overdraw it)
+    charged = await db.users.find_one_and_update(
+        {"id": userId, "walletBalance": {"$gte": total_amount}},
+        {"$inc": {"walletBalance": -total_amount}},
+        projection={"_id": 0, "walletBalance": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    if charged is None:
+        raise HTTPException(status_code=400, detail="Insufficient wallet balance")
+    new_balance = charged["walletBalance"]
+    auth_service.user_cache.invalidate_user(userId)
+    
+    if tickets:
+        try:
+            await db.event_tickets.insert_many(tickets)
+        except Exception:
+            # Refund, and withdraw any tickets of the batch that did get written
+            await db.event_tickets.delete_many({"id": {"$in": [ticket_dict["id"] for ticket_dict in tickets]}})
+            await db.users.update_one({"id": userId}, {"$inc": {"walletBalance": total_amount}})
+            auth_service.user_cache.invalidate_user(userId)
+            raise
+    for ticket_dict in tickets:
         # Remove MongoDB ObjectId to avoid serialization issues
         ticket_dict.pop('_id', None)
-        tickets.append(ticket_dict)
     
     # Record transaction
     transaction = WalletTransaction(
@@ -4305,18 +4541,36 @@ async def book_event_ticket(eventId: str, userId: str, tier: str = "General", qu
         "message": f"Successfully booked {quantity} ticket(s)!"
     }
 
+# Registered before /tickets/{userId}/{ticketId}, which would otherwise match it
+@api_router.get("/tickets/{ticketId}/qr.png")
+async def get_ticket_qr_image(ticketId: str, if_none_match: Optional[str] = Header(None, alias="If-None-Match")):
+    """A ticket's QR code as PNG; the image never changes, so clients may cache it"""
+    image = await ticket_qr.image(ticketId)
+    if image is None:
+        raise HTTPException(status_code=404, detail="Ticket not found")
+    png, etag = image
+    headers = {"Cache-Control": "private, max-age=31536000, immutable", "ETag": etag}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=png, media_type="image/png", headers=headers)
+
 @api_router.get("/tickets/{userId}")
 async def get_user_tickets(userId: str):
     """Get all tickets for a user"""
-    tickets = await db.event_tickets.find({"userId": userId}, {"_id": 0}).sort("purchasedAt", -1).to_list(100)
+    tickets = await db.event_tickets.find(
+        {"userId": userId}, {"_id": 0, "qrCodeImage": 0}
+    ).sort("purchasedAt", -1).to_list(100)
+    for ticket in tickets:
+        ticket["qrCodeUrl"] = ticket_qr_url(ticket["id"])
     return tickets
 
 @api_router.get("/tickets/{userId}/{ticketId}")
 async def get_ticket_details(userId: str, ticketId: str):
     """Get specific ticket details"""
-    ticket = await db.event_tickets.find_one({"id": ticketId, "userId": userId}, {"_id": 0})
+    ticket = await db.event_tickets.find_one({"id": ticketId, "userId": userId}, {"_id": 0, "qrCodeImage": 0})
     if not ticket:
         raise HTTPException(status_code=404, detail="Ticket not found")
+    ticket["qrCodeUrl"] = ticket_qr_url(ticket["id"])
     return ticket
 
 # ===== CREATOR ROUTES =====
@@ -4358,6 +4612,7 @@ async def topup_wallet(request: TopUpRequest, userId: str):
     
     new_balance = user.get("walletBalance", 0.0) + request.amount
     await db.users.update_one({"id": userId}, {"$set": {"walletBalance": new_balance}})
+    auth_service.user_cache.invalidate_user(userId)
     
     # Record transaction
     transaction = WalletTransaction(
@@ -4386,6 +4641,7 @@ async def make_payment(request: PaymentRequest, userId: str):
     # Deduct amount
     new_balance = current_balance - request.amount
     await db.users.update_one({"id": userId}, {"$set": {"walletBalance": new_balance}})
+    auth_service.user_cache.invalidate_user(userId)
     
     # Record transaction
     transaction = WalletTransaction(
@@ -4729,24 +4985,6 @@ async def remove_bookmark(userId: str, postId: str):
     
     return {"success": True}
 
-@api_router.get("/bookmarks/{userId}")
-async def get_user_bookmarks(userId: str):
-    """Get user's bookmarks"""
-    bookmarks = await db.bookmarks.find({"userId": userId}, {"_id": 0}).sort("createdAt", -1).to_list(100)
-    
-    # Enrich with post details
-    posts = []
-    for bookmark in bookmarks:
-        post = await db.posts.find_one({"id": bookmark["postId"]}, {"_id": 0})
-        if post:
-            # Get author details
-            author = await db.users.find_one({"id": post["authorId"]}, {"_id": 0})
-            if author:
-                post["author"] = author
-            posts.append(post)
-    
-    return posts
-
 # ===== TRIBE CHALLENGES ROUTES =====
 
 @api_router.get("/tribes/{tribeId}/challenges")
@@ -4810,26 +5048,6 @@ async def complete_challenge(challengeId: str, userId: str):
 
 # ===== QR CODE HELPER =====
 
-def generate_qr_code_base64(data: str) -> str:
-    """Generate QR code and return as base64 string"""
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=10,
-        border=4,
-    )
-    qr.add_data(data)
-    qr.make(fit=True)
-    
-    img = qr.make_image(fill_color="black", back_color="white")
-    
-    # Convert to base64
-    buffer = io.BytesIO()
-    img.save(buffer, format='PNG')
-    img_str = base64.b64encode(buffer.getvalue()).decode()
-    
-    return f"data:image/png;base64,{img_str}"
-
 # ===== EVENT TICKETS ROUTES =====
 
 @api_router.post("/events/{eventId}/tickets")
@@ -4853,8 +5071,7 @@ async def claim_event_ticket(eventId: str, userId: str, tier: str = "General"):
     ticket_dict = ticket.model_dump()
     
     # Generate QR code with ticket information
-    qr_data = f"TICKET:{ticket_dict['id']}:QR:{ticket_dict['qrCode']}:EVENT:{eventId}"
-    ticket_dict['qrCodeImage'] = generate_qr_code_base64(qr_data)
+    await ticket_qr.create([ticket_dict])
     
     await db.event_tickets.insert_one(ticket_dict)
     # Remove MongoDB ObjectId to avoid serialization issues
@@ -4865,18 +5082,16 @@ async def claim_event_ticket(eventId: str, userId: str, tier: str = "General"):
 @api_router.get("/tickets/{userId}")
 async def get_user_tickets(userId: str):
     """Get user's event tickets"""
-    tickets = await db.event_tickets.find({"userId": userId, "status": "active"}, {"_id": 0}).to_list(100)
+    tickets = await db.event_tickets.find(
+        {"userId": userId, "status": "active"}, {"_id": 0, "qrCodeImage": 0}
+    ).to_list(100)
     
-    # Enrich with event details and regenerate QR codes if needed
+    # Enrich with event details; QR images are fetched (and rendered if missing) by URL
     for ticket in tickets:
         event = await db.events.find_one({"id": ticket["eventId"]}, {"_id": 0})
         if event:
             ticket["event"] = event
-        
-        # Regenerate QR code if not present
-        if "qrCodeImage" not in ticket:
-            qr_data = f"TICKET:{ticket['id']}:QR:{ticket['qrCode']}:EVENT:{ticket['eventId']}"
-            ticket['qrCodeImage'] = generate_qr_code_base64(qr_data)
+        ticket["qrCodeUrl"] = ticket_qr_url(ticket["id"])
     
     return tickets
 
@@ -4900,6 +5115,61 @@ async def use_ticket(ticketId: str, qrCode: str):
     
     return {"success": True, "message": "Ticket validated"}
 
+MAX_SCAN_BATCH = 5000
+
+@api_router.post("/events/{eventId}/scans/verify")
+async def verify_ticket_scan(eventId: str, scan: TicketScan):
+    """Gate check of one scanned QR code: signature only, no database read for signed tickets.
+
+    Re-entry is caught when the gate's scans are synced; scanners should also
+    keep the ids they admitted locally.
+    """
+    scanned = ticket_qr.verify(scan.payload)
+    if scanned is None:
+        return {"valid": False, "reason": "invalid_signature"}
+    if scanned["eventId"] != eventId:
+        return {"valid": False, "ticketId": scanned["ticketId"], "reason": "wrong_event"}
+    if not scanned["signed"]:
+        # Printed before signing: fall back to checking the secret code
+        ticket = await db.event_tickets.find_one(
+            {"id": scanned["ticketId"], "qrCode": scanned["qrCode"], "status": "active"}, {"_id": 0, "id": 1}
+        )
+        if not ticket:
+            return {"valid": False, "ticketId": scanned["ticketId"], "reason": "not_found"}
+    return {"valid": True, "ticketId": scanned["ticketId"]}
+
+@api_router.post("/events/{eventId}/scans/sync")
+async def sync_ticket_scans(eventId: str, batch: TicketScanBatch):
+    """Mark a batch of gate scans used in one bulk write and report duplicates"""
+    if len(batch.scans) > MAX_SCAN_BATCH:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_SCAN_BATCH} scans per batch")
+    results = await ticket_qr.sync_scans(eventId, [scan.model_dump() for scan in batch.scans])
+    
+    # Award attendance credits for newly admitted tickets, in bulk
+    accepted = [result for result in results if result["status"] == "accepted"]
+    if accepted:
+        await db.loop_credits.insert_many([
+            LoopCredit(
+                userId=result["userId"], amount=50, type="earn",
+                source="event_attendance", description="Attended event"
+            ).model_dump()
+            for result in accepted
+        ])
+        now = datetime.now(timezone.utc).isoformat()
+        await db.user_analytics.bulk_write([
+            UpdateOne(
+                {"userId": result["userId"]},
+                {"$inc": {"totalCredits": 50}, "$set": {"lastUpdated": now}},
+                upsert=True
+            )
+            for result in accepted
+        ], ordered=False)
+    
+    summary = {status: 0 for status in ("accepted", "duplicate", "wrong_event", "invalid")}
+    for result in results:
+        summary[result["status"]] += 1
+    return {"success": True, "summary": summary, "results": results}
+
 # ===== USER INTERESTS & ONBOARDING =====
 
 @api_router.post("/users/{userId}/interests")
@@ -5273,24 +5543,7 @@ async def get_admin_dashboard(adminUserId: str):
         "timestamp": datetime.now(timezone.utc).isoformat()
     }
 
-# ===== USER SETTINGS ROUTES =====
-
-@api_router.put("/users/{userId}/settings")
-async def update_user_settings(userId: str, updates: dict):
-    """Update user profile settings"""
-    user = await db.users.find_one({"id": userId}, {"_id": 0})
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    # Allowed fields to update
-    allowed_fields = ["name", "bio", "avatar", "location", "website", "interests"]
-    update_data = {k: v for k, v in updates.items() if k in allowed_fields}
-    
-    if update_data:
-        await db.users.update_one({"id": userId}, {"$set": update_data})
-    
-    updated_user = await db.users.find_one({"id": userId}, {"_id": 0})
-    return updated_user
+# ===== USER CONTENT ROUTES =====
 
 @api_router.get("/users/{userId}/content")
 async def get_user_content(userId: str, category: str = "all"):
@@ -5427,17 +5680,7 @@ async def accept_friend_request(requestId: str):
     await db.friendships.insert_one(friendship.model_dump())
     
     # **CRITICAL FIX: Add to each user's friends array for persistence**
-    # Add toUserId to fromUser's friends list
-    await db.users.update_one(
-        {"id": request["fromUserId"]},
-        {"$addToSet": {"friends": request["toUserId"]}}
-    )
-    
-    # Add fromUserId to toUser's friends list
-    await db.users.update_one(
-        {"id": request["toUserId"]},
-        {"$addToSet": {"friends": request["fromUserId"]}}
-    )
+    await social_graph.add_friend(request["fromUserId"], request["toUserId"])
     
     logger.info(f"Added bidirectional friendship: {request['fromUserId']} <-> {request['toUserId']}")
     
@@ -5563,8 +5806,9 @@ async def remove_friend(userId: str, friendUserId: str):
     u1, u2 = get_canonical_friend_order(userId, friendUserId)
     
     result = await db.friendships.delete_one({"userId1": u1, "userId2": u2})
+    removed = await social_graph.remove_friend(userId, friendUserId)
     
-    if result.deleted_count == 0:
+    if result.deleted_count == 0 and not removed:
         raise HTTPException(status_code=404, detail="Friendship not found")
     
     # Real-time notification
@@ -5599,6 +5843,7 @@ async def block_user(blockerId: str, blockedUserId: str):
     # Remove friendship if exists
     u1, u2 = get_canonical_friend_order(blockerId, blockedUserId)
     await db.friendships.delete_one({"userId1": u1, "userId2": u2})
+    await social_graph.remove_friend(blockerId, blockedUserId)
     
     # Cancel pending friend requests in both directions
     await db.friend_requests.update_many(
@@ -5797,11 +6042,11 @@ async def create_or_get_dm_thread(userId: str, peerUserId: str):
 async def get_thread_messages(threadId: str, userId: str, cursor: str = "", limit: int = 50):
     """Get messages from a thread"""
     # Verify user is participant
-    thread = await db.dm_threads.find_one({"id": threadId}, {"_id": 0})
-    if not thread:
+    participants = await dm_thread_participants.get(threadId)
+    if not participants:
         raise HTTPException(status_code=404, detail="Thread not found")
     
-    if userId not in [thread["user1Id"], thread["user2Id"]]:
+    if userId not in participants:
         raise HTTPException(status_code=403, detail="Not authorized")
     
     # Get messages
@@ -5826,15 +6071,15 @@ class SendMessageInput(BaseModel):
 async def send_message(threadId: str, userId: str, payload: SendMessageInput = Body(...)):
     """Send a message in a thread"""
     # Verify thread exists and user is participant
-    thread = await db.dm_threads.find_one({"id": threadId}, {"_id": 0})
-    if not thread:
+    participants = await dm_thread_participants.get(threadId)
+    if not participants:
         raise HTTPException(status_code=404, detail="Thread not found")
     
-    if userId not in [thread["user1Id"], thread["user2Id"]]:
+    if userId not in participants:
         raise HTTPException(status_code=403, detail="Not authorized")
     
     # Get peer
-    peer_id = thread["user2Id"] if thread["user1Id"] == userId else thread["user1Id"]
+    peer_id = participants[1] if participants[0] == userId else participants[0]
     
     # Check if blocked
     if await is_blocked(userId, peer_id) or await is_blocked(peer_id, userId):
@@ -5893,8 +6138,8 @@ async def send_message(threadId: str, userId: str, payload: SendMessageInput = B
 async def mark_thread_read(threadId: str, userId: str, lastReadMessageId: str):
     """Mark messages as read"""
     # Verify thread and user
-    thread = await db.dm_threads.find_one({"id": threadId}, {"_id": 0})
-    if not thread or userId not in [thread["user1Id"], thread["user2Id"]]:
+    participants = await dm_thread_participants.get(threadId)
+    if not participants or userId not in participants:
         raise HTTPException(status_code=403, detail="Not authorized")
     
     # Update or create read receipt
@@ -6145,9 +6390,7 @@ async def get_marketplace_products(category: str = "all", limit: int = 50):
     """Get marketplace products"""
     query = {"category": category} if category != "all" else {}
     products = await db.marketplace_products.find(query, {"_id": 0}).sort("createdAt", -1).limit(limit).to_list(limit)
-    for product in products:
-        seller = await db.users.find_one({"id": product["sellerId"]}, {"_id": 0})
-        product["seller"] = seller
+    await attach_authors(products, id_field="sellerId", target_field="seller")
     return products
 
 @api_router.post("/marketplace/products")
@@ -6255,6 +6498,7 @@ async def create_order(
     
     new_balance = current_balance - totalAmount
     await db.users.update_one({"id": userId}, {"$set": {"walletBalance": new_balance}})
+    auth_service.user_cache.invalidate_user(userId)
     
     # Clear cart
     await db.cart.delete_many({"userId": userId})
@@ -7016,6 +7260,7 @@ async def get_friends_for_messaging(userId: str):
             raise HTTPException(status_code=404, detail="User not found")
         
         friends = user.get("friends", [])
+        online = await presence.online_map(friends)
         
         # Get friend details
         friend_list = []
@@ -7030,7 +7275,7 @@ async def get_friends_for_messaging(userId: str):
                     "id": friend["id"],
                     "name": friend.get("name", "Unknown"),
                     "avatar": friend.get("avatar", ""),
-                    "online": friend.get("online", False),
+                    "online": online[friend_id],
                     "hasThread": thread is not None,
                     "threadId": thread["id"] if thread else None
                 })
@@ -7059,7 +7304,7 @@ async def start_conversation(userId: str, friendId: str):
                 "id": friend["id"],
                 "name": friend.get("name", "Unknown"),
                 "avatar": friend.get("avatar", ""),
-                "online": friend.get("online", False)
+                "online": await presence.is_online(friend["id"])
             }
         
         return {"success": True, "thread": thread}
@@ -7115,12 +7360,19 @@ async def startup_db_indexes():
         await db.posts.create_index("id", unique=True)
         await db.posts.create_index("authorId")  # For user's posts
         await db.posts.create_index([("createdAt", -1)])  # For timeline sorting
+        await db.posts.create_index([("createdAt", -1), ("id", -1)])  # Keyset timeline pagination
+        await db.posts.create_index([("authorId", 1), ("createdAt", -1), ("id", -1)])  # Tribe/profile pages
         await db.posts.create_index("likes")  # For like lookups
         
+        # Home timelines (fan-out-on-write feed)
+        await db.home_timelines.create_index("userId", unique=True)
+        await db.users.create_index("timelineFanout", sparse=True)
+        
         # Reels collection indexes
         await db.reels.create_index("id", unique=True)
         await db.reels.create_index("authorId")
         await db.reels.create_index([("createdAt", -1)])
+        await db.reels.create_index([("createdAt", -1), ("id", -1)])
         
         # DM threads indexes
         await db.dm_threads.create_index("id", unique=True)
@@ -7162,11 +7414,119 @@ async def startup_db_indexes():
         await db.vibe_capsules.create_index([("createdAt", -1)])
         await db.vibe_capsules.create_index("expiresAt", expireAfterSeconds=0)  # TTL index for auto-deletion
         
+        # Reaction edges (likes/reposts)
+        await reaction_service.ensure_indexes()
+        
+        # Hashtag lookups and hourly trending buckets (TTL)
+        await hashtag_service.ensure_indexes()
+        
+        # Global search inverted index
+        await search_service.ensure_indexes()
+        
+        # Friendship/request/block/mute lookups used by the relationship resolver
+        await relationship_service.ensure_indexes()
+        
+        # Media metadata records (bytes live in the GridFS bucket)
+        await media_store.ensure_indexes()
+        
+        # Shared trending scores, read in rank order
+        await trending_ranker.ensure_indexes()
+        
         logger.info("✅ Database indexes created successfully - Ready for 100k+ users")
     except Exception as e:
         logger.warning(f"⚠️ Some indexes already exist or had issues: {str(e)}")
         logger.info("✅ Database is ready for operations")
 
+@app.on_event("startup")
+async def start_counter_buffer():
+    counter_buffer.start()
+
+@app.on_event("startup")
+async def start_typing_throttle():
+    typing_throttle.start()
+
+@app.on_event("startup")
+async def start_presence():
+    presence.start()
+
+@app.on_event("startup")
+async def start_trending_ranker():
+    try:
+        await trending_ranker.start()
+    except Exception as e:
+        logger.error(f"Trending ranker failed to start: {e}")
+
+@app.on_event("startup")
+async def migrate_legacy_reactions():
+    """Move any remaining likedBy/repostedBy arrays into the reactions collection"""
+    try:
+        await reaction_service.migrate_legacy_arrays()
+    except Exception as e:
+        logger.error(f"Reaction migration failed: {e}")
+
+@app.on_event("startup")
+async def backfill_post_hashtags():
+    """Extract hashtags for posts created before write-time extraction, then seed the trending buckets"""
+    try:
+        await hashtag_service.backfill_posts()
+        await hashtag_service.backfill_trends()
+    except Exception as e:
+        logger.error(f"Hashtag backfill failed: {e}")
+
+@app.on_event("startup")
+async def backfill_profile_counters():
+    """Initialize friend/follower/following/post counters on existing users"""
+    try:
+        await social_graph.backfill_counts()
+    except Exception as e:
+        logger.error(f"Profile counter backfill failed: {e}")
+
+@app.on_event("startup")
+async def migrate_media_to_gridfs():
+    """Move legacy base64 blobs into GridFS and bring stored media under content addressing"""
+    try:
+        await media_store.migrate_legacy_blobs()
+        await media_store.backfill_hashes()
+        await media_store.deduplicate_existing()
+    except Exception as e:
+        logger.error(f"Media migration failed: {e}")
+
+@app.on_event("startup")
+async def migrate_ticket_qr_images():
+    """Move data-URL QR images out of ticket documents"""
+    try:
+        await ticket_qr.migrate_legacy_images()
+    except Exception as e:
+        logger.error(f"Ticket QR migration failed: {e}")
+
+@app.on_event("startup")
+async def load_media_cache():
+    """Pick up media cached on disk by earlier runs and keep in step with the other workers"""
+    try:
+        # Earlier runs cached under UPLOAD_DIR, where the static mount served the files directly
+        await asyncio.to_thread(shutil.rmtree, UPLOAD_DIR / "media-cache", True)
+        await asyncio.to_thread(media_cache.load)
+        media_cache.start()
+    except Exception as e:
+        logger.error(f"Media cache load failed: {e}")
+
+@app.on_event("startup")
+async def build_search_index():
+    """Build the search index for existing data (once per index version)"""
+    try:
+        await search_service.ensure_built()
+    except Exception as e:
+        logger.error(f"Search index build failed: {e}")
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    await counter_buffer.stop()
+    await trending_ranker.stop()
+    await typing_throttle.stop()
+    await presence.stop()
+    await media_cache.stop()
+    image_variants.shutdown()
+    ticket_qr.shutdown()
+    auth_service.shutdown()
+    await realtime.close()
     client.close()
\ No newline at end of file
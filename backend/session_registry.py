@@ -0,0 +1,69 @@
+"""
+Session Registry - socket.io sessions indexed both ways
+Keeps user -> set of sids and sid -> user, so resolving the user behind an
+incoming event and finding every device of a user are both O(1), and a second
+device no longer replaces the first.
+"""
+
+from typing import Dict, FrozenSet, Optional, Set
+
+
+class SessionRegistry:
+    def __init__(self):
+        self._sids_by_user: Dict[str, Set[str]] = {}
+        self._user_by_sid: Dict[str, str] = {}
+        self.connects = 0
+        self.disconnects = 0
+        self.peak_sessions = 0
+
+    def add(self, user_id: str, sid: str) -> bool:
+        """Register a session; returns True if it is the user's first (they just came online)"""
+        previous = self._user_by_sid.get(sid)
+        if previous is not None and previous != user_id:
+            self.remove(sid)
+        sids = self._sids_by_user.setdefault(user_id, set())
+        first = not sids
+        sids.add(sid)
+        self._user_by_sid[sid] = user_id
+        self.connects += 1
+        self.peak_sessions = max(self.peak_sessions, len(self._user_by_sid))
+        return first
+
+    def remove(self, sid: str) -> Optional[str]:
+        """Forget a session; returns its user, or None if the sid was unknown"""
+        user_id = self._user_by_sid.pop(sid, None)
+        if user_id is None:
+            return None
+        sids = self._sids_by_user.get(user_id)
+        if sids is not None:
+            sids.discard(sid)
+            if not sids:
+                del self._sids_by_user[user_id]
+        self.disconnects += 1
+        return user_id
+
+    def user_for(self, sid: str) -> Optional[str]:
+        return self._user_by_sid.get(sid)
+
+    def sids_for(self, user_id: str) -> FrozenSet[str]:
+        return frozenset(self._sids_by_user.get(user_id, ()))
+
+    def is_online(self, user_id: str) -> bool:
+        return user_id in self._sids_by_user
+
+    def __contains__(self, user_id: str) -> bool:
+        return user_id in self._sids_by_user
+
+    def __len__(self) -> int:
+        """Number of connected users"""
+        return len(self._sids_by_user)
+
+    def metrics(self) -> dict:
+        return {
+            "users": len(self._sids_by_user),
+            "sessions": len(self._user_by_sid),
+            "multiDeviceUsers": sum(1 for sids in self._sids_by_user.values() if len(sids) > 1),
+            "peakSessions": self.peak_sessions,
+            "connects": self.connects,
+            "disconnects": self.disconnects,
+        }
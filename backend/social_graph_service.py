@@ -0,0 +1,86 @@
+"""
+Social Graph Service - friend/follow edges with denormalized user counters
+Every change to a user's friends, followers or following arrays goes through a
+conditional update that also $inc's the matching counter in the user's `counts`
+sub-document, so the counter moves only when the edge actually changed. Post
+counts are adjusted by the post write paths. Profiles read the counters instead
+of counting edges on every view.
+"""
+
+import logging
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+logger = logging.getLogger(__name__)
+
+COUNT_FIELDS = ("friends", "followers", "following", "posts")
+
+
+def user_counts(user: dict) -> dict:
+    """Counters of a user document, zero for any not yet maintained"""
+    counts = user.get("counts") or {}
+    return {field: max(0, counts.get(field, 0)) for field in COUNT_FIELDS}
+
+
+class SocialGraphService:
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self.db = db
+
+    async def _add_edge(self, user_id: str, field: str, other_id: str) -> bool:
+        result = await self.db.users.update_one(
+            {"id": user_id, field: {"$ne": other_id}},
+            {"$push": {field: other_id}, "$inc": {f"counts.{field}": 1}}
+        )
+        return result.modified_count == 1
+
+    async def _remove_edge(self, user_id: str, field: str, other_id: str) -> bool:
+        result = await self.db.users.update_one(
+            {"id": user_id, field: other_id},
+            {"$pull": {field: other_id}, "$inc": {f"counts.{field}": -1}}
+        )
+        return result.modified_count == 1
+
+    async def add_friend(self, user_a: str, user_b: str) -> bool:
+        """Make two users friends (both directions). Returns False if they already were."""
+        added_a = await self._add_edge(user_a, "friends", user_b)
+        added_b = await self._add_edge(user_b, "friends", user_a)
+        return added_a or added_b
+
+    async def remove_friend(self, user_a: str, user_b: str) -> bool:
+        removed_a = await self._remove_edge(user_a, "friends", user_b)
+        removed_b = await self._remove_edge(user_b, "friends", user_a)
+        return removed_a or removed_b
+
+    async def follow(self, follower_id: str, target_id: str) -> bool:
+        added = await self._add_edge(follower_id, "following", target_id)
+        await self._add_edge(target_id, "followers", follower_id)
+        return added
+
+    async def unfollow(self, follower_id: str, target_id: str) -> bool:
+        removed = await self._remove_edge(follower_id, "following", target_id)
+        await self._remove_edge(target_id, "followers", follower_id)
+        return removed
+
+    async def adjust_post_count(self, user_id: str, delta: int):
+        await self.db.users.update_one({"id": user_id}, {"$inc": {"counts.posts": delta}})
+
+    async def recount(self, user_id: str) -> dict:
+        """Recompute a user's counters from the edge arrays and posts collection"""
+        user = await self.db.users.find_one(
+            {"id": user_id}, {"_id": 0, "friends": 1, "followers": 1, "following": 1}
+        )
+        if user is None:
+            return {}
+        counts = {field: len(set(user.get(field) or [])) for field in ("friends", "followers", "following")}
+        counts["posts"] = await self.db.posts.count_documents({"authorId": user_id})
+        await self.db.users.update_one({"id": user_id}, {"$set": {"counts": counts}})
+        return counts
+
+    async def backfill_counts(self):
+        """Initialize counters on users created before they were maintained"""
+        user_ids = [user["id"] async for user in self.db.users.find(
+            {"counts": {"$exists": False}, "id": {"$exists": True}}, {"_id": 0, "id": 1}
+        )]
+        for user_id in user_ids:
+            await self.recount(user_id)
+        if user_ids:
+            logger.info(f"Initialized profile counters on {len(user_ids)} users")
@@ -0,0 +1,91 @@
+"""
+Thread Participants - LRU cache of who is in a message thread
+Thread membership never changes after creation, so the participants of a
+thread are read from MongoDB once and then served from memory. Socket events
+that only need to know whom to notify (typing, read receipts, edits, call
+signalling) no longer cost a database round trip each.
+
+Works for both thread collections: dm_threads (user1Id/user2Id) and the
+messenger's threads (participants array).
+"""
+
+import os
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorCollection
+
+logger = logging.getLogger(__name__)
+
+THREAD_CACHE_MAX_ENTRIES = int(os.environ.get('THREAD_CACHE_MAX_ENTRIES', '50000'))
+
+
+class ThreadParticipantCache:
+    def __init__(self, collection: AsyncIOMotorCollection, max_entries: int = THREAD_CACHE_MAX_ENTRIES):
+        self.collection = collection
+        self.max_entries = max_entries
+        # thread id -> participant ids, least recently used first
+        self._participants: "OrderedDict[str, Tuple[str, ...]]" = OrderedDict()
+        # Concurrent misses for one thread (a burst of typing events) share a single query
+        self._loading: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, thread_id: str) -> Optional[Tuple[str, ...]]:
+        """Participant ids of a thread, or None if it does not exist (misses are not cached)"""
+        participants = self._participants.get(thread_id)
+        if participants is not None:
+            self._participants.move_to_end(thread_id)
+            self.hits += 1
+            return participants
+
+        loading = self._loading.get(thread_id)
+        if loading is not None:
+            return await asyncio.shield(loading)
+
+        self.misses += 1
+        loading = asyncio.get_running_loop().create_future()
+        self._loading[thread_id] = loading
+        try:
+            participants = await self._load(thread_id)
+        except asyncio.CancelledError:
+            loading.cancel()
+            raise
+        except Exception as e:
+            loading.set_exception(e)
+            loading.exception()  # mark retrieved; waiters still get it raised
+            raise
+        else:
+            loading.set_result(participants)
+        finally:
+            del self._loading[thread_id]
+        if participants is not None:
+            self._participants[thread_id] = participants
+            while len(self._participants) > self.max_entries:
+                self._participants.popitem(last=False)
+        return participants
+
+    async def _load(self, thread_id: str) -> Optional[Tuple[str, ...]]:
+        thread = await self.collection.find_one(
+            {"id": thread_id}, {"_id": 0, "participants": 1, "user1Id": 1, "user2Id": 1}
+        )
+        if thread is None:
+            return None
+        if "participants" in thread:
+            return tuple(thread["participants"])
+        return (thread["user1Id"], thread["user2Id"])
+
+    def invalidate(self, thread_id: str):
+        """Forget a thread (call when it is deleted)"""
+        self._participants.pop(thread_id, None)
+
+    def metrics(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "threads": len(self._participants),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,231 @@
+"""
+Ticket QR Service - event ticket QR images rendered off the event loop
+QR rendering (matrix construction in pure Python plus PNG encoding) runs in a
+process pool, and the tickets of a multi-ticket booking render concurrently.
+Each ticket's PNG is stored once as binary in `ticket_qr_codes` and served by
+an image endpoint, instead of a data-URL string inside the ticket document.
+
+QR payloads carry an HMAC-SHA256 signature over the ticket id, secret code and
+event, so a gate can check a scan with CPU alone. Scans are reconciled in
+batches: one bulk_write marks every scanned ticket used, and tickets that were
+already used are reported back as duplicates.
+"""
+
+import io
+import os
+import re
+import hmac
+import uuid
+import base64
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+import qrcode
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+QR_WORKERS = int(os.environ.get('QR_WORKERS', str(min(2, os.cpu_count() or 1))))
+# Bumped whenever the payload format changes; older stored images are re-rendered
+QR_PAYLOAD_VERSION = 2
+# 128-bit truncated HMAC keeps the QR code small and is far beyond guessable
+SIGNATURE_BYTES = 16
+PAYLOAD_PATTERN = re.compile(
+    r"^TICKET:(?P<id>[\w-]+):QR:(?P<qr>[\w-]+):EVENT:(?P<event>[\w-]+)(?::SIG:(?P<sig>[\w-]+))?$"
+)
+
+
+def render_qr_png(data: str) -> bytes:
+    """PNG of a QR code for `data`. Runs in a worker process."""
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_L,
+        box_size=10,
+        border=4,
+    )
+    qr.add_data(data)
+    qr.make(fit=True)
+    buffer = io.BytesIO()
+    qr.make_image(fill_color="black", back_color="white").save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def ticket_qr_url(ticket_id: str) -> str:
+    # Versioned so clients holding an image cached as immutable fetch the new format
+    return f"/api/tickets/{ticket_id}/qr.png?v={QR_PAYLOAD_VERSION}"
+
+
+class TicketQRService:
+    def __init__(self, db: AsyncIOMotorDatabase, secret: str, workers: int = QR_WORKERS):
+        self.db = db
+        # Dedicated key derived from the app secret, so QR signatures cannot be replayed as anything else
+        self._key = hmac.new(secret.encode(), b"ticket-qr", hashlib.sha256).digest()
+        self.workers = workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self.rendered = 0
+        self.verified = 0
+        self.rejected = 0
+        self.scans_synced = 0
+        self.duplicates = 0
+
+    def _signature(self, ticket_id: str, qr_code: str, event_id: str) -> str:
+        digest = hmac.new(self._key, f"{ticket_id}:{qr_code}:{event_id}".encode(), hashlib.sha256).digest()
+        return base64.urlsafe_b64encode(digest[:SIGNATURE_BYTES]).decode().rstrip("=")
+
+    def payload(self, ticket: dict) -> str:
+        """Signed text encoded in a ticket's QR code"""
+        signature = self._signature(ticket["id"], ticket["qrCode"], ticket["eventId"])
+        return f"TICKET:{ticket['id']}:QR:{ticket['qrCode']}:EVENT:{ticket['eventId']}:SIG:{signature}"
+
+    def verify(self, payload: str) -> Optional[dict]:
+        """{ticketId, qrCode, eventId, signed} for a scanned payload, or None if it is forged or malformed.
+
+        Pure CPU, no database access. Payloads printed before signing was
+        introduced parse with signed=False; only a database check can vouch for those.
+        """
+        match = PAYLOAD_PATTERN.match((payload or "").strip())
+        if match is None:
+            self.rejected += 1
+            return None
+        scanned = {"ticketId": match["id"], "qrCode": match["qr"], "eventId": match["event"], "signed": False}
+        if match["sig"] is not None:
+            expected = self._signature(match["id"], match["qr"], match["event"])
+            if not hmac.compare_digest(expected, match["sig"]):
+                self.rejected += 1
+                return None
+            scanned["signed"] = True
+        self.verified += 1
+        return scanned
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: forking a process that runs the event loop and driver threads is unsafe
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    async def render(self, ticket: dict) -> bytes:
+        png = await asyncio.get_running_loop().run_in_executor(self._executor(), render_qr_png, self.payload(ticket))
+        self.rendered += 1
+        return png
+
+    async def create(self, tickets: List[dict]):
+        """Render and store the QR images of new tickets (concurrently), setting each ticket's qrCodeUrl"""
+        if not tickets:
+            return
+        images = await asyncio.gather(*(self.render(ticket) for ticket in tickets))
+        await self.db.ticket_qr_codes.bulk_write([
+            self._upsert(ticket["id"], png, QR_PAYLOAD_VERSION) for ticket, png in zip(tickets, images)
+        ], ordered=False)
+        for ticket in tickets:
+            ticket["qrCodeUrl"] = ticket_qr_url(ticket["id"])
+
+    @staticmethod
+    def _upsert(ticket_id: str, png: bytes, version: int) -> UpdateOne:
+        return UpdateOne({"_id": ticket_id}, {"$set": {
+            "png": png,
+            "sha256": hashlib.sha256(png).hexdigest(),
+            "version": version,
+            "createdAt": datetime.now(timezone.utc).isoformat(),
+        }}, upsert=True)
+
+    async def image(self, ticket_id: str) -> Optional[Tuple[bytes, str]]:
+        """(PNG bytes, ETag) for a ticket, rendering it on first request for older tickets"""
+        stored = await self.db.ticket_qr_codes.find_one({"_id": ticket_id})
+        if stored is None or stored.get("version") != QR_PAYLOAD_VERSION:
+            ticket = await self.db.event_tickets.find_one(
+                {"id": ticket_id}, {"_id": 0, "id": 1, "qrCode": 1, "eventId": 1}
+            )
+            if ticket is None:
+                return None
+            await self.create([ticket])
+            stored = await self.db.ticket_qr_codes.find_one({"_id": ticket_id})
+        return bytes(stored["png"]), f'"{stored["sha256"]}"'
+
+    async def migrate_legacy_images(self):
+        """Move data-URL `qrCodeImage` strings out of event_tickets into ticket_qr_codes"""
+        migrated = 0
+        async for ticket in self.db.event_tickets.find(
+            {"qrCodeImage": {"$exists": True}}, {"_id": 0, "id": 1, "qrCodeImage": 1}
+        ):
+            data_url = ticket.get("qrCodeImage") or ""
+            if data_url.startswith("data:image/png;base64,"):
+                png = base64.b64decode(data_url.split(",", 1)[1])
+                await self.db.ticket_qr_codes.bulk_write([self._upsert(ticket["id"], png, 1)])
+            await self.db.event_tickets.update_one({"id": ticket["id"]}, {"$unset": {"qrCodeImage": ""}})
+            migrated += 1
+        if migrated:
+            logger.info(f"Moved {migrated} ticket QR images out of event_tickets")
+
+    async def sync_scans(self, event_id: str, scans: List[dict]) -> List[dict]:
+        """Mark a batch of gate scans used; one result per scan, in order.
+
+        Each scan is {payload, scannedAt?, gateId?}. Status is "accepted" (this
+        batch marked the ticket used), "duplicate" (already used, possibly by
+        another gate or earlier in this batch), "wrong_event" or "invalid"
+        (forged, unknown or cancelled). One bulk_write and one read, whatever
+        the batch size; the update filter also checks the secret code, which
+        is what admits unsigned legacy payloads.
+        """
+        now = datetime.now(timezone.utc).isoformat()
+        batch_id = str(uuid.uuid4())
+        results: List[dict] = []
+        first_scan: Dict[str, int] = {}
+        operations = []
+        for scan in scans:
+            scanned = self.verify(scan.get("payload"))
+            result = {"ticketId": scanned["ticketId"] if scanned else None, "status": "invalid"}
+            results.append(result)
+            if scanned is None:
+                continue
+            if scanned["eventId"] != event_id:
+                result["status"] = "wrong_event"
+                continue
+            if scanned["ticketId"] in first_scan:
+                result["status"] = "duplicate"
+                continue
+            first_scan[scanned["ticketId"]] = len(results) - 1
+            operations.append(UpdateOne(
+                {"id": scanned["ticketId"], "qrCode": scanned["qrCode"], "eventId": event_id, "status": "active"},
+                {"$set": {
+                    "status": "used",
+                    "usedAt": scan.get("scannedAt") or now,
+                    "usedGate": scan.get("gateId"),
+                    "scanBatchId": batch_id,
+                }}
+            ))
+
+        if operations:
+            await self.db.event_tickets.bulk_write(operations, ordered=False)
+            async for ticket in self.db.event_tickets.find(
+                {"id": {"$in": list(first_scan)}, "eventId": event_id},
+                {"_id": 0, "id": 1, "userId": 1, "status": 1, "scanBatchId": 1, "usedAt": 1}
+            ):
+                result = results[first_scan[ticket["id"]]]
+                if ticket.get("scanBatchId") == batch_id:
+                    result.update(status="accepted", userId=ticket["userId"])
+                elif ticket.get("status") == "used":
+                    result.update(status="duplicate", usedAt=ticket.get("usedAt"))
+
+        self.scans_synced += len(scans)
+        self.duplicates += sum(1 for result in results if result["status"] == "duplicate")
+        return results
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def metrics(self) -> dict:
+        return {
+            "rendered": self.rendered,
+            "verified": self.verified,
+            "rejected": self.rejected,
+            "scansSynced": self.scans_synced,
+            "duplicates": self.duplicates,
+        }
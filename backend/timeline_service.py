@@ -0,0 +1,170 @@
+"""
+Home Timeline Service - fan-out-on-write personalized feeds
+Keeps a capped, newest-first list of post references per user so the home feed
+is served from one indexed read instead of scanning the posts collection.
+Authors with very large audiences are not fanned out; their posts are merged
+into readers' feeds at read time instead.
+"""
+
+import os
+import logging
+from typing import List, Optional, Tuple
+from pymongo import UpdateOne
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of post references kept per user timeline
+TIMELINE_MAX_ENTRIES = int(os.environ.get('TIMELINE_MAX_ENTRIES', '800'))
+# Authors whose audience exceeds this are served with fan-out-on-read
+FANOUT_MAX_AUDIENCE = int(os.environ.get('FANOUT_MAX_AUDIENCE', '5000'))
+# Followers updated per bulk_write call
+FANOUT_BATCH_SIZE = 1000
+
+
+def _entry_key(entry: dict) -> tuple:
+    return (entry["createdAt"], entry["id"])
+
+
+class TimelineService:
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self.db = db
+
+    @staticmethod
+    def make_entry(post: dict) -> dict:
+        """Timeline reference for a post (`id` is the post ID)"""
+        return {"id": post["id"], "authorId": post["authorId"], "createdAt": post["createdAt"]}
+
+    async def get_audience(self, author_id: str) -> Tuple[set, bool]:
+        """Users whose home feed should contain this author's posts, and whether
+        the author is currently served with fan-out-on-read"""
+        author = await self.db.users.find_one(
+            {"id": author_id}, {"_id": 0, "followers": 1, "friends": 1, "timelineFanout": 1}
+        )
+        audience = {author_id}
+        if not author:
+            return audience, False
+        audience.update(author.get("followers", []))
+        audience.update(author.get("friends", []))
+        return audience, author.get("timelineFanout") == "read"
+
+    async def fan_out_post(self, post: dict):
+        """Push a new post onto the home timeline of everyone in the author's audience.
+
+        Only timelines that already exist are updated; a user without one gets it
+        built on first read. Failures are logged and never fail the write path.
+        """
+        try:
+            author_id = post["authorId"]
+            audience, served_on_read = await self.get_audience(author_id)
+
+            if len(audience) > FANOUT_MAX_AUDIENCE:
+                # Too many followers to write to: readers pull this author's posts instead
+                if not served_on_read:
+                    await self.db.users.update_one({"id": author_id}, {"$set": {"timelineFanout": "read"}})
+                logger.info(f"Skipping fan-out for {author_id}: audience of {len(audience)} served on read")
+                return
+            if served_on_read:
+                # Audience shrank back under the limit
+                await self.db.users.update_one({"id": author_id}, {"$unset": {"timelineFanout": ""}})
+
+            push = {"$push": {"entries": {
+                "$each": [self.make_entry(post)],
+                "$sort": {"createdAt": -1, "id": -1},
+                "$slice": TIMELINE_MAX_ENTRIES
+            }}}
+            user_ids = list(audience)
+            for start in range(0, len(user_ids), FANOUT_BATCH_SIZE):
+                batch = user_ids[start:start + FANOUT_BATCH_SIZE]
+                await self.db.home_timelines.bulk_write(
+                    [UpdateOne({"userId": user_id}, push) for user_id in batch],
+                    ordered=False
+                )
+        except Exception as e:
+            logger.error(f"Timeline fan-out failed for post {post.get('id')}: {e}")
+
+    async def _followed_author_ids(self, user_id: str) -> List[str]:
+        user = await self.db.users.find_one(
+            {"id": user_id}, {"_id": 0, "following": 1, "friends": 1}
+        )
+        if not user:
+            return []
+        return list(set(user.get("following", [])) | set(user.get("friends", [])))
+
+    @staticmethod
+    def _after_query(after: Optional[Tuple[str, str]]) -> dict:
+        if not after:
+            return {}
+        created_at, post_id = after
+        return {"$or": [
+            {"createdAt": {"$lt": created_at}},
+            {"createdAt": created_at, "id": {"$lt": post_id}}
+        ]}
+
+    async def _recent_posts_by(self, author_ids: List[str], limit: int, after=None) -> List[dict]:
+        """Newest top-level posts by the given authors, as timeline entries"""
+        if not author_ids:
+            return []
+        query = {"authorId": {"$in": author_ids}, "replyToPostId": None}
+        after_query = self._after_query(after)
+        if after_query:
+            query = {"$and": [query, after_query]}
+        posts = await self.db.posts.find(
+            query, {"_id": 0, "id": 1, "authorId": 1, "createdAt": 1}
+        ).sort([("createdAt", -1), ("id", -1)]).limit(limit).to_list(limit)
+        return [self.make_entry(post) for post in posts]
+
+    async def rebuild_timeline(self, user_id: str) -> List[dict]:
+        """Build a user's timeline from scratch (first read, or after it was dropped)"""
+        author_ids = await self._followed_author_ids(user_id) + [user_id]
+        entries = await self._recent_posts_by(author_ids, TIMELINE_MAX_ENTRIES)
+        await self.db.home_timelines.update_one(
+            {"userId": user_id},
+            {"$set": {"entries": entries}},
+            upsert=True
+        )
+        return entries
+
+    async def _load_page(self, user_id: str, limit: int, after: Optional[Tuple[str, str]]) -> Optional[dict]:
+        """The stored timeline cut down to one page by the server, or None if there is none"""
+        if not after:
+            return await self.db.home_timelines.find_one(
+                {"userId": user_id}, {"_id": 0, "entries": {"$slice": limit}}
+            )
+        created_at, post_id = after
+        older = {"$or": [
+            {"$lt": ["$$entry.createdAt", created_at]},
+            {"$and": [{"$eq": ["$$entry.createdAt", created_at]}, {"$lt": ["$$entry.id", post_id]}]},
+        ]}
+        pages = await self.db.home_timelines.aggregate([
+            {"$match": {"userId": user_id}},
+            {"$project": {"_id": 0, "entries": {"$slice": [
+                {"$filter": {"input": "$entries", "as": "entry", "cond": older}}, limit
+            ]}}},
+        ]).to_list(1)
+        return pages[0] if pages else None
+
+    async def get_timeline_entries(self, user_id: str, limit: int, after: Optional[Tuple[str, str]] = None) -> List[dict]:
+        """One page of timeline entries, newest first, strictly after the `after` key"""
+        timeline = await self._load_page(user_id, limit, after)
+        if timeline is None:
+            entries = await self.rebuild_timeline(user_id)
+            if after:
+                entries = [entry for entry in entries if _entry_key(entry) < tuple(after)]
+            entries = entries[:limit]
+        else:
+            entries = timeline.get("entries", [])
+
+        # Merge posts from followed high-audience authors (fan-out-on-read)
+        followed = await self._followed_author_ids(user_id)
+        if followed:
+            pulled = await self.db.users.find(
+                {"id": {"$in": followed}, "timelineFanout": "read"}, {"_id": 0, "id": 1}
+            ).to_list(len(followed))
+            if pulled:
+                merged = {entry["id"]: entry for entry in entries}
+                for entry in await self._recent_posts_by([u["id"] for u in pulled], limit, after):
+                    merged.setdefault(entry["id"], entry)
+                entries = sorted(merged.values(), key=_entry_key, reverse=True)[:limit]
+
+        return entries
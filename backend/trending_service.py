@@ -0,0 +1,180 @@
+"""
+Trending Ranker - incrementally maintained, time-decayed post ranking
+Each post's engagement score (likes + replies*2 + reposts*3) decays exponentially
+with a configurable half-life and is updated from like, reply and repost events
+as they happen. Scores live in the `trending_scores` collection, so every worker
+ranks the same data: each document holds its events' weights grown to a common
+time base (`s`, relative to `base`) plus a `rank` that orders posts exactly as
+their decayed scores do at any moment. Events are single atomic pipeline
+updates. A background task periodically reads the top-K post IDs by rank, which
+the trending endpoint serves directly without scanning or sorting posts.
+"""
+
+import os
+import math
+import time
+import asyncio
+import logging
+from datetime import datetime, timezone, timedelta
+from typing import List, Optional
+from pymongo import UpdateOne
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+logger = logging.getLogger(__name__)
+
+TRENDING_HALF_LIFE_HOURS = float(os.environ.get('TRENDING_HALF_LIFE_HOURS', '12'))
+TRENDING_TOP_K = int(os.environ.get('TRENDING_TOP_K', '200'))
+TRENDING_PUBLISH_INTERVAL = float(os.environ.get('TRENDING_PUBLISH_INTERVAL', '30'))
+TRENDING_WINDOW_DAYS = 7
+# Scores that decayed below this are forgotten
+MIN_SCORE = 0.01
+# Rank of a score clamped to zero (far below MIN_SCORE at any time base)
+ZERO_SCORE = 1e-12
+# Time bases older than this are moved forward so `s` never overflows
+REBASE_AFTER_SECONDS = TRENDING_WINDOW_DAYS * 86400
+
+EVENT_WEIGHTS = {"like": 1.0, "reply": 2.0, "repost": 3.0}
+
+
+def _parse_timestamp(value: str) -> Optional[float]:
+    try:
+        parsed = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+class TrendingRanker:
+    def __init__(self, db: AsyncIOMotorDatabase, half_life_hours: float = TRENDING_HALF_LIFE_HOURS,
+                 top_k: int = TRENDING_TOP_K, publish_interval: float = TRENDING_PUBLISH_INTERVAL):
+        self.db = db
+        self.decay_rate = math.log(2) / (half_life_hours * 3600)
+        self.top_k = top_k
+        self.publish_interval = publish_interval
+        self._published: List[str] = []
+        self.published_at: Optional[str] = None
+        self.tracked = 0
+        self._task: Optional[asyncio.Task] = None
+
+    async def ensure_indexes(self):
+        await self.db.trending_scores.create_index([("rank", -1)])
+
+    def _rank_expression(self) -> dict:
+        # ln(score at `base`) + rate*base == ln(current score) + rate*now, for every post
+        return {"$add": [
+            {"$ln": {"$max": ["$s", ZERO_SCORE]}},
+            {"$multiply": [self.decay_rate, "$base"]},
+        ]}
+
+    def _threshold(self, now: float) -> float:
+        """Lowest rank whose score has not yet decayed below MIN_SCORE"""
+        return math.log(MIN_SCORE) + self.decay_rate * now
+
+    async def record(self, post_id: str, event: str, count: int = 1, at: Optional[str] = None):
+        """Apply an engagement event that happened at `at` (default now).
+
+        Use a negative count to retract one (unlike, unrepost), passing the time
+        of the original event so only what is left of its weight is removed; the
+        score never goes below zero.
+        """
+        event_at = _parse_timestamp(at) if at else None
+        if event_at is None:
+            event_at = time.time()
+        base = {"$ifNull": ["$base", event_at]}
+        weight = {"$multiply": [
+            EVENT_WEIGHTS[event] * count,
+            {"$exp": {"$multiply": [self.decay_rate, {"$subtract": [event_at, base]}]}},
+        ]}
+        await self.db.trending_scores.update_one(
+            {"_id": post_id},
+            [
+                {"$set": {"base": base, "s": {"$max": [0.0, {"$add": [{"$ifNull": ["$s", 0.0]}, weight]}]}}},
+                {"$set": {"rank": self._rank_expression()}},
+            ],
+            upsert=True
+        )
+
+    async def bootstrap(self):
+        """Seed scores from the stats of recent posts, decayed by post age (once, when empty)"""
+        if await self.db.trending_scores.find_one({}, {"_id": 1}) is not None:
+            return
+        now = time.time()
+        since = (datetime.now(timezone.utc) - timedelta(days=TRENDING_WINDOW_DAYS)).isoformat()
+        ops = []
+        async for post in self.db.posts.find(
+            {"createdAt": {"$gte": since}}, {"_id": 0, "id": 1, "stats": 1, "createdAt": 1}
+        ):
+            stats = post.get("stats") or {}
+            engagement = (stats.get("likes", 0) * EVENT_WEIGHTS["like"]
+                          + stats.get("replies", 0) * EVENT_WEIGHTS["reply"]
+                          + stats.get("reposts", 0) * EVENT_WEIGHTS["repost"])
+            created = min(_parse_timestamp(post.get("createdAt")) or now, now)
+            if engagement > 0:
+                # $setOnInsert: other workers seeding at the same time, or live events, win
+                ops.append(UpdateOne(
+                    {"_id": post["id"]},
+                    {"$setOnInsert": {
+                        "base": created, "s": engagement,
+                        "rank": math.log(engagement) + self.decay_rate * created,
+                    }},
+                    upsert=True
+                ))
+        if ops:
+            await self.db.trending_scores.bulk_write(ops, ordered=False)
+
+    async def publish(self):
+        """Reload the published top-K from the shared scores and drop scores that decayed away"""
+        now = time.time()
+        threshold = self._threshold(now)
+        await self.db.trending_scores.delete_many({"rank": {"$lt": threshold}})
+        # Move old time bases forward; rank is unchanged by this
+        await self.db.trending_scores.update_many(
+            {"base": {"$lt": now - REBASE_AFTER_SECONDS}},
+            [{"$set": {
+                "s": {"$multiply": ["$s", {"$exp": {"$multiply": [self.decay_rate, {"$subtract": ["$base", now]}]}}]},
+                "base": now,
+            }}]
+        )
+        top = await self.db.trending_scores.find(
+            {"rank": {"$gte": threshold}}, {"_id": 1}
+        ).sort("rank", -1).limit(self.top_k).to_list(self.top_k)
+        self._published = [doc["_id"] for doc in top]
+        self.tracked = await self.db.trending_scores.count_documents({})
+        self.published_at = datetime.now(timezone.utc).isoformat()
+
+    def top(self, limit: int) -> List[str]:
+        """Most recently published ranking, best first"""
+        return self._published[:limit]
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.publish_interval)
+            try:
+                await self.publish()
+            except Exception as e:
+                logger.error(f"Trending publish failed: {e}")
+
+    async def start(self):
+        """Bootstrap from the database and start the publish loop (app startup hook)"""
+        if self._task is None:
+            await self.bootstrap()
+            await self.publish()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def metrics(self) -> dict:
+        return {
+            "trackedPosts": self.tracked,
+            "published": len(self._published),
+            "publishedAt": self.published_at,
+        }
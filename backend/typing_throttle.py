@@ -0,0 +1,98 @@
+"""
+Typing Throttle - per (thread, user) typing state machine
+Clients send a typing event on every keystroke. Only state changes are worth
+broadcasting: started typing, stopped typing, and a refresh at most every
+TYPING_REFRESH_SECONDS while typing continues (receivers hide the indicator
+3s after the last event). A user whose stop event never arrives (closed tab,
+dropped connection) is expired after TYPING_TIMEOUT_SECONDS of silence.
+"""
+
+import os
+import time
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+TYPING_REFRESH_SECONDS = float(os.environ.get('TYPING_REFRESH_SECONDS', '2.0'))
+TYPING_TIMEOUT_SECONDS = float(os.environ.get('TYPING_TIMEOUT_SECONDS', '5.0'))
+TYPING_SWEEP_INTERVAL = 1.0
+
+
+class TypingThrottle:
+    def __init__(
+        self,
+        on_expire: Callable[[str, str], Awaitable],
+        refresh_interval: float = TYPING_REFRESH_SECONDS,
+        timeout: float = TYPING_TIMEOUT_SECONDS,
+    ):
+        self.on_expire = on_expire
+        self.refresh_interval = refresh_interval
+        self.timeout = timeout
+        # (thread id, user id) -> [last event at, last broadcast at], only while typing
+        self._typing: Dict[Tuple[str, str], List[float]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.received = 0
+        self.broadcast = 0
+        self.expired = 0
+
+    def update(self, thread_id: str, user_id: str, typing: bool) -> bool:
+        """Record a client typing event; True if it should be broadcast"""
+        self.received += 1
+        now = time.monotonic()
+        key = (thread_id, user_id)
+        state = self._typing.get(key)
+        if not typing:
+            if state is None:
+                return False  # already stopped
+            del self._typing[key]
+        elif state is None:
+            self._typing[key] = [now, now]
+        else:
+            state[0] = now
+            if now - state[1] < self.refresh_interval:
+                return False
+            state[1] = now
+        self.broadcast += 1
+        return True
+
+    async def expire(self):
+        """Stop everyone who has been silent for longer than the timeout"""
+        deadline = time.monotonic() - self.timeout
+        stale = [key for key, (last_event, _) in self._typing.items() if last_event < deadline]
+        for key in stale:
+            del self._typing[key]
+            self.expired += 1
+            try:
+                await self.on_expire(*key)
+            except Exception as e:
+                logger.error(f"Typing expiry for {key} failed: {e}")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(TYPING_SWEEP_INTERVAL)
+            await self.expire()
+
+    def start(self):
+        """Start the expiry loop (call from an app startup hook)"""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def metrics(self) -> dict:
+        return {
+            "typing": len(self._typing),
+            "received": self.received,
+            "broadcast": self.broadcast,
+            "suppressed": self.received - self.broadcast,
+            "expired": self.expired,
+        }
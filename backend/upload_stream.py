@@ -0,0 +1,112 @@
+"""
+Upload Stream - incremental multipart/form-data reading
+Parses a request body as it arrives with python-multipart's push parser (the
+same one Starlette uses) and hands the bytes of a single file field to the
+caller as they are parsed, instead of spooling the whole form first. Other
+form fields are ignored.
+"""
+
+from typing import AsyncIterator, NamedTuple, Optional, Union
+
+import python_multipart
+from python_multipart.multipart import parse_options_header
+
+
+class UploadStreamError(Exception):
+    """Raised for a request body that is not a usable multipart upload"""
+
+
+class FilePartHeader(NamedTuple):
+    filename: str
+    content_type: str
+
+
+class _FilePartCollector:
+    """python-multipart callbacks that queue (header | data | end) events for one field"""
+
+    def __init__(self, field_name: str):
+        self.field_name = field_name
+        self.events: list = []
+        self._header_name = b""
+        self._header_value = b""
+        self._headers = {}
+        self._in_field = False
+
+    def on_part_begin(self):
+        self._headers = {}
+        self._in_field = False
+
+    def on_header_field(self, data: bytes, start: int, end: int):
+        self._header_name += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def on_header_end(self):
+        self._headers[self._header_name.lower()] = self._header_value
+        self._header_name = b""
+        self._header_value = b""
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        name = options.get(b"name", b"").decode("utf-8", "replace")
+        if name == self.field_name and b"filename" in options:
+            self._in_field = True
+            self.events.append(FilePartHeader(
+                filename=options[b"filename"].decode("utf-8", "replace"),
+                content_type=self._headers.get(b"content-type", b"application/octet-stream").decode("latin-1"),
+            ))
+
+    def on_part_data(self, data: bytes, start: int, end: int):
+        if self._in_field and end > start:
+            self.events.append(data[start:end])
+
+    def on_part_end(self):
+        if self._in_field:
+            self.events.append(None)
+            self._in_field = False
+
+
+async def multipart_file_stream(
+    body: AsyncIterator[bytes], content_type_header: Optional[str], field_name: str = "file"
+) -> AsyncIterator[Union[FilePartHeader, bytes]]:
+    """Yield the FilePartHeader of the first `field_name` file part, then its data chunks.
+
+    Memory use is bounded by the size of the chunks the server receives; the
+    generator stops as soon as that part ends.
+    """
+    content_type, params = parse_options_header(content_type_header or "")
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise UploadStreamError("Expected a multipart/form-data body")
+
+    collector = _FilePartCollector(field_name)
+    parser = python_multipart.MultipartParser(params[b"boundary"], {
+        "on_part_begin": collector.on_part_begin,
+        "on_part_data": collector.on_part_data,
+        "on_part_end": collector.on_part_end,
+        "on_header_field": collector.on_header_field,
+        "on_header_value": collector.on_header_value,
+        "on_header_end": collector.on_header_end,
+        "on_headers_finished": collector.on_headers_finished,
+    })
+
+    started = False
+    async for chunk in body:
+        if not chunk:
+            continue
+        try:
+            parser.write(chunk)
+        except Exception as e:
+            raise UploadStreamError(f"Malformed multipart body: {e}")
+        events, collector.events = collector.events, []
+        for event in events:
+            if event is None:
+                return
+            if isinstance(event, FilePartHeader):
+                if started:
+                    return
+                started = True
+            yield event
+    if not started:
+        raise UploadStreamError(f"Missing '{field_name}' file field")
+    raise UploadStreamError("Upload ended before the file was complete")
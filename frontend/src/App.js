@@ -97,6 +97,13 @@ function App() {
   };
 
   const logout = () => {
+    const token = localStorage.getItem("loopync_token");
+    if (token) {
+      // Best effort: drops the server's cached session (the socket closes with isAuthenticated)
+      axios.post(`${API}/auth/logout`, null, {
+        headers: { Authorization: `Bearer ${token}` }
+      }).catch(() => {});
+    }
     localStorage.removeItem("loopync_token");
     localStorage.removeItem("loopync_user");
     setCurrentUser(null);
@@ -106,7 +113,7 @@ function App() {
 
   return (
     <AuthContext.Provider value={{ currentUser, isAuthenticated, needsOnboarding, setNeedsOnboarding, login, logout, refreshUserData }}>
-      <WebSocketProvider>
+      <WebSocketProvider isAuthenticated={isAuthenticated}>
         <div className="App">
           {/* Global Call Manager - handles incoming calls */}
           {isAuthenticated && currentUser && <CallManager currentUser={currentUser} />}
@@ -123,7 +123,10 @@ const ComposerModal = ({ currentUser, onClose, onPostCreated }) => {
     try {
       console.log('Uploading file to:', `${API}/upload`);
       const res = await axios.post(`${API}/upload`, formData, {
-        headers: { "Content-Type": "multipart/form-data" },
+        headers: {
+          "Content-Type": "multipart/form-data",
+          Authorization: `Bearer ${localStorage.getItem("loopync_token")}`
+        },
         timeout: 60000 // 60 second timeout for large files
       });
       
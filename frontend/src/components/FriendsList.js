@@ -73,16 +73,9 @@ const FriendsList = ({ currentUser, onStartChat, onStartCall }) => {
 
   const loadSuggestions = async () => {
     try {
-      // Get all users except current user and existing friends
-      const usersRes = await axios.get(`${API}/users`);
-      const allUsers = usersRes.data.users || [];
-      
-      const friendIds = friends.map(f => f.id);
-      const suggestions = allUsers
-        .filter(u => u.id !== currentUser.id && !friendIds.includes(u.id))
-        .slice(0, 10);
-      
-      setSuggestions(suggestions);
+      // Server excludes friends, pending requests, blocked and muted users
+      const res = await axios.get(`${API}/users/${currentUser.id}/suggestions?limit=10`);
+      setSuggestions(res.data);
     } catch (error) {
       console.error('Error loading suggestions:', error);
     }
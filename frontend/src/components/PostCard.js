@@ -4,7 +4,7 @@ import { toast } from "sonner";
 import { useNavigate } from "react-router-dom";
 import UniversalShareModal from "./UniversalShareModal";
 import CommentsSection from "./CommentsSection";
-import { getMediaUrl, isVideoUrl } from "../utils/mediaUtils";
+import { getMediaUrl, getMediaSrcSet, isVideoUrl } from "../utils/mediaUtils";
 
 const PostCard = ({ post, currentUser, onLike, onRepost, onDelete }) => {
   const navigate = useNavigate();
@@ -96,7 +96,7 @@ const PostCard = ({ post, currentUser, onLike, onRepost, onDelete }) => {
 
       <div className="flex items-start gap-3">
         <img
-          src={post.author?.avatar || `https://api.dicebear.com/7.x/avataaars/svg?seed=${post.authorId}`}
+          src={getMediaUrl(post.author?.avatar, 'thumb') || `https://api.dicebear.com/7.x/avataaars/svg?seed=${post.authorId}`}
           alt={post.author?.name || 'User'}
           className="w-12 h-12 rounded-full ring-2 ring-cyan-400/20 cursor-pointer hover:ring-cyan-400/50 transition-all"
           onClick={() => navigate(`/profile/${post.authorId}`)}
@@ -201,7 +201,10 @@ const PostCard = ({ post, currentUser, onLike, onRepost, onDelete }) => {
               />
             ) : (
               <img
-                src={mediaUrl}
+                src={getMediaUrl(post.media, 'large')}
+                srcSet={getMediaSrcSet(post.media)}
+                sizes="(max-width: 640px) 100vw, 640px"
+                loading="lazy"
                 alt="Post media"
                 className="rounded-2xl w-full mb-3 hover:scale-[1.01] transition-transform cursor-pointer"
                 onClick={() => setShowReactions(true)}
@@ -77,7 +77,10 @@ const ReelComposerModal = ({ currentUser, onClose, onReelCreated }) => {
       console.log('Uploading video file:', selectedFile.name, 'Size:', (selectedFile.size / 1024 / 1024).toFixed(2), 'MB');
       
       const res = await axios.post(`${API}/upload`, formData, {
-        headers: { "Content-Type": "multipart/form-data" },
+        headers: {
+          "Content-Type": "multipart/form-data",
+          Authorization: `Bearer ${localStorage.getItem("loopync_token")}`
+        },
         timeout: 120000 // 2 minute timeout for large videos
       });
       
@@ -41,7 +41,10 @@ const VibeCapsuleUpload = ({ currentUser, onUploadComplete }) => {
       formData.append("file", file);
 
       const uploadRes = await axios.post(`${API}/upload`, formData, {
-        headers: { "Content-Type": "multipart/form-data" },
+        headers: {
+          "Content-Type": "multipart/form-data",
+          Authorization: `Bearer ${localStorage.getItem("loopync_token")}`
+        },
         onUploadProgress: (progressEvent) => {
           const percentCompleted = Math.round((progressEvent.loaded * 100) / progressEvent.total);
           setUploadProgress(percentCompleted);
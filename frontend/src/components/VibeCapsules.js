@@ -3,6 +3,7 @@ import axios from "axios";
 import { API } from "../App";
 import VibeCapsuleUpload from "./VibeCapsuleUpload";
 import VibeCapsuleViewer from "./VibeCapsuleViewer";
+import { getMediaUrl } from "../utils/mediaUtils";
 
 const VibeCapsules = ({ currentUser }) => {
   const [stories, setStories] = useState([]);
@@ -74,7 +75,7 @@ const VibeCapsules = ({ currentUser }) => {
                         <div className="w-16 h-16 rounded-full bg-gradient-to-r from-cyan-400 via-blue-500 to-purple-500 p-0.5">
                           <div className="w-full h-full rounded-full border-4 border-gray-900 overflow-hidden">
                             <img
-                              src={userStory.author.avatar || `https://api.dicebear.com/7.x/avataaars/svg?seed=${currentUser.name}`}
+                              src={getMediaUrl(userStory.author.avatar, 'thumb') || `https://api.dicebear.com/7.x/avataaars/svg?seed=${currentUser.name}`}
                               alt="Your Story"
                               className="w-full h-full object-cover"
                             />
@@ -118,7 +119,7 @@ const VibeCapsules = ({ currentUser }) => {
                       <div className="w-16 h-16 rounded-full bg-gradient-to-r from-pink-500 via-purple-500 to-cyan-500 p-0.5">
                         <div className="w-full h-full rounded-full border-4 border-gray-900 overflow-hidden">
                           <img
-                            src={story.author.avatar || `https://api.dicebear.com/7.x/avataaars/svg?seed=${story.author.name}`}
+                            src={getMediaUrl(story.author.avatar, 'thumb') || `https://api.dicebear.com/7.x/avataaars/svg?seed=${story.author.name}`}
                             alt={story.author.name}
                             className="w-full h-full object-cover"
                           />
@@ -1,9 +1,12 @@
-import React, { createContext, useContext, useEffect, useState, useCallback } from 'react';
+import React, { createContext, useContext, useEffect, useState, useCallback, useRef } from 'react';
 import { io } from 'socket.io-client';
 import { toast } from 'sonner';
 
 const WebSocketContext = createContext(null);
 
+// Keeps the user's last-seen time fresh on the server while the app is open
+const HEARTBEAT_INTERVAL_MS = 30000;
+
 export const useWebSocket = () => {
   const context = useContext(WebSocketContext);
   if (!context) {
@@ -13,10 +16,18 @@ export const useWebSocket = () => {
   return context;
 };
 
-export const WebSocketProvider = ({ children }) => {
+export const WebSocketProvider = ({ children, isAuthenticated }) => {
   const [socket, setSocket] = useState(null);
   const [connected, setConnected] = useState(false);
-  const [onlineUsers, setOnlineUsers] = useState(new Set());
+  // userId -> { online, lastSeen } for the friends this client follows
+  const [presence, setPresence] = useState({});
+  const presenceSubscriptions = useRef(new Set());
+
+  const subscribeOnSocket = (targetSocket, userIds) => {
+    targetSocket.emit('presence_subscribe', { userIds }, (snapshot) => {
+      setPresence(prev => ({ ...prev, ...(snapshot || {}) }));
+    });
+  };
 
   useEffect(() => {
     const token = localStorage.getItem('loopync_token');
@@ -42,14 +53,28 @@ export const WebSocketProvider = ({ children }) => {
       path: '/socket.io/'
     });
 
+    let heartbeat = null;
+
     newSocket.on('connect', () => {
       console.log('✅ WebSocket connected');
       setConnected(true);
+      clearInterval(heartbeat);
+      heartbeat = setInterval(() => newSocket.emit('heartbeat'), HEARTBEAT_INTERVAL_MS);
+      // Presence subscriptions do not survive a reconnect
+      if (presenceSubscriptions.current.size > 0) {
+        subscribeOnSocket(newSocket, [...presenceSubscriptions.current]);
+      }
     });
 
     newSocket.on('disconnect', () => {
       console.log('❌ WebSocket disconnected');
       setConnected(false);
+      clearInterval(heartbeat);
+    });
+
+    // Friends coming online / going offline
+    newSocket.on('presence', (data) => {
+      setPresence(prev => ({ ...prev, [data.userId]: { online: data.online, lastSeen: data.lastSeen } }));
     });
 
     newSocket.on('connect_error', (error) => {
@@ -131,9 +156,23 @@ export const WebSocketProvider = ({ children }) => {
     // Cleanup
     return () => {
       console.log('Cleaning up WebSocket connection');
+      clearInterval(heartbeat);
       newSocket.close();
+      setSocket(null);
+      setConnected(false);
+      presenceSubscriptions.current.clear();
+      setPresence({});
     };
-  }, []);
+  }, [isAuthenticated]);
+
+  // Follow the online status of some friends (updates arrive as 'presence' events)
+  const subscribePresence = useCallback((userIds) => {
+    const added = userIds.filter(id => id && !presenceSubscriptions.current.has(id));
+    added.forEach(id => presenceSubscriptions.current.add(id));
+    if (socket && connected && added.length > 0) {
+      subscribeOnSocket(socket, added);
+    }
+  }, [socket, connected]);
 
   // Helper function to emit typing indicator
   const emitTyping = useCallback((threadId, isTyping = true) => {
@@ -191,7 +230,8 @@ export const WebSocketProvider = ({ children }) => {
   const value = {
     socket,
     connected,
-    onlineUsers,
+    presence,
+    subscribePresence,
     emitTyping,
     emitMessageRead,
     joinThread,
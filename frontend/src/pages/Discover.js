@@ -59,22 +59,13 @@ const Discover = () => {
   const fetchPeople = async () => {
     try {
       setLoading(true);
-      // Get all users and filter out current user and friends
-      const usersRes = await axios.get(`${API}/users`);
-      const requestsRes = await axios.get(`${API}/users/${currentUser.id}/friend-requests`);
-      
-      const currentFriends = currentUser.friends || [];
-      const pendingSent = requestsRes.data.sent?.map(r => r.id) || [];
-      const pendingReceived = requestsRes.data.received?.map(r => r.id) || [];
-      
-      const suggested = usersRes.data.filter(u => 
-        u.id !== currentUser.id && 
-        !currentFriends.includes(u.id) &&
-        !pendingSent.includes(u.id) &&
-        !pendingReceived.includes(u.id)
-      );
+      // Suggestions already exclude friends, pending requests, blocked and muted users
+      const [suggestionsRes, requestsRes] = await Promise.all([
+        axios.get(`${API}/users/${currentUser.id}/suggestions?limit=50`),
+        axios.get(`${API}/users/${currentUser.id}/friend-requests`)
+      ]);
       
-      setPeople(suggested);
+      setPeople(suggestionsRes.data);
       setFriendRequests(requestsRes.data.received || []);
     } catch (error) {
       console.error('Failed to fetch people:', error);
@@ -27,7 +27,7 @@ const Home = () => {
 
   const fetchPosts = async () => {
     try {
-      const res = await axios.get(`${API}/posts`);
+      const res = await axios.get(`${API}/posts`, { params: { userId: currentUser?.id } });
       setPosts(res.data);
     } catch (error) {
       toast.error("Failed to load posts");
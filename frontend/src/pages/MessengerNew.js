@@ -14,7 +14,7 @@ const API = process.env.REACT_APP_BACKEND_URL + '/api';
 const MessengerNew = () => {
   const navigate = useNavigate();
   const location = useLocation();
-  const { socket } = useWebSocket();
+  const { socket, presence, subscribePresence } = useWebSocket();
   
   const [currentUser, setCurrentUser] = useState(null);
   const [threads, setThreads] = useState([]);
@@ -50,6 +50,20 @@ const MessengerNew = () => {
     }
   }, [navigate, location]);
 
+  // Follow the online status of everyone in the conversation list
+  useEffect(() => {
+    if (subscribePresence) {
+      subscribePresence(threads.map(t => t.otherUser?.id).filter(Boolean));
+    }
+  }, [threads, subscribePresence]);
+
+  // Live presence when known, otherwise the status the API returned
+  const isOnline = (user) => {
+    if (!user) return false;
+    const live = presence?.[user.id];
+    return live ? live.online : Boolean(user.online);
+  };
+
   // WebSocket listeners
   useEffect(() => {
     if (!socket || !currentUser) return;
@@ -452,7 +466,7 @@ const MessengerNew = () => {
                       {friend.hasThread ? 'Tap to open chat' : 'Tap to start chatting'}
                     </p>
                   </div>
-                  {friend.online && (
+                  {isOnline(friend) && (
                     <div className="w-3 h-3 bg-green-500 rounded-full"></div>
                   )}
                 </div>
@@ -508,7 +522,7 @@ const MessengerNew = () => {
                     alt={thread.otherUser?.name}
                     className="w-14 h-14 rounded-full object-cover"
                   />
-                  {thread.otherUser?.online && (
+                  {isOnline(thread.otherUser) && (
                     <div className="absolute bottom-0 right-0 w-4 h-4 bg-green-500 rounded-full border-2 border-black"></div>
                   )}
                 </div>
@@ -569,7 +583,7 @@ const MessengerNew = () => {
                   <p className="text-xs text-cyan-400">typing...</p>
                 ) : (
                   <p className="text-xs text-gray-500">
-                    {selectedThread.otherUser?.online ? 'Active now' : 'Offline'}
+                    {isOnline(selectedThread.otherUser) ? 'Active now' : 'Offline'}
                   </p>
                 )}
               </div>
@@ -570,7 +570,10 @@ const SettingsModal = ({ currentUser, onClose, onSave }) => {
     try {
       console.log('Uploading avatar to:', `${API}/upload`);
       const res = await axios.post(`${API}/upload`, formData, {
-        headers: { "Content-Type": "multipart/form-data" },
+        headers: {
+          "Content-Type": "multipart/form-data",
+          Authorization: `Bearer ${localStorage.getItem("loopync_token")}`
+        },
         timeout: 30000
       });
       
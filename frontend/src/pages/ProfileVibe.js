@@ -7,6 +7,7 @@ import {
 } from "lucide-react";
 import { toast } from "sonner";
 import { useNavigate } from "react-router-dom";
+import { getMediaUrl } from "../utils/mediaUtils";
 
 const ProfileVibe = () => {
   const { currentUser, setCurrentUser } = useContext(AuthContext);
@@ -68,7 +69,12 @@ const ProfileVibe = () => {
     try {
       const formData = new FormData();
       formData.append("file", file);
-      const uploadRes = await axios.post(`${API}/upload`, formData, { headers: { "Content-Type": "multipart/form-data" } });
+      const uploadRes = await axios.post(`${API}/upload`, formData, {
+        headers: {
+          "Content-Type": "multipart/form-data",
+          Authorization: `Bearer ${localStorage.getItem("loopync_token")}`
+        }
+      });
       const avatarUrl = `${API}${uploadRes.data.url}`;
       await axios.patch(`${API}/users/${currentUser.id}/profile`, { avatar: avatarUrl });
       setCurrentUser({ ...currentUser, avatar: avatarUrl });
@@ -243,11 +249,11 @@ const ProfileVibe = () => {
                   </div>
                   
                   {/* QR Code - Prominent Display */}
-                  {ticket.qrCodeImage && (
+                  {ticket.qrCodeUrl && (
                     <div className="flex justify-center mb-4">
                       <div className="bg-white rounded-2xl p-4 shadow-lg">
                         <img 
-                          src={ticket.qrCodeImage} 
+                          src={getMediaUrl(ticket.qrCodeUrl)} 
                           alt="Ticket QR Code" 
                           className="w-48 h-48 object-contain"
                         />
@@ -24,7 +24,7 @@ const TribeDetail = () => {
     try {
       const [tribeRes, postsRes] = await Promise.all([
         axios.get(`${API}/tribes/${tribeId}`),
-        axios.get(`${API}/tribes/${tribeId}/posts`)
+        axios.get(`${API}/tribes/${tribeId}/posts`, { params: { userId: currentUser?.id } })
       ]);
       setTribe(tribeRes.data);
       setPosts(postsRes.data);
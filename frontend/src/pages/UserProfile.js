@@ -14,6 +14,7 @@ const UserProfile = () => {
   const [posts, setPosts] = useState([]);
   const [followersCount, setFollowersCount] = useState(0);
   const [followingCount, setFollowingCount] = useState(0);
+  const [postsCount, setPostsCount] = useState(0);
   const [loading, setLoading] = useState(true);
   const [relationshipStatus, setRelationshipStatus] = useState(null); // null, 'friends', 'pending_sent', 'pending_received', 'blocked'
   const [requestId, setRequestId] = useState(null);
@@ -36,6 +37,7 @@ const UserProfile = () => {
       })));
       setFollowersCount(res.data.followersCount || 0);
       setFollowingCount(res.data.followingCount || 0);
+      setPostsCount(res.data.postsCount || 0);
       setRelationshipStatus(res.data.relationshipStatus);
     } catch (error) {
       toast.error("Failed to load profile");
@@ -228,7 +230,7 @@ const UserProfile = () => {
             {/* Stats */}
             <div className="flex gap-6 mt-4 pt-4 border-t border-gray-700">
               <div>
-                <div className="text-xl font-bold text-white">{posts.length}</div>
+                <div className="text-xl font-bold text-white">{postsCount}</div>
                 <div className="text-xs text-gray-400">Posts</div>
               </div>
               <div>
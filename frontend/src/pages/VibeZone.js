@@ -19,7 +19,7 @@ const VibeZone = () => {
 
   const fetchReels = async () => {
     try {
-      const res = await axios.get(`${API}/reels`);
+      const res = await axios.get(`${API}/reels`, { params: { userId: currentUser?.id } });
       setReels(res.data);
     } catch (error) {
       toast.error("Failed to load reels");
@@ -10,9 +10,10 @@ if (!BACKEND_URL) {
 /**
  * Converts a media URL to a full accessible URL
  * @param {string} mediaUrl - The media URL (can be relative or absolute)
+ * @param {string} [size] - Image rendition for uploaded media: 'thumb' (160px), 'medium' (480px) or 'large' (1080px)
  * @returns {string} - Full accessible URL
  */
-export const getMediaUrl = (mediaUrl) => {
+export const getMediaUrl = (mediaUrl, size) => {
   if (!mediaUrl) return '';
   
   // If it already has http/https, return as-is (external URL or Cloudinary)
@@ -20,6 +21,11 @@ export const getMediaUrl = (mediaUrl) => {
     return mediaUrl;
   }
   
+  // Uploaded media: the server resizes images (videos ignore the size)
+  if (mediaUrl.startsWith('/api/media/')) {
+    return size ? `${BACKEND_URL}${mediaUrl}?size=${size}` : `${BACKEND_URL}${mediaUrl}`;
+  }
+  
   // For relative URLs (starting with /api/), prepend backend URL
   if (mediaUrl.startsWith('/api/')) {
     return `${BACKEND_URL}${mediaUrl}`;
@@ -34,6 +40,16 @@ export const getMediaUrl = (mediaUrl) => {
   return `${BACKEND_URL}${mediaUrl}`;
 };
 
+/**
+ * srcSet for uploaded images so the browser picks the smallest sufficient rendition
+ * @param {string} mediaUrl - The media URL
+ * @returns {string|undefined} - srcSet value, or undefined for non-uploaded media
+ */
+export const getMediaSrcSet = (mediaUrl) => {
+  if (!mediaUrl || !mediaUrl.startsWith('/api/media/')) return undefined;
+  return `${getMediaUrl(mediaUrl, 'medium')} 480w, ${getMediaUrl(mediaUrl, 'large')} 1080w`;
+};
+
 /**
  * Check if a URL is a video based on file extension
  * @param {string} url - The URL to check
@@ -67,6 +83,7 @@ export const getMediaType = (url) => {
 
 export default {
   getMediaUrl,
+  getMediaSrcSet,
   isVideoUrl,
   isImageUrl,
   getMediaType
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Login Throughput Benchmark
+Fires a burst of concurrent logins and, at the same time, probes a cheap
+in-memory endpoint (/api/metrics). With bcrypt off the event loop the probe
+latency during the burst should stay close to its idle baseline, while logins
+are bounded by the hashing pool (and shed with 503 once its queue is full).
+
+Usage: python login_throughput_benchmark.py [concurrency] [total_logins]
+"""
+
+import os
+import sys
+import time
+import threading
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import requests
+
+# Configuration
+BACKEND_URL = os.environ.get('REACT_APP_BACKEND_URL', 'https://profile-avatar-2.preview.emergentagent.com') + "/api"
+CONCURRENCY = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+TOTAL_LOGINS = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+PASSWORD = "benchmark-password-123"
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def create_user():
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    email = f"loginbench_{timestamp}@example.com"
+    response = requests.post(f"{BACKEND_URL}/auth/signup", json={
+        "name": "Login Benchmark", "email": email, "password": PASSWORD
+    })
+    response.raise_for_status()
+    return email
+
+
+def probe_latencies(stop: threading.Event, samples: list):
+    """Latency of an endpoint that does no I/O: a direct measure of event loop stalls"""
+    session = requests.Session()
+    while not stop.is_set():
+        started = time.perf_counter()
+        session.get(f"{BACKEND_URL}/metrics")
+        samples.append((time.perf_counter() - started) * 1000)
+        time.sleep(0.02)
+
+
+def run_logins(email: str):
+    session = requests.Session()
+    latencies, statuses = [], {}
+
+    def login(_):
+        started = time.perf_counter()
+        response = session.post(f"{BACKEND_URL}/auth/login", json={"email": email, "password": PASSWORD})
+        return (time.perf_counter() - started) * 1000, response.status_code
+
+    with ThreadPoolExecutor(max_workers=CONCURRENCY) as pool:
+        for latency, status in pool.map(login, range(TOTAL_LOGINS)):
+            latencies.append(latency)
+            statuses[status] = statuses.get(status, 0) + 1
+    return latencies, statuses
+
+
+def main():
+    print("🔐 LOGIN THROUGHPUT BENCHMARK")
+    print("=" * 50)
+    print(f"Target: {BACKEND_URL}  concurrency={CONCURRENCY}  logins={TOTAL_LOGINS}")
+
+    email = create_user()
+    print(f"✅ Benchmark user created: {email}")
+
+    # Idle baseline
+    stop, idle = threading.Event(), []
+    prober = threading.Thread(target=probe_latencies, args=(stop, idle))
+    prober.start()
+    time.sleep(2)
+    stop.set()
+    prober.join()
+
+    # Probe again while the login burst runs
+    stop, busy = threading.Event(), []
+    prober = threading.Thread(target=probe_latencies, args=(stop, busy))
+    prober.start()
+    started = time.perf_counter()
+    latencies, statuses = run_logins(email)
+    elapsed = time.perf_counter() - started
+    stop.set()
+    prober.join()
+
+    ok = statuses.get(200, 0)
+    print(f"\nLogins: {ok} ok / {statuses.get(503, 0)} shed (503) / statuses {statuses}")
+    print(f"Throughput: {ok / elapsed:.1f} logins/s over {elapsed:.1f}s")
+    print(f"Login latency ms: p50={statistics.median(latencies):.0f} p95={percentile(latencies, 95):.0f}")
+    print(f"Probe latency ms idle:  p50={statistics.median(idle):.1f} p99={percentile(idle, 99):.1f}")
+    print(f"Probe latency ms burst: p50={statistics.median(busy):.1f} p99={percentile(busy, 99):.1f}")
+
+    metrics = requests.get(f"{BACKEND_URL}/metrics").json().get("authHashing", {})
+    print(f"Hashing pool: {metrics}")
+
+    # The loop is responsive if the probe's tail barely moves during the burst
+    if percentile(busy, 99) < max(50.0, 3 * percentile(idle, 99)):
+        print("✅ Event loop stayed responsive during the login burst")
+    else:
+        print("❌ Event loop stalled during the login burst")
+
+
+if __name__ == "__main__":
+    main()